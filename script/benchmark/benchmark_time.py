@@ -0,0 +1,56 @@
+'''
+Micro-benchmark of the mnms.time module
+
+Times the operations of Time and Dt found in the simulation hot loops, and optionally the full Lyon63V example.
+Run it on two revisions of MnMS to compare them.
+'''
+import os
+import argparse
+import runpy
+import timeit
+from time import time
+
+from mnms.time import Time, Dt
+
+
+def bench_operations(number):
+    t = Time('07:34:23.67')
+    t2 = Time('07:34:24')
+    dt = Dt(seconds=1)
+    operations = {
+        'add_time': lambda: t.add_time(dt),
+        'remove_time': lambda: t.remove_time(dt),
+        'compare': lambda: t < t2,
+        'to_seconds': lambda: t.to_seconds(),
+        'from_seconds': lambda: Time.from_seconds(27263.67),
+        'sub': lambda: t2 - t,
+        'dt_mul': lambda: dt * 10,
+        'str': lambda: t.time,
+    }
+    for name, op in operations.items():
+        elapsed = timeit.timeit(op, number=number)
+        print(f"{name:>15} : {elapsed / number * 1e9:10.1f} ns/op")
+
+
+def bench_lyon63v():
+    example_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'examples', 'Lyon63V')
+    cwd = os.getcwd()
+    os.chdir(example_dir)
+    os.makedirs('OUTPUTS', exist_ok=True)
+    try:
+        st = time()
+        runpy.run_path('run_Lyon63V.py', run_name='__main__')
+        print(f"Lyon63V run done in {time() - st:.1f} s")
+    finally:
+        os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the Time and Dt classes of MnMS")
+    parser.add_argument('--number', type=int, default=200000, help="Number of repetitions of each operation")
+    parser.add_argument('--lyon63v', action='store_true', help="Also time a full run of the Lyon63V example")
+    args = parser.parse_args()
+
+    bench_operations(args.number)
+    if args.lyon63v:
+        bench_lyon63v()
@@ -0,0 +1,75 @@
+'''
+Micro-benchmark of the mnms.flow.user_flow module
+
+Registers a large demand in a UserFlow, most users being inside a vehicle or waiting, and times the
+phases of a user flow step that look for the users in a given state or move the walking users.
+Run it on two revisions of MnMS to compare them.
+'''
+import argparse
+import timeit
+
+from mnms.demand.user import User, Path
+from mnms.flow.user_flow import UserFlow
+from mnms.generation.layers import generate_matching_origin_destination_layer
+from mnms.generation.roads import generate_line_road
+from mnms.graph.layers import MultiLayerGraph, CarLayer
+from mnms.mobility_service.personal_vehicle import PersonalMobilityService
+from mnms.time import Time, Dt
+
+
+def build_user_flow(nb_users, stop_share, walking_share):
+    roads = generate_line_road([0, 0], [0, 1000], 2)
+    car_layer = CarLayer(roads, services=[PersonalMobilityService()])
+    car_layer.create_node("C0", "0")
+    car_layer.create_node("C1", "1")
+    car_layer.create_link("C0_C1", "C0", "C1", {}, ["0_1"])
+    mlgraph = MultiLayerGraph([car_layer], generate_matching_origin_destination_layer(roads), 1e-3)
+    # Walkers never reach the end of this transit link
+    mlgraph.connect_layers('WALK_C0_C1', 'C0', 'C1', 1e9, {})
+
+    user_flow = UserFlow(1.42)
+    user_flow.set_graph(mlgraph)
+    user_flow.set_time(Time('07:00:00'))
+    user_flow._gnodes = mlgraph.graph.nodes
+
+    nb_stop = int(nb_users * stop_share)
+    nb_walking = int(nb_users * walking_share)
+    for i in range(nb_users):
+        u = User(str(i), '0', '1', Time('07:00:00'))
+        user_flow.users[u.id] = u
+        if hasattr(user_flow, 'user_states'):
+            user_flow.user_states.add(u)
+        # Stopped users without path wait for a replanning and are not processed further
+        if nb_stop <= i < nb_stop + nb_walking:
+            u.set_path(Path(1e9, ['C0', 'C1']))
+            u.current_node = 'C0'
+            u.current_link = ('C0', 'C1')
+            u.set_state_walking()
+            user_flow._walking[u.id] = 1e9
+        elif i >= nb_stop:
+            u.set_state_inside_vehicle()
+    return user_flow
+
+
+def bench_user_flow(nb_users, stop_share, walking_share, number):
+    user_flow = build_user_flow(nb_users, stop_share, walking_share)
+    phases = {
+        'determine_user_states': lambda: user_flow.determine_user_states(),
+        'check_user_waiting_answers': lambda: user_flow.check_user_waiting_answers(Dt(seconds=1)),
+        'user_walking': lambda: user_flow._user_walking(Dt(seconds=1)),
+    }
+    print(f"{nb_users} users, {int(nb_users * stop_share)} stopped, {int(nb_users * walking_share)} walking")
+    for name, phase in phases.items():
+        elapsed = timeit.timeit(phase, number=number)
+        print(f"{name:>28} : {elapsed / number * 1e3:10.3f} ms/step")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the user state lookups of the UserFlow of MnMS")
+    parser.add_argument('--users', type=int, default=200000, help="Number of users in the user flow")
+    parser.add_argument('--stop-share', type=float, default=0.01, help="Share of the users in STOP state")
+    parser.add_argument('--walking-share', type=float, default=0.05, help="Share of the users walking")
+    parser.add_argument('--number', type=int, default=20, help="Number of repetitions of each phase")
+    args = parser.parse_args()
+
+    bench_user_flow(args.users, args.stop_share, args.walking_share, args.number)
@@ -1,7 +1,213 @@
 import os
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
+import numpy as np
 import pandas as pd
 
+from mnms.time import Time, TICKS_PER_SECOND
+
+_COLUMNS = ['TIMESTAMP', 'VEHICLE ID', 'PASSENGERS', 'CAPACITY', 'CONGESTION INDEX', 'NODE']
+
+
+class _ColumnBuffer:
+    """
+    A growable NumPy array, its capacity is doubled when full.
+    """
+
+    def __init__(self, dtype, capacity: int = 1024):
+        self.values = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        n = len(values)
+        if self.size + n > len(self.values):
+            new_values = np.empty(max(2*len(self.values), self.size + n), dtype=self.values.dtype)
+            new_values[:self.size] = self.values[:self.size]
+            self.values = new_values
+        self.values[self.size:self.size+n] = values
+        self.size += n
+
+    def view(self):
+        return self.values[:self.size]
+
+
+class AbstractCongestionPredictor(ABC):
+    """
+    Online predictor of the congestion index at the nodes, each node keeps a state
+    updated in O(1) at each new observation, so that predictions are O(1) lookups.
+    """
+
+    @abstractmethod
+    def update(self, node: str, value: float, ticks: int):
+        """Method that registers a new observation of the congestion index at a node.
+
+        Args:
+            -node: the node
+            -value: the observed congestion index
+            -ticks: the time of the observation, as Time ticks
+        """
+        pass
+
+    @abstractmethod
+    def predict(self, node: str, ticks: Optional[int] = None) -> float:
+        """Method that returns the predicted congestion index at a node, or None if
+        nothing was observed at this node.
+
+        Args:
+            -node: the node
+            -ticks: the time of the prediction, as Time ticks, None for the last observation time
+        """
+        pass
+
+    def update_many(self, nodes: Sequence[str], values: Sequence[float], ticks: Sequence[int]):
+        for node, value, t in zip(nodes, values, ticks):
+            self.update(node, value, t)
+
+    def clear(self):
+        self.__init__(**self.parameters)
+
+    @property
+    def parameters(self) -> dict:
+        return {}
+
+
+class LastValuePredictor(AbstractCongestionPredictor):
+    def __init__(self):
+        """Predicts the last observed congestion index.
+        """
+        self._last: Dict[str, float] = dict()
+
+    def update(self, node, value, ticks):
+        self._last[node] = value
+
+    def predict(self, node, ticks=None):
+        return self._last.get(node)
+
+
+class MovingAveragePredictor(AbstractCongestionPredictor):
+    def __init__(self, window: int = 1):
+        """Predicts the mean of the last window observed congestion indexes, stored
+        in a ring buffer per node. The prediction is NaN while less than window values
+        have been observed, as a rolling mean would be.
+
+        Args:
+            -window: the number of observations to average
+        """
+        self.window = window
+        # node -> [ring buffer, next position in buffer, number of values, sum of the values in buffer]
+        self._states: Dict[str, list] = dict()
+
+    @property
+    def parameters(self):
+        return {'window': self.window}
+
+    def update(self, node, value, ticks):
+        state = self._states.get(node)
+        if state is None:
+            state = [np.zeros(self.window), 0, 0, 0.]
+            self._states[node] = state
+        buffer, pos = state[0], state[1]
+        state[3] += value - buffer[pos]
+        buffer[pos] = value
+        state[1] = (pos + 1) % self.window
+        state[2] += 1
+
+    def predict(self, node, ticks=None):
+        state = self._states.get(node)
+        if state is None:
+            return None
+        if state[2] < self.window:
+            return np.nan
+        return state[3] / self.window
+
+
+class ExponentialMovingAveragePredictor(AbstractCongestionPredictor):
+    def __init__(self, alpha: float = 0.1):
+        """Predicts the exponential moving average of the observed congestion indexes.
+
+        Args:
+            -alpha: the smoothing factor, weight of the last observation
+        """
+        self.alpha = alpha
+        self._ema: Dict[str, float] = dict()
+
+    @property
+    def parameters(self):
+        return {'alpha': self.alpha}
+
+    def update(self, node, value, ticks):
+        ema = self._ema.get(node)
+        self._ema[node] = value if ema is None else ema + self.alpha * (value - ema)
+
+    def predict(self, node, ticks=None):
+        return self._ema.get(node)
+
+
+class TimeBinnedMeanPredictor(AbstractCongestionPredictor):
+    def __init__(self, bin_size: float = 600):
+        """Predicts the mean of the congestion indexes observed in the same time bin
+        of the day, the bin of the last observation if no time is given.
+
+        Args:
+            -bin_size: the size of the time bins in seconds
+        """
+        self.bin_size = bin_size
+        self._bin_ticks = max(1, int(round(bin_size * TICKS_PER_SECOND)))
+        # node -> {bin -> [sum, count]}
+        self._bins: Dict[str, Dict[int, list]] = dict()
+        self._last_bin: Dict[str, int] = dict()
+
+    @property
+    def parameters(self):
+        return {'bin_size': self.bin_size}
+
+    def update(self, node, value, ticks):
+        b = ticks // self._bin_ticks
+        node_bins = self._bins.get(node)
+        if node_bins is None:
+            node_bins = dict()
+            self._bins[node] = node_bins
+        acc = node_bins.get(b)
+        if acc is None:
+            node_bins[b] = [value, 1]
+        else:
+            acc[0] += value
+            acc[1] += 1
+        self._last_bin[node] = b
+
+    def predict(self, node, ticks=None):
+        node_bins = self._bins.get(node)
+        if node_bins is None:
+            return None
+        b = self._last_bin[node] if ticks is None else ticks // self._bin_ticks
+        acc = node_bins.get(b)
+        if acc is None:
+            return None
+        return acc[0] / acc[1]
+
+
+_PREDICTORS = {'temporal_moving_avg': MovingAveragePredictor,
+               'exponential_moving_avg': ExponentialMovingAveragePredictor,
+               'time_binned_mean': TimeBinnedMeanPredictor,
+               'last_value': LastValuePredictor}
+
+
+def create_predictor(prediction_technique: Optional[Tuple[str, dict]]) -> AbstractCongestionPredictor:
+    """Function that creates the congestion predictor corresponding to a prediction
+    technique, the last observed value is predicted if the technique is None or unknown.
+
+    Args:
+        -prediction_technique: tuple (name of the technique, dict of its parameters)
+
+    Returns:
+        -predictor: the congestion predictor
+    """
+    if prediction_technique is None or prediction_technique[0] not in _PREDICTORS:
+        return LastValuePredictor()
+    name, params = prediction_technique
+    return _PREDICTORS[name](**params)
+
 
 class CongestionModel:
     """
@@ -18,7 +224,27 @@ class CongestionModel:
             raise Exception("CongestionModel is a singleton. Use get_instance() instead.")
         else:
             self.prediction_technique = prediction_technique
-            self.data = pd.DataFrame(columns=['TIMESTAMP', 'VEHICLE ID', 'PASSENGERS', 'CAPACITY', 'CONGESTION INDEX', 'NODE'])
+            self.predictor = create_predictor(prediction_technique)
+            self._outfile = None
+            self._chunk_size = 0
+            self._nb_written = 0
+            self._init_buffers()
+
+    def _init_buffers(self):
+        # Timestamps are stored as Time ticks, vehicle ids and nodes as indexes in _vehicle_ids and _nodes
+        self._timestamps = _ColumnBuffer(np.int64)
+        self._vehicles = _ColumnBuffer(np.int64)
+        self._passengers = _ColumnBuffer(np.int64)
+        self._capacities = _ColumnBuffer(np.int64)
+        self._congestion_indexes = _ColumnBuffer(np.float64)
+        self._node_indexes = _ColumnBuffer(np.int64)
+        self._vehicle_ids: List[str] = []
+        self._vehicle_index: Dict[str, int] = dict()
+        self._nodes: List[str] = []
+        self._node_index: Dict[str, int] = dict()
+        # Rows of the history of each node, in chronological order
+        self._node_rows: Dict[str, List[int]] = dict()
+        self._data: Optional[pd.DataFrame] = None
 
     @staticmethod
     def get_instance(prediction_technique=('temporal_moving_avg', {'window':60})):
@@ -30,35 +256,189 @@ class CongestionModel:
             CongestionModel.__instance = CongestionModel(prediction_technique)
         return CongestionModel.__instance
 
+    def __len__(self):
+        return self._timestamps.size
+
+    def _intern(self, values: Iterable[str], ids: List[str], index: Dict[str, int]) -> List[int]:
+        interned = []
+        for v in values:
+            ind = index.get(v)
+            if ind is None:
+                ind = len(ids)
+                index[v] = ind
+                ids.append(v)
+            interned.append(ind)
+        return interned
+
+    def _append_rows(self, ticks: List[int], vehicle_ids: List[str], passengers: List[int],
+                     capacities: List[int], congestion_indexes: List[float], nodes: List[str]):
+        first_row = len(self)
+        self._timestamps.extend(ticks)
+        self._vehicles.extend(self._intern(vehicle_ids, self._vehicle_ids, self._vehicle_index))
+        self._passengers.extend(passengers)
+        self._capacities.extend(capacities)
+        self._congestion_indexes.extend(congestion_indexes)
+        self._node_indexes.extend(self._intern(nodes, self._nodes, self._node_index))
+        node_rows = self._node_rows
+        for row, node in enumerate(nodes, first_row):
+            try:
+                node_rows[node].append(row)
+            except KeyError:
+                node_rows[node] = [row]
+        self.predictor.update_many(nodes, congestion_indexes, ticks)
+        self._data = None
+
+        if self._outfile is not None and len(self) - self._nb_written >= self._chunk_size:
+            self.flush()
+
     def update_congestion_model(self, new_data):
-        next_row = pd.DataFrame.from_dict(new_data)  # Create a DataFrame from the dictionary
-        self.data = pd.concat([self.data, next_row], ignore_index=True)  # Concatenate with existing DataFrame
+        """Method that adds rows to the congestion history.
+
+        Args:
+            -new_data: dict column name -> list of values
+        """
+        self._append_rows([Time(t).ticks for t in new_data['TIMESTAMP']],
+                          new_data['VEHICLE ID'],
+                          new_data['PASSENGERS'],
+                          new_data['CAPACITY'],
+                          new_data['CONGESTION INDEX'],
+                          new_data['NODE'])
+
+    def ingest_step(self, tcurrent: Time, vehicles: Iterable["Vehicle"]):
+        """Method that adds to the congestion history the load of all the given vehicles
+        at time tcurrent.
 
-    def temporal_moving_average(self, data, window):
-        return data.rolling(window=window).mean()
+        Args:
+            -tcurrent: the current time
+            -vehicles: the vehicles to register
+        """
+        vehicle_ids, passengers, capacities, nodes = [], [], [], []
+        for veh in vehicles:
+            vehicle_ids.append(veh.id)
+            passengers.append(len(veh.passengers))
+            capacities.append(veh.capacity)
+            nodes.append(veh.current_node)
+        if len(vehicle_ids) == 0:
+            return
+        congestion_indexes = np.asarray(passengers, dtype=np.float64) / np.asarray(capacities, dtype=np.float64)
+        self._append_rows([tcurrent.ticks]*len(vehicle_ids), vehicle_ids, passengers, capacities,
+                          congestion_indexes, nodes)
+
+    def node_congestion_indexes(self, node) -> np.ndarray:
+        """Method that returns the history of the congestion index at a node, in
+        chronological order.
+
+        Args:
+            -node: the node
 
-    def predict_congestion(self, node):
-        CI = self.data[self.data['NODE'] == node]
+        Returns:
+            -congestion_indexes: array of congestion indexes
+        """
+        rows = self._node_rows.get(node)
+        if rows is None:
+            return np.empty(0)
+        return self._congestion_indexes.view()[rows]
+
+    @property
+    def data(self) -> pd.DataFrame:
+        """Congestion history as a DataFrame, built on demand.
+        """
+        if self._data is None:
+            self._data = self._to_dataframe(0, len(self))
+        return self._data
 
-        # If no data is available for the node, return 0
-        if CI.empty:
-            return 0
+    def _to_dataframe(self, start: int, end: int) -> pd.DataFrame:
+        return pd.DataFrame({'TIMESTAMP': [Time.from_ticks(t).time for t in self._timestamps.view()[start:end].tolist()],
+                             'VEHICLE ID': [self._vehicle_ids[v] for v in self._vehicles.view()[start:end].tolist()],
+                             'PASSENGERS': self._passengers.view()[start:end],
+                             'CAPACITY': self._capacities.view()[start:end],
+                             'CONGESTION INDEX': self._congestion_indexes.view()[start:end],
+                             'NODE': [self._nodes[n] for n in self._node_indexes.view()[start:end].tolist()]},
+                            columns=_COLUMNS)
 
-        # Apply temporal moving average if technique is specified
-        if self.prediction_technique[0] == 'temporal_moving_avg':
-            window = self.prediction_technique[1].get('window', 1)  # Default to window=1 if not provided
-            # Compute rolling mean
-            CI['CONGESTION INDEX MA'] = CI['CONGESTION INDEX'].rolling(window=window).mean()
-            return CI['CONGESTION INDEX MA'].iloc[-1]
+    def set_prediction_technique(self, prediction_technique: Optional[Tuple[str, dict]]):
+        """Method that changes the prediction technique, the predictor state is rebuilt
+        from the history.
 
-        # Default return if no technique applies
-        return CI['CONGESTION INDEX'].iloc[-1]
+        Args:
+            -prediction_technique: tuple (name of the technique, dict of its parameters)
+        """
+        self.prediction_technique = prediction_technique
+        self.predictor = create_predictor(prediction_technique)
+        self.predictor.update_many([self._nodes[n] for n in self._node_indexes.view().tolist()],
+                                   self._congestion_indexes.view().tolist(),
+                                   self._timestamps.view().tolist())
+
+    def predict_congestion(self, node, tcurrent: Optional[Time] = None):
+        """Method that returns the predicted congestion index at a node.
+
+        Args:
+            -node: the node
+            -tcurrent: the time of the prediction, used by time dependent predictors
+
+        Returns:
+            -CI: the predicted congestion index, 0 if nothing was observed at this node
+        """
+        CI = self.predictor.predict(node, None if tcurrent is None else tcurrent.ticks)
+        return 0 if CI is None else CI
+
+    def predict_many(self, nodes: Sequence[str], tcurrent: Optional[Time] = None) -> np.ndarray:
+        """Method that returns the predicted congestion indexes at several nodes.
+
+        Args:
+            -nodes: the nodes
+            -tcurrent: the time of the prediction, used by time dependent predictors
+
+        Returns:
+            -CIs: array of the predicted congestion indexes, 0 where nothing was observed
+        """
+        predict = self.predictor.predict
+        ticks = None if tcurrent is None else tcurrent.ticks
+        return np.array([0 if CI is None else CI for CI in (predict(node, ticks) for node in nodes)], dtype=np.float64)
 
     def clear_data(self):
         """
         Clears all congestion data.
         """
-        self.data.clear()
+        self._init_buffers()
+        self.predictor.clear()
+        self._nb_written = 0
+
+    def open_output(self, filename: str, chunk_size: int = 100000):
+        """Method that opens a file where the congestion history is written, by chunks
+        of chunk_size rows as the history grows.
+
+        Args:
+            -filename: the output file
+            -chunk_size: the number of new rows that triggers a write
+        """
+        self._outfile = open(filename, 'w')
+        self._outfile.write(','.join(_COLUMNS)+'\n')
+        self._chunk_size = chunk_size
+        self._nb_written = len(self)
+
+    def flush(self):
+        """Method that writes the rows not yet written in the output file.
+        """
+        if self._outfile is None:
+            return
+        start, end = self._nb_written, len(self)
+        timestamps = self._timestamps.view()[start:end].tolist()
+        vehicles = self._vehicles.view()[start:end].tolist()
+        passengers = self._passengers.view()[start:end].tolist()
+        capacities = self._capacities.view()[start:end].tolist()
+        congestion_indexes = self._congestion_indexes.view()[start:end].tolist()
+        nodes = self._node_indexes.view()[start:end].tolist()
+        self._outfile.writelines(f'{Time.from_ticks(t)},{self._vehicle_ids[v]},{p},{c},{ci},{self._nodes[n]}\n'
+                                 for t, v, p, c, ci, n in zip(timestamps, vehicles, passengers, capacities,
+                                                              congestion_indexes, nodes))
+        self._nb_written = end
+
+    def close_output(self):
+        if self._outfile is not None:
+            self.flush()
+            self._outfile.close()
+            self._outfile = None
 
     def write_congestion(self, path):
         self.data.to_csv(f'{path}{os.sep}congestion_history.csv')
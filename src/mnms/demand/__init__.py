@@ -1,5 +1,6 @@
 from .manager import BaseDemandManager, CSVDemandManager
 from .user import User
+from .departures import DepartureQueue
 
 from mnms.log import create_logger
 
@@ -0,0 +1,73 @@
+from itertools import chain
+from typing import Iterator, List
+
+import numpy as np
+
+from mnms.demand.user import User
+from mnms.time import Time
+
+
+class DepartureQueue(object):
+    def __init__(self, users: List[User]):
+        """
+        Users who depart during an affectation step, sorted by departure time. The
+        departures are consumed flow step by flow step, each flow step's users are
+        found by a binary search on the departure times and a cursor is moved forward,
+        the remaining users are never copied.
+
+        Args:
+            users: the users, users with the same departure time keep their order
+        """
+        self._users = sorted(users, key=lambda u: u.departure_time.ticks)
+        self._departures = np.fromiter((u.departure_time.ticks for u in self._users), dtype=np.int64,
+                                       count=len(self._users))
+        self._positions = {u.id: i for i, u in enumerate(self._users)}
+        self._cursor = 0
+
+    def __len__(self):
+        return len(self._users) - self._cursor
+
+    def __contains__(self, user: User):
+        position = self._positions.get(user.id, -1)
+        return position >= self._cursor and self._users[position] is user
+
+    def position(self, user: User) -> int:
+        """Method that returns the position of a remaining user in the queue.
+
+        Args:
+            -user: the user
+
+        Returns:
+            -position: the position of the user, -1 if the user is not in the queue
+        """
+        position = self._positions.get(user.id, -1)
+        return position - self._cursor if position >= self._cursor else -1
+
+    def __iter__(self) -> Iterator[User]:
+        users = self._users
+        return (users[i] for i in range(self._cursor, len(users)))
+
+    def __add__(self, other):
+        return list(chain(self, other))
+
+    def __radd__(self, other):
+        return list(chain(other, self))
+
+    def __repr__(self):
+        return f"DepartureQueue({len(self)} remaining users)"
+
+    def pop_until(self, tend: Time) -> List[User]:
+        """Method that removes from the queue and returns the users departing before tend.
+
+        Args:
+            -tend: the end of the period, excluded
+
+        Returns:
+            -users: the users departing before tend, sorted by departure time
+        """
+        end = int(np.searchsorted(self._departures, tend.ticks, side='left'))
+        if end <= self._cursor:
+            return []
+        users = self._users[self._cursor:end]
+        self._cursor = end
+        return users
@@ -9,6 +9,7 @@ from datetime import datetime
 import numpy as np
 
 from mnms.demand.user import User, Path
+from mnms.graph.specific_layers import OriginDestinationLayer
 from mnms.log import create_logger
 from mnms.time import Time
 from mnms.tools.exceptions import CSVDemandParseError
@@ -118,12 +119,17 @@ class CSVDemandManager(AbstractDemandManager):
         Type of demand, either the origin?destination are node ids or coordinates
     delimiter: str
         Delimiter for the CSV file
+    odlayer: OriginDestinationLayer
+        If specified with a coordinate demand, the origins and destinations of the users are snapped
+        once to the nearest origin and destination nodes of this layer when the users are read
     """
 
-    def __init__(self, csvfile: Union[Pathl, str], delimiter=';', user_parameters: Callable[[User], Dict] = lambda x: {}):
+    def __init__(self, csvfile: Union[Pathl, str], delimiter=';', user_parameters: Callable[[User], Dict] = lambda x: {},
+                 odlayer: OriginDestinationLayer = None):
         super(CSVDemandManager, self).__init__(user_parameters)
         self._filename = csvfile
         self._delimiter = delimiter
+        self._odlayer = odlayer
         self._file = open(self._filename, 'r')
         self._reader = csv.reader(self._file, delimiter=self._delimiter, quotechar='|')
         self._demand_type = None
@@ -205,7 +211,7 @@ class CSVDemandManager(AbstractDemandManager):
 
     def copy(self):
         cls = self.__class__
-        copy = cls(self._filename, self._delimiter)
+        copy = cls(self._filename, self._delimiter, odlayer=self._odlayer)
         return copy
 
     def construct_user(self, row) -> User:
@@ -215,6 +221,9 @@ class CSVDemandManager(AbstractDemandManager):
         elif self._demand_type == 'coordinate':
             origin = np.fromstring(row[2], sep=' ')
             destination = np.fromstring(row[3], sep=' ')
+            if self._odlayer is not None:
+                origin = self._odlayer.nearest_origin(origin)
+                destination = self._odlayer.nearest_destination(destination)
         else:
             raise TypeError(f"demand_type must be either 'node' or 'coordinate'")
         forced_path = None
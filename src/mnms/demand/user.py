@@ -2,7 +2,7 @@ import sys
 from collections import defaultdict
 from copy import copy, deepcopy
 from enum import Enum
-from typing import Union, List, Tuple, Optional, Dict
+from typing import Union, List, Tuple, Optional, Dict, Set
 
 from mnms.time import Time, Dt
 from mnms.tools.observer import TimeDependentSubject
@@ -32,6 +32,71 @@ class UserState(Enum):
     DEADEND = 6
 
 
+class UserPathIndex(object):
+    """
+    Reverse index from the links of the graph to the users whose current path passes
+    through them, kept up to date each time the path of a user is set or modified.
+    The users are indexed by object and not by id, several users objects may share
+    the same id (e.g. the users of a demand horizon).
+    """
+
+    # Class attributes (shared by all instances)
+    _link_users: Dict[Tuple[str, str], Dict[int, "User"]] = defaultdict(dict)
+    _user_links: Dict[int, Set[Tuple[str, str]]] = dict()
+
+    @classmethod
+    def index(cls, user: "User"):
+        """Method that (re)indexes the links of the current path of a user.
+
+        Args:
+            -user: the user
+        """
+        cls.unindex(user)
+        if user.path is None:
+            return
+        nodes = user.path.nodes
+        links = set(zip(nodes[:-1], nodes[1:]))
+        key = id(user)
+        cls._user_links[key] = links
+        link_users = cls._link_users
+        for link in links:
+            link_users[link][key] = user
+
+    @classmethod
+    def unindex(cls, user: "User"):
+        key = id(user)
+        links = cls._user_links.pop(key, None)
+        if links is None:
+            return
+        link_users = cls._link_users
+        for link in links:
+            users = link_users[link]
+            users.pop(key, None)
+            if not users:
+                del link_users[link]
+
+    @classmethod
+    def users_on_links(cls, links) -> List["User"]:
+        """Method that returns the users whose current path passes through at least
+        one of the links.
+
+        Args:
+            -links: the links
+
+        Returns:
+            -users: the users found
+        """
+        users = dict()
+        for link in links:
+            users.update(cls._link_users.get(link, {}))
+        return list(users.values())
+
+    @classmethod
+    def empty(cls):
+        cls._link_users = defaultdict(dict)
+        cls._user_links = dict()
+
+
 class User(TimeDependentSubject):
     default_response_dt = Dt(minutes=20)
     default_pickup_dt = Dt(minutes=5)
@@ -92,10 +157,13 @@ class User(TimeDependentSubject):
         self._distance = 0
         self._interrupted_path = None
         self._state = UserState.STOP
+        # Index of the users per state notified of the state changes, set by the UserFlow
+        self._state_index = None
         self._deadend_at_next_node = False
+        self._path = None
 
         if path is None:
-            self.path: Optional[Path] = None
+            self.path = None
             self.forced_path_chosen_mobility_services = None
         else:
             self.set_path(path)
@@ -202,7 +270,19 @@ class User(TimeDependentSubject):
 
     @state.setter
     def state(self, s: "UserState"):
+        previous_state = self._state
         self._state = s
+        if self._state_index is not None and previous_state is not s:
+            self._state_index.update_state(self, previous_state, s)
+
+    @property
+    def path(self) -> Optional["Path"]:
+        return self._path
+
+    @path.setter
+    def path(self, p: Optional["Path"]):
+        self._path = p
+        UserPathIndex.index(self)
 
     @property
     def deadend_at_next_node(self):
@@ -305,6 +385,7 @@ class User(TimeDependentSubject):
         """
         self.arrival_time = arrival_time
         self.set_state_arrived()
+        UserPathIndex.unindex(self)
         log.info(f"User {self.id} arrived at destination at {arrival_time}")
         self.notify(arrival_time)
 
@@ -396,6 +477,7 @@ class User(TimeDependentSubject):
         if modif == False:
             log.warning(f'Could not find the {ms_id} leg to modify in user path {self.path}...')
         else:
+            UserPathIndex.index(self)
             ##TODO: Update path cost if it is used somehow after path leg modification because of ridesharing detour
             pass
 
@@ -636,7 +718,7 @@ class User(TimeDependentSubject):
             teleported = self.teleport(teleport_origin, gnodes[path.nodes[0]], max_teleport_dist, gnodes)
             if teleported:
                 self.set_state_stop()
-        self.path: Path = path
+        self.path = path
         self.current_node = path.nodes[0]
         self.current_link = (path.nodes[0], path.nodes[1])
 
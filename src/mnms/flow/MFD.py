@@ -5,6 +5,7 @@ from typing import List, Optional, Tuple, Union
 from typing import Callable, Dict
 
 import numpy as np
+from scipy.sparse import csr_matrix
 
 from hipop.graph import Link
 
@@ -76,6 +77,19 @@ class MFDFlowMotor(AbstractMFDFlowMotor):
 
         self._layer_link_length_mapping: Dict[str, LinkInfo] = dict()
         self._section_to_reservoir: Dict[str, Union[str, None]] = dict()
+        self._link_to_zones: Dict[Tuple[str, str], Tuple[Optional[np.ndarray], List[str]]] = dict()
+        self.nb_zone_errors: int = 0
+
+        # Sparse (links x (reservoir, vehicle type)) matrix of section lengths used to update the graph
+        self._ug_link_ids: List[str] = list()
+        self._ug_layer_links: List[Link] = list()
+        self._ug_columns: List[Tuple[str, str]] = list()
+        self._ug_lengths: Optional[csr_matrix] = None
+        self._ug_total_lengths: Optional[np.ndarray] = None
+        self._ug_link_speeds: Optional[np.ndarray] = None
+        # Rows of the links of each layer, and links costs version of each layer when their speeds were read
+        self._ug_layer_rows: Dict[str, List[int]] = dict()
+        self._ug_costs_versions: Dict[str, int] = dict()
 
     def _reset_mapping(self):
         graph = self._graph.graph
@@ -108,6 +122,19 @@ class MFDFlowMotor(AbstractMFDFlowMotor):
 
                 self._layer_link_length_mapping[lid] = LinkInfo(link, link_layer.vehicle_type.upper(), sections_length)
 
+        rsections = roads.sections
+        self._link_to_zones = dict()
+        for lid, sids in self._graph.map_reference_links.items():
+            if lid not in graph.links or len(sids) == 0:
+                continue
+            link = graph.links[lid]
+            zones = [rsections[sid].zone for sid in reversed(sids)]
+            if len(sids) == 1:
+                cum_lengths = None
+            else:
+                cum_lengths = np.cumsum([rsections[sid].length for sid in reversed(sids)])
+            self._link_to_zones[(link.upstream, link.downstream)] = (cum_lengths, zones)
+
         res_links = {res.id: roads.zones[res.id] for res in self.reservoirs.values()}
         res_dict = {res.id: res for res in self.reservoirs.values()}
         for section in roads.sections.keys():
@@ -134,6 +161,53 @@ class MFDFlowMotor(AbstractMFDFlowMotor):
         self.roads_sections = self._graph.roads.sections
 
         self._reset_mapping()
+        self._build_update_graph_matrix()
+
+    def _build_update_graph_matrix(self):
+        """Method that builds the sparse matrix of the lengths of each graph link
+        within each (reservoir, vehicle type), such that the new speeds of all links
+        are obtained with one matrix-vector product in update_graph.
+        """
+        graph = self._graph.graph
+        layers_links = [layer.graph.links for layer in self._graph.layers.values()]
+        columns = dict()
+        rows, cols, data = [], [], []
+        self._ug_link_ids = list()
+        self._ug_layer_links = list()
+        self._ug_layer_rows = defaultdict(list)
+        for lid, link_info in self._layer_link_length_mapping.items():
+            row = len(self._ug_link_ids)
+            self._ug_link_ids.append(lid)
+            self._ug_layer_rows[graph.links[lid].label].append(row)
+            self._ug_layer_links.append(next((links[lid] for links in layers_links if lid in links), None))
+            for section, length in link_info.sections:
+                key = (self._section_to_reservoir[section], link_info.veh)
+                rows.append(row)
+                cols.append(columns.setdefault(key, len(columns)))
+                data.append(length)
+        self._ug_columns = list(columns.keys())
+        self._ug_lengths = csr_matrix((data, (rows, cols)), shape=(len(self._ug_link_ids), len(columns)), dtype=np.float64)
+        self._ug_total_lengths = np.asarray(self._ug_lengths.sum(axis=1)).ravel()
+        self._ug_link_speeds = np.full(len(self._ug_link_ids), np.nan)
+        self._ug_costs_versions = dict()
+        self._read_link_speeds()
+
+    def _read_link_speeds(self):
+        """Method that reads the speeds of the links of the layers whose costs have been
+        updated since the last reading. NB: the costs must be updated through the layers,
+        or the layer must be notified with notify_link_costs_changed.
+        """
+        graph = self._graph.graph
+        for layer_id, rows in self._ug_layer_rows.items():
+            version = self._graph.layers[layer_id].link_costs_version
+            if self._ug_costs_versions.get(layer_id) != version:
+                for i in rows:
+                    self._ug_link_speeds[i] = self._get_link_speed(graph.links[self._ug_link_ids[i]])
+                self._ug_costs_versions[layer_id] = version
+
+    def _get_link_speed(self, link: Link) -> float:
+        layer = self._graph.layers[link.label]
+        return link.costs.get(next(iter(layer.mobility_services.keys())), {}).get('speed', np.nan)
 
     def add_reservoir(self, res: Reservoir):
         self.reservoirs[res.id] = res
@@ -224,34 +298,41 @@ class MFDFlowMotor(AbstractMFDFlowMotor):
                 passenger.set_position(veh._current_link, veh._current_node, veh.remaining_link_length, veh.position, tcurrent)
             return dt, users_to_replan
 
+    def _needs_zone_lookup(self, link: Tuple[str, str]) -> bool:
+        """Method that tells if the zone of a vehicle on a link may change along the link,
+        i.e. the link spans several sections, or its sections are unknown.
+
+        Args:
+            -link: the (upstream, downstream) nodes of the link
+
+        Returns:
+            -needs_lookup: True if the zone must be looked up again after a move on the link
+        """
+        link_zones = self._link_to_zones.get(link)
+        return link_zones is None or link_zones[0] is not None
+
     def get_vehicle_zone(self, veh):
-        try:
-            # Find the section where vehicle is currently
-            unode, dnode = veh.current_link
-            curr_link = self.graph_nodes[unode].adj[dnode]
-            sids = self._graph.map_reference_links[curr_link.id]
-            if len(sids) == 1:
-                sid = sids[0]
-            else:
-                slengths = [self.roads_sections[sid].length for sid in sids]
-                l = 0
-                for i in range(len(slengths)-1, -1, -1):
-                    l += slengths[i]
-                    if l >= veh.remaining_link_length:
-                        sid = sids[i]
-                        break
-            # Get section zone
-            res_id = self._graph.roads.sections[sid].zone
-        except:
-            log.warning(f'Could not find zone of vehicle {veh.id} (current link = {veh.current_link}) with direct method...')
-            pos = veh.position
-            res_id = None
-            for res in self.reservoirs.values():
-                if res.zone.is_inside([pos]):
-                    res_id = res.id
-                    break
+        """Method that returns the reservoir in which a vehicle currently is, i.e. the
+        zone of the reference section of its current link where it is located.
 
-        return res_id
+        Args:
+            -veh: the vehicle
+
+        Returns:
+            -res_id: the id of the vehicle's reservoir, None if it cannot be found
+        """
+        try:
+            cum_lengths, zones = self._link_to_zones[veh.current_link]
+        except (KeyError, TypeError):
+            self.nb_zone_errors += 1
+            log.warning(f'Could not find zone of vehicle {veh.id} (current link = {veh.current_link}), '
+                        f'{self.nb_zone_errors} zone error(s) so far')
+            return None
+        if cum_lengths is None:
+            return zones[0]
+        # Sections and cumulative lengths are stored from the end of the link
+        ind = cum_lengths.searchsorted(veh.remaining_link_length)
+        return zones[ind] if ind < len(zones) else zones[-1]
 
     def step(self, dt: Dt):
 
@@ -303,6 +384,7 @@ class MFDFlowMotor(AbstractMFDFlowMotor):
             if veh.is_moving:
                 self.count_moving_vehicle(veh, current_vehicles)
 
+        self.nb_moving_vehicles = len(current_vehicles)
         log.info(f"Moving {len(current_vehicles)} vehicles")
 
         # Update the traffic conditions
@@ -310,28 +392,58 @@ class MFDFlowMotor(AbstractMFDFlowMotor):
             self.update_reservoir_speed(res, self.dict_accumulations[res.id])
 
         # Move the vehicles
+        users_to_replan |= self.move_vehicles(current_vehicles, dt)
+
+        return users_to_replan
+
+    def move_vehicles(self, current_vehicles: Dict[str, Vehicle], dt: Dt):
+        """Method that moves all the moving vehicles during one flow time step.
+
+        Args:
+            -current_vehicles: the moving vehicles
+            -dt: the flow time step
+
+        Returns:
+            -users_to_replan: the users who should replan because their pickup vehicle is full
+        """
+        users_to_replan = set()
+        new_time = self._tcurrent.add_time(dt)
         for veh_id, veh in current_vehicles.items():
             veh_dt = veh.dt_move.to_seconds() if veh.dt_move is not None else dt.to_seconds()
             veh.dt_move = None
-            veh_type = veh.type.upper()
-            while veh_dt > 0:
-                res_id = self.get_vehicle_zone(veh)
-                speed = self.dict_speeds[res_id][veh_type]
-                veh.speed = speed
-                elapsed_time, other_users_to_replan = self.move_veh(veh, self._tcurrent, veh_dt, speed)
-                users_to_replan = users_to_replan.union(other_users_to_replan)
-                next_res_id = self.get_vehicle_zone(veh)
-                if next_res_id != res_id:
-                    # Vehicle exited the reservoir, register a new trip length in the left reservoir
-                    self.reservoirs[res_id].add_trip_length(veh.distance - veh.distance_at_last_res_change, veh_type)
-                    veh.distance_at_last_res_change = veh.distance
-                veh_dt -= elapsed_time
-            new_time = self._tcurrent.add_time(dt)
+            users_to_replan |= self.move_veh_during(veh, veh_dt)
             veh.notify(new_time)
             veh.notify_passengers(new_time)
 
         return users_to_replan
 
+    def move_veh_during(self, veh: Vehicle, veh_dt: float):
+        """Method that moves a vehicle during veh_dt seconds, link after link, and registers
+        the trip lengths of the reservoirs it leaves.
+
+        Args:
+            -veh: the vehicle to move
+            -veh_dt: the duration of the move in seconds
+
+        Returns:
+            -users_to_replan: the users who should replan because their pickup vehicle is full
+        """
+        users_to_replan = set()
+        veh_type = veh.type.upper()
+        while veh_dt > 0:
+            res_id = self.get_vehicle_zone(veh)
+            speed = self.dict_speeds[res_id][veh_type]
+            veh.speed = speed
+            elapsed_time, other_users_to_replan = self.move_veh(veh, self._tcurrent, veh_dt, speed)
+            users_to_replan = users_to_replan.union(other_users_to_replan)
+            next_res_id = self.get_vehicle_zone(veh)
+            if next_res_id != res_id:
+                # Vehicle exited the reservoir, register a new trip length in the left reservoir
+                self.reservoirs[res_id].add_trip_length(veh.distance - veh.distance_at_last_res_change, veh_type)
+                veh.distance_at_last_res_change = veh.distance
+            veh_dt -= elapsed_time
+        return users_to_replan
+
     def update_reservoir_speed(self, res, dict_accumulations):
         res.update_accumulations(dict_accumulations)
         self.dict_speeds[res.id] = res.update_speeds()
@@ -355,61 +467,69 @@ class MFDFlowMotor(AbstractMFDFlowMotor):
         banned_links = self._graph.dynamic_space_sharing.banned_links
         banned_cost = self._graph.dynamic_space_sharing.cost
 
-        link_layers = list()
-        for _, layer in self._graph.layers.items():
-            link_layers.append(layer.graph.links)
+        if len(self._ug_link_ids) == 0:
+            return
+
+        # Speeds written outside of the flow motor, and links whose speed was not known at initialization
+        self._read_link_speeds()
+        old_speeds = self._ug_link_speeds
+        for i in np.flatnonzero(np.isnan(old_speeds)):
+            old_speeds[i] = self._get_link_speed(graph.links[self._ug_link_ids[i]])
+
+        # New speeds of all links, sections without speed keep the old speed of their link
+        res_speeds = [self.reservoirs[res_id].dict_speeds[veh] for res_id, veh in self._ug_columns]
+        no_speed = np.array([speed is None for speed in res_speeds], dtype=np.float64)
+        res_speeds = np.array([0. if speed is None else speed for speed in res_speeds], dtype=np.float64)
+        new_speeds = self._ug_lengths @ res_speeds
+        if no_speed.any():
+            new_speeds += (self._ug_lengths @ no_speed) * old_speeds
+        total_lengths = self._ug_total_lengths
+        new_speeds = np.divide(new_speeds, total_lengths, out=new_speeds, where=total_lengths != 0)
 
         linkcosts = {}
-
-        for lid, link in graph.links.items():
-            if link.label == 'TRANSIT':
-                continue
-            link_info = self._layer_link_length_mapping[lid]
-            total_len = 0
-            new_speed = 0
+        updated_layers = set()
+        for i in np.flatnonzero((new_speeds != 0) & (np.abs(new_speeds - old_speeds) > threshold)):
+            lid = self._ug_link_ids[i]
+            link = graph.links[lid]
             layer = self._graph.layers[link.label]
-            old_speed = link.costs[list(layer.mobility_services.keys())[0]]["speed"]
-            for section, length in link_info.sections:
-                res_id = self._section_to_reservoir[section]
-                res = self.reservoirs[res_id]
-                speed = res.dict_speeds[link_info.veh]
-                total_len += length
-                if speed is not None:
-                    new_speed += length * speed
-                else:
-                    new_speed += length * old_speed
-            new_speed = new_speed / total_len if total_len != 0 else new_speed
-            if new_speed != 0 and abs(new_speed - old_speed) > threshold:
-                costs = defaultdict(dict)
-
-                # Update critical costs first
-                for mservice in link.costs.keys():
-                    costs[mservice] = {'travel_time': total_len / new_speed,
-                                       'speed': new_speed,
-                                       'length': total_len}
-
-                # The update the generalized one
-                costs_functions = layer._costs_functions
-                for mservice, cost_funcs in costs_functions.items():
-                    for cost_name, cost_f in cost_funcs.items():
-                        costs[mservice][cost_name] = cost_f(self.graph_nodes, layer, link, costs)
-
-                # Test if link is banned, if yes do not update the travel time and dynamic
-                # space sharing cost for the banned mobility service, but only the speed
-                if lid in banned_links:
-                    mservice = banned_links[lid].mobility_service
-                    costs[mservice].pop(banned_cost, None)
-                    if banned_cost != 'travel_time':
-                        costs[mservice].pop('travel_time', None)
-                linkcosts[lid]=costs
-
-                # Update of the cost in the corresponding graph layer
-                for links in link_layers:
-                    if lid in links:
-                        links[lid].update_costs(costs)
-                        break
+            new_speed = float(new_speeds[i])
+            total_len = float(total_lengths[i])
+            costs = defaultdict(dict)
+
+            # Update critical costs first
+            for mservice in link.costs.keys():
+                costs[mservice] = {'travel_time': total_len / new_speed,
+                                   'speed': new_speed,
+                                   'length': total_len}
+
+            # The update the generalized one
+            costs_functions = layer._costs_functions
+            for mservice, cost_funcs in costs_functions.items():
+                for cost_name, cost_f in cost_funcs.items():
+                    costs[mservice][cost_name] = cost_f(self.graph_nodes, layer, link, costs)
+
+            # Test if link is banned, if yes do not update the travel time and dynamic
+            # space sharing cost for the banned mobility service, but only the speed
+            if lid in banned_links:
+                mservice = banned_links[lid].mobility_service
+                costs[mservice].pop(banned_cost, None)
+                if banned_cost != 'travel_time':
+                    costs[mservice].pop('travel_time', None)
+            linkcosts[lid] = costs
+
+            # Update of the cost in the corresponding graph layer
+            layer_link = self._ug_layer_links[i]
+            if layer_link is not None:
+                layer_link.update_costs(costs)
+            updated_layers.add(layer)
+            old_speeds[i] = new_speed
+
         if len(linkcosts) > 0:
             graph.update_costs(linkcosts)
+        for layer in updated_layers:
+            layer.notify_link_costs_changed()
+            # The speeds written here are already known
+            self._ug_costs_versions[layer.id] = layer.link_costs_version
 
     def write_result(self, step_affectation: int, step_flow:int, flow_dt: Dt):
         tcurrent = self._tcurrent.copy().remove_time(flow_dt).time
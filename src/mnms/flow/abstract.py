@@ -82,6 +82,7 @@ class AbstractMFDFlowMotor(ABC):
         self._graph: MultiLayerGraph = None
 
         self._tcurrent: Time = Time()
+        self.nb_moving_vehicles: int = 0
 
         if outfile is None:
             self._write = False
@@ -1,4 +1,6 @@
-from typing import Dict, List, Optional
+import heapq
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
 
 import numpy as np
 import sys
@@ -6,7 +8,8 @@ import csv
 
 
 from mnms.graph.layers import MultiLayerGraph
-from mnms.demand.user import User, UserState
+from mnms.demand.user import User, UserState, UserPathIndex
+from mnms.demand.departures import DepartureQueue
 # from mnms.graph.core import ConnectionLink, TransitLink
 from mnms.time import Dt, Time
 from mnms.log import create_logger
@@ -16,6 +19,83 @@ from mnms.travel_decision.abstract import Event
 log = create_logger(__name__)
 
 
+class UserStateIndex(object):
+    def __init__(self):
+        """
+        Index of the users per state, kept up to date by the users at each state change.
+        The users of a state are returned in the order they have been added to the index.
+        """
+        self._users: Dict[UserState, Dict[str, User]] = {state: dict() for state in UserState}
+        self._rank: Dict[str, int] = dict()
+        self._counter = 0
+        # State -> callbacks called with the user when a user leaves this state
+        self._on_leave: Dict[UserState, List[Callable[[User], None]]] = defaultdict(list)
+
+    def __len__(self):
+        return len(self._rank)
+
+    def __contains__(self, user: User):
+        return user.id in self._rank
+
+    def add(self, user: User):
+        """Method that adds a user to the index, the user notifies its next state
+        changes to the index.
+
+        Args:
+            -user: the user to add
+        """
+        if user.id not in self._rank:
+            self._rank[user.id] = self._counter
+            self._counter += 1
+        user._state_index = self
+        self._users[user.state][user.id] = user
+
+    def remove(self, user: User):
+        """Method that removes a user from the index.
+
+        Args:
+            -user: the user to remove
+        """
+        if self._rank.pop(user.id, None) is not None:
+            self._users[user.state].pop(user.id, None)
+        if user._state_index is self:
+            user._state_index = None
+
+    def update_state(self, user: User, previous_state: UserState, state: UserState):
+        """Method called by a user of the index when its state changes.
+
+        Args:
+            -user: the user
+            -previous_state: the state the user leaves
+            -state: the new state of the user
+        """
+        self._users[previous_state].pop(user.id, None)
+        self._users[state][user.id] = user
+        for callback in self._on_leave.get(previous_state, ()):
+            callback(user)
+
+    def add_leave_callback(self, state: UserState, callback: Callable[[User], None]):
+        self._on_leave[state].append(callback)
+
+    def users(self, state: UserState) -> List[User]:
+        """Method that returns the users in a state.
+
+        Args:
+            -state: the state
+
+        Returns:
+            -users: the users in this state, in the order they have been added to the index
+        """
+        rank = self._rank
+        return sorted(self._users[state].values(), key=lambda u: rank[u.id])
+
+    def rank(self, user: User) -> int:
+        return self._rank.get(user.id, self._counter)
+
+    def count(self, state: UserState) -> int:
+        return len(self._users[state])
+
+
 class UserFlow(object):
     def __init__(self, walk_speed: float=1.42, outfile: str=None):
         """
@@ -26,11 +106,22 @@ class UserFlow(object):
         """
         self._graph: Optional[MultiLayerGraph] = None
         self.users:Dict[str, User] = dict()
+        # Users in self.users per state
+        self.user_states = UserStateIndex()
+        # Walking users -> remaining length on their current transit link,
+        # users leave it as soon as they are not walking anymore
         self._walking: Dict = dict()
+        self.user_states.add_leave_callback(UserState.WALKING, lambda u: self._walking.pop(u.id, None))
         self._walk_speed: float = walk_speed
         self._tcurrent: Optional[Time] = None
 
-        self._waiting_answer: Dict[str, tuple[Time, AbstractMobilityService]] = dict()
+        # Users waiting an answer: user id -> (deadline in waiting clock ticks, registration number, requested service),
+        # the deadlines are also kept in a heap, heap entries no longer matching the dict are invalid
+        self._waiting_answer: Dict[str, tuple[int, int, AbstractMobilityService]] = dict()
+        self._waiting_answer_deadlines: List[tuple[int, int, str]] = []
+        self._waiting_answer_counter: int = 0
+        # Cumulated duration of the steps during which users wait an answer, in ticks
+        self._waiting_clock: int = 0
 
         self._gnodes = None
 
@@ -88,7 +179,8 @@ class UserFlow(object):
             user.position = unode_pos+normalized_direction*travelled
 
     def _user_walking(self, dt:Dt):
-        """Method to manage users who are currently walking.
+        """Method to manage users who are currently walking. Walkers staying on their
+        current transit link are advanced in batch, the others are moved one by one.
 
         Args:
             -dt: duration for which users walk (usually corresponds to the flow time step)
@@ -97,77 +189,121 @@ class UserFlow(object):
         finish_walk = list()
         finish_trip = list()
         gnodes = self._graph.graph.nodes
-        for uid in self._walking.keys():
-            user = self.users[uid]
-            if user.state == UserState.WALKING:
-                upath = user.path.nodes
-                dist_travelled = dt.to_seconds() * self._walk_speed
-                arrival_time = self._tcurrent.copy()
-                while dist_travelled > 0:
-                    remaining_length = self._walking[uid]
-                    if remaining_length <= dist_travelled:
-                        # User arrived at the end of her current transit link
-                        user.update_distance(remaining_length)
-                        user.remaining_link_length = 0
-                        arrival_time = arrival_time.add_time(Dt(seconds=remaining_length / self._walk_speed))
-                        next_node = upath[user.get_current_node_index()+1]
-                        user.update_achieved_path(next_node)
-                        user.current_node = next_node
-                        self.set_user_position(user)
-                        user.notify(arrival_time.time)
-                        if next_node == upath[-1]:
-                            # User arrived at last node of her planned path
-                            user.finish_trip(arrival_time)
-                            finish_trip.append(user)
-                            dist_travelled = 0
-                        else:
-                            # User still has way to go
-                            if user.deadend_at_next_node:
-                                # User stops walking
-                                user.set_state_deadend(arrival_time)
-                                finish_walk.append(user)
-                                dist_travelled = 0
-                            else:
-                                cnode_ind = user.get_current_node_index()
-                                next_next_node = upath[cnode_ind + 1]
-                                next_link = gnodes[user.current_node].adj[next_next_node]
-                                if next_link.label == 'TRANSIT':
-                                    # User keeps walking
-                                    log.info(f"User {uid} enters connection on {next_link.id}")
-                                    dist_travelled = dist_travelled - remaining_length
-                                    self._walking[uid] = next_link.length
-                                    user.current_link = (user.current_node, next_next_node)
-                                else:
-                                    # User stops walking
-                                    user.set_state_stop()
-                                    finish_walk_and_request.append((user, arrival_time))
-                                    dist_travelled = 0
-                    else:
-                        # User did not arrived at the end of current link
-                        self._walking[uid] = remaining_length - dist_travelled
-                        user.remaining_link_length = remaining_length - dist_travelled
-                        self.set_user_position(user)
-                        user.update_distance(dist_travelled)
-                        dist_travelled = 0
+        dist_travelled = dt.to_seconds() * self._walk_speed
+
+        walkers = [self.users[uid] for uid in self._walking]
+        remaining_lengths = np.fromiter(self._walking.values(), dtype=np.float64, count=len(walkers))
+        stay_on_link = [user.state == UserState.WALKING and not remaining for user, remaining
+                        in zip(walkers, (remaining_lengths <= dist_travelled).tolist())]
+        batch = [i for i, stay in enumerate(stay_on_link) if stay]
+
+        # Advance at once the walkers who stay on their current link
+        if batch:
+            links = [walkers[i].current_link for i in batch]
+            unode_pos = np.array([gnodes[unode].position for unode, _ in links], dtype=np.float64)
+            direction = np.array([gnodes[dnode].position for _, dnode in links], dtype=np.float64) - unode_pos
+            norm_direction = np.linalg.norm(direction, axis=1)
+            new_remaining_lengths = remaining_lengths[batch] - dist_travelled
+            positive_norm = (norm_direction > 0).tolist()
+            safe_norm = np.where(positive_norm, norm_direction, 1.)
+            positions = unode_pos + direction / safe_norm[:, None] * (norm_direction - new_remaining_lengths)[:, None]
+            new_remaining_lengths = new_remaining_lengths.tolist()
+
+        ibatch = 0
+        for i, user in enumerate(walkers):
+            if stay_on_link[i]:
+                # User did not arrived at the end of current link
+                self._walking[user.id] = new_remaining_lengths[ibatch]
+                user.remaining_link_length = new_remaining_lengths[ibatch]
+                if positive_norm[ibatch]:
+                    user.position = positions[ibatch]
+                user.update_distance(dist_travelled)
+                ibatch += 1
+            elif user.state == UserState.WALKING:
+                self._walk_user(user, dist_travelled, finish_walk, finish_walk_and_request, finish_trip)
             else:
                 # User is not walking anymore for an external reason, e.g. DEADEND
                 finish_walk.append(user)
 
         for user in finish_walk:
-            del self._walking[user.id]
+            self._walking.pop(user.id, None)
 
         for user, request_time in finish_walk_and_request:
-            del self._walking[user.id]
+            self._walking.pop(user.id, None)
             log.info(f'User {user.id} is about to request a vehicle because he has finished walking')
             user.set_state_waiting_answer()
             requested_mservice = self._request_user_vehicles(user, request_time)
-            self._waiting_answer.setdefault(user.id, (user.response_dt.copy(),requested_mservice))
+            self._register_waiting_answer(user, requested_mservice)
 
         for user in finish_trip:
             if self._write:
                 self.write_result(user=user)
             del self.users[user.id]
-            del self._walking[user.id]
+            self.user_states.remove(user)
+            self._walking.pop(user.id, None)
+
+    def _walk_user(self, user: User, dist_travelled: float, finish_walk: List[User],
+                   finish_walk_and_request: List[tuple], finish_trip: List[User]):
+        """Method that moves a walking user who reaches the end of her current transit
+        link during the step.
+
+        Args:
+            -user: the walking user
+            -dist_travelled: the distance the user walks during the step
+            -finish_walk: list of users who stop walking, completed by this method
+            -finish_walk_and_request: list of (user, request time) of users who stop
+             walking and request a service, completed by this method
+            -finish_trip: list of users who arrive at destination, completed by this method
+        """
+        gnodes = self._graph.graph.nodes
+        upath = user.path.nodes
+        arrival_time = self._tcurrent.copy()
+        while dist_travelled > 0:
+            remaining_length = self._walking[user.id]
+            if remaining_length <= dist_travelled:
+                # User arrived at the end of her current transit link
+                user.update_distance(remaining_length)
+                user.remaining_link_length = 0
+                arrival_time = arrival_time.add_time(Dt(seconds=remaining_length / self._walk_speed))
+                next_node = upath[user.get_current_node_index()+1]
+                user.update_achieved_path(next_node)
+                user.current_node = next_node
+                self.set_user_position(user)
+                user.notify(arrival_time.time)
+                if next_node == upath[-1]:
+                    # User arrived at last node of her planned path
+                    user.finish_trip(arrival_time)
+                    finish_trip.append(user)
+                    dist_travelled = 0
+                else:
+                    # User still has way to go
+                    if user.deadend_at_next_node:
+                        # User stops walking
+                        user.set_state_deadend(arrival_time)
+                        finish_walk.append(user)
+                        dist_travelled = 0
+                    else:
+                        cnode_ind = user.get_current_node_index()
+                        next_next_node = upath[cnode_ind + 1]
+                        next_link = gnodes[user.current_node].adj[next_next_node]
+                        if next_link.label == 'TRANSIT':
+                            # User keeps walking
+                            log.info(f"User {user.id} enters connection on {next_link.id}")
+                            dist_travelled = dist_travelled - remaining_length
+                            self._walking[user.id] = next_link.length
+                            user.current_link = (user.current_node, next_next_node)
+                        else:
+                            # User stops walking
+                            user.set_state_stop()
+                            finish_walk_and_request.append((user, arrival_time))
+                            dist_travelled = 0
+            else:
+                # User did not arrived at the end of current link
+                self._walking[user.id] = remaining_length - dist_travelled
+                user.remaining_link_length = remaining_length - dist_travelled
+                self.set_user_position(user)
+                user.update_distance(dist_travelled)
+                dist_travelled = 0
 
     def _request_user_vehicles(self, user, request_time):
         """Method that formulates user's request to the proper mobility service.
@@ -223,6 +359,7 @@ class UserFlow(object):
         for u in new_users:
             if u.path is not None:
                 self.users[u.id] = u
+                self.user_states.add(u)
 
         self.determine_user_states()
 
@@ -234,8 +371,11 @@ class UserFlow(object):
         """Method to manage users who are in STOP state.
         """
         to_del = list()
-        for u in self.users.values():
-            if u.state is UserState.STOP and u.path is not None:
+        for u in self.user_states.users(UserState.STOP):
+            # The state of the user may have changed while handling the previous users
+            if u.state is not UserState.STOP:
+                continue
+            if u.path is not None:
                 upath = u.path.nodes
                 cnode = u.current_node
                 cnode_ind = u.get_current_node_index()
@@ -260,45 +400,85 @@ class UserFlow(object):
                     u.set_state_waiting_answer()
                     log.info(f'User {u.id} is about to request a vehicle because he is stopped')
                     requested_mservice = self._request_user_vehicles(u, self._tcurrent)
-                    self._waiting_answer.setdefault(u.id, (u.response_dt.copy(),requested_mservice))
+                    self._register_waiting_answer(u, requested_mservice)
 
                 u.notify(self._tcurrent)
 
         for uid in to_del:
             if self._write:
                 self.write_result(user=self.users[uid])
-            self.users.pop(uid)
+            self.user_states.remove(self.users.pop(uid))
+
+    def _register_waiting_answer(self, user: User, requested_mservice: AbstractMobilityService):
+        """Method that registers a user who starts waiting an answer from a mobility
+        service, the user gets refused if still waiting after its response_dt.
+
+        Args:
+            -user: the user who requested a service
+            -requested_mservice: the mobility service requested
+        """
+        deadline = self._waiting_clock + user.response_dt.ticks
+        self._waiting_answer_counter += 1
+        self._waiting_answer[user.id] = (deadline, self._waiting_answer_counter, requested_mservice)
+        heapq.heappush(self._waiting_answer_deadlines, (deadline, self._waiting_answer_counter, user.id))
 
     def check_user_waiting_answers(self, dt: Dt):
         """Method to manage users who are waiting an answer from a mobility service.
+        Only the users whose waiting deadline has passed are visited.
 
         Args:
             -dt: duration for which users have been waiting since the last call of this method
                  (usually corresponds to a flow time step duration)
+
+        Returns:
+            -refused_users: the users who waited an answer too long, in the order of their requests
         """
-        to_del = list()
+        self._waiting_clock += dt.ticks
+        deadlines = self._waiting_answer_deadlines
+        expired = list()
+        while deadlines and deadlines[0][0] <= self._waiting_clock:
+            _, counter, uid = heapq.heappop(deadlines)
+            entry = self._waiting_answer.get(uid)
+            if entry is None or entry[1] != counter:
+                # The user has requested again since this deadline was registered
+                continue
+            del self._waiting_answer[uid]
+            user = self.users.get(uid)
+            if user is not None and user.state is UserState.WAITING_ANSWER:
+                expired.append((counter, user, entry[2]))
+
         refused_users = list()
+        for _, user, requested_mservice in sorted(expired, key=lambda x: x[0]):
+            log.info(f"User {user.id} waited answer too long, cancels request for {requested_mservice._id}")
+            requested_mservice.cancel_request(user.id)
+            refused_users.append(user)
+            # Interrupt user's path but keep user in the list of user_flow
+            user.interrupt_path(self._tcurrent)
 
-        for uid, (time, requested_mservice) in self._waiting_answer.items():
-            if self.users[uid].state is UserState.WAITING_ANSWER:
-                new_time = time.to_seconds() - dt.to_seconds()
-                if new_time <= 0:
-                    log.info(f"User {uid} waited answer too long, cancels request for {requested_mservice._id}")
-                    requested_mservice.cancel_request(uid)
-                    refused_users.append(self.users[uid])
-                    # Interrupt user's path but keep user in the list of user_flow
-                    self.users[uid].interrupt_path(self._tcurrent)
-                    to_del.append(uid)
-                else:
-                    self._waiting_answer[uid] = (Time.from_seconds(new_time), requested_mservice)
-            else:
-                # User is not waiting answer anymore
-                to_del.append(uid)
+        return refused_users
 
-        for uid in to_del:
-            self._waiting_answer.pop(uid)
+    def find_users_on_links(self, links, new_users=()) -> List[User]:
+        """Method that finds the users of the user flow and the new users whose
+        current path passes through at least one of the links.
 
-        return refused_users
+        Args:
+            -links: the links
+            -new_users: users who are about to depart but not yet taken into account
+             by the user flow
+
+        Returns:
+            -users: the users found, users of the user flow first in the order they entered
+             the user flow, then new users in their order
+        """
+        users = UserPathIndex.users_on_links(links)
+        flow_users = sorted((u for u in users if self.users.get(u.id) is u), key=self.user_states.rank)
+        if isinstance(new_users, DepartureQueue):
+            departing_users = sorted((u for u in users if self.users.get(u.id) is not u and u in new_users),
+                                     key=new_users.position)
+        else:
+            found_users = set(id(u) for u in users)
+            departing_users = [u for u in new_users if id(u) in found_users and self.users.get(u.id) is not u]
+        return flow_users + departing_users
 
     def manage_links_removal_after_match(self, deleted_links, new_users, matched_user_id, service, decision_model):
         """Method that manages the interruption of users who were supposed to pass
@@ -320,22 +500,21 @@ class UserFlow(object):
         """
         interrupted_users = []
         users_canceling = []
-        for u in list(self.users.values()) + new_users:
-            if u.id != matched_user_id and u.path is not None:
+        deleted_links = set(deleted_links)
+        for u in self.find_users_on_links(deleted_links, new_users):
+            if u.id != matched_user_id:
                 unodes = u.path.nodes
-                path_links = [(unodes[i],unodes[i+1]) for i in range(len(unodes)-1)]
-                intersect = set(deleted_links).intersection(set(path_links))
-                if len(intersect) > 0:
-                    log.info(f"User {u.id} was supposed to pass through links {intersect} which were deleted, '\
-                        f'trigger an INTERRUPTION event (current node = {u.current_node}, state = {u.state})")
-                    interrupted_users.append(u)
-                    # Clean eventual request already formulated by user to this service
-                    if u.id in service._user_buffer.keys():
-                        if u.state == UserState.WAITING_ANSWER:
-                            # This user is waiting to be matched with a vehicle of the station we have just removed,
-                            # turn her to STOP state, and save the fact that she should cancel her request
-                            u.set_state_stop()
-                        users_canceling.append(u.id)
+                intersect = deleted_links.intersection(zip(unodes[:-1], unodes[1:]))
+                log.info(f"User {u.id} was supposed to pass through links {intersect} which were deleted, '\
+                    f'trigger an INTERRUPTION event (current node = {u.current_node}, state = {u.state})")
+                interrupted_users.append(u)
+                # Clean eventual request already formulated by user to this service
+                if u.id in service._user_buffer.keys():
+                    if u.state == UserState.WAITING_ANSWER:
+                        # This user is waiting to be matched with a vehicle of the station we have just removed,
+                        # turn her to STOP state, and save the fact that she should cancel her request
+                        u.set_state_stop()
+                    users_canceling.append(u.id)
         if interrupted_users:
             decision_model.add_users_for_planning(interrupted_users, [Event.INTERRUPTION]*len(interrupted_users))
             # NB: the planning will be called before the next user flow step so no need to interrupt user path now
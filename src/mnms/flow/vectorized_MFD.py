@@ -0,0 +1,126 @@
+from typing import Dict
+
+import numpy as np
+
+from mnms.flow.MFD import MFDFlowMotor
+from mnms.log import create_logger
+from mnms.time import Dt
+from mnms.vehicles.veh_type import Vehicle
+
+log = create_logger(__name__)
+
+
+class VectorizedMFDFlowMotor(MFDFlowMotor):
+    def __init__(self, outfile: str = None, writeheader: bool = True):
+        """
+        MFD flow motor moving the vehicles in batch. The state of the moving vehicles
+        (remaining link length, speed, reservoir and position) is gathered in contiguous
+        arrays and advanced in one vectorized operation, only the vehicles reaching the
+        end of their current link during the time step are moved one by one with the
+        logic of MFDFlowMotor. It produces the same results as MFDFlowMotor.
+
+        Args:
+            outfile: If not `None` store the reservoirs state at each `step`
+            writeheader: If True, write the header of outfile
+        """
+        super(VectorizedMFDFlowMotor, self).__init__(outfile=outfile, writeheader=writeheader)
+
+        self._node_index: Dict[str, int] = dict()
+        self._node_positions: np.ndarray = np.empty((0, 2))
+        self._moving_vehicles_zone: Dict[str, str] = dict()
+
+    def initialize(self):
+        super(VectorizedMFDFlowMotor, self).initialize()
+
+        self._node_index = {nid: i for i, nid in enumerate(self.graph_nodes.keys())}
+        self._node_positions = np.array([node.position for node in self.graph_nodes.values()], dtype=np.float64)
+
+    def count_moving_vehicle(self, veh: Vehicle, current_vehicles):
+        res_id = self.get_vehicle_zone(veh)
+        veh_type = veh.type.upper()
+        self.dict_accumulations[res_id][veh_type] += 1
+        current_vehicles[veh.id] = veh
+        self._moving_vehicles_zone[veh.id] = res_id
+
+    def move_vehicles(self, current_vehicles: Dict[str, Vehicle], dt: Dt):
+        """Method that moves all the moving vehicles during one flow time step. Vehicles
+        staying on their current link are advanced in batch, the others are moved
+        with MFDFlowMotor.move_veh_during.
+
+        Args:
+            -current_vehicles: the moving vehicles
+            -dt: the flow time step
+
+        Returns:
+            -users_to_replan: the users who should replan because their pickup vehicle is full
+        """
+        users_to_replan = set()
+        nb_veh = len(current_vehicles)
+        if nb_veh == 0:
+            self._moving_vehicles_zone = dict()
+            return users_to_replan
+
+        # Gather the state of the moving vehicles
+        vehicles = list(current_vehicles.values())
+        zones = [self._moving_vehicles_zone[veh.id] for veh in vehicles]
+        self._moving_vehicles_zone = dict()
+        flow_dt = dt.to_seconds()
+        veh_dts = np.empty(nb_veh, dtype=np.float64)
+        speeds = np.empty(nb_veh, dtype=np.float64)
+        remaining_lengths = np.empty(nb_veh, dtype=np.float64)
+        unodes = np.empty(nb_veh, dtype=np.int64)
+        dnodes = np.empty(nb_veh, dtype=np.int64)
+        for i, veh in enumerate(vehicles):
+            veh_dts[i] = veh.dt_move.to_seconds() if veh.dt_move is not None else flow_dt
+            veh.dt_move = None
+            speeds[i] = self.dict_speeds[zones[i]][veh.type.upper()]
+            remaining_lengths[i] = veh.remaining_link_length
+            unode, dnode = veh.current_link
+            unodes[i] = self._node_index[unode]
+            dnodes[i] = self._node_index[dnode]
+
+        # Advance all vehicles at once
+        dist_travelled = veh_dts * speeds
+        stay_on_link = (veh_dts > 0) & (dist_travelled <= remaining_lengths)
+        new_remaining_lengths = remaining_lengths - dist_travelled
+
+        unode_pos = self._node_positions[unodes]
+        direction = self._node_positions[dnodes] - unode_pos
+        norm_direction = np.linalg.norm(direction, axis=1)
+        positive_norm = norm_direction > 0
+        safe_norm = np.where(positive_norm, norm_direction, 1.)
+        normalized_direction = np.where(positive_norm[:, None], direction / safe_norm[:, None], direction)
+        travelled = np.where(positive_norm, norm_direction - new_remaining_lengths, 0.)
+        positions = unode_pos + normalized_direction * travelled[:, None]
+
+        dist_travelled = dist_travelled.tolist()
+        new_remaining_lengths = new_remaining_lengths.tolist()
+        speeds = speeds.tolist()
+        veh_dts = veh_dts.tolist()
+        stay_on_link = stay_on_link.tolist()
+
+        # Write back the new state, vehicles reaching the end of their link are moved one by one
+        new_time = self._tcurrent.add_time(dt)
+        for i, veh in enumerate(vehicles):
+            if stay_on_link[i]:
+                veh.speed = speeds[i]
+                veh._remaining_link_length = new_remaining_lengths[i]
+                veh.update_distance(dist_travelled[i])
+                veh.set_position(positions[i])
+                for passenger in veh.passengers.values():
+                    passenger.set_position(veh._current_link, veh._current_node, veh.remaining_link_length,
+                                           veh.position, self._tcurrent)
+                if self._needs_zone_lookup(veh.current_link):
+                    # The vehicle may have changed of section along a multi-section link
+                    res_id = zones[i]
+                    if self.get_vehicle_zone(veh) != res_id:
+                        # Vehicle exited the reservoir, register a new trip length in the left reservoir
+                        veh_type = veh.type.upper()
+                        self.reservoirs[res_id].add_trip_length(veh.distance - veh.distance_at_last_res_change, veh_type)
+                        veh.distance_at_last_res_change = veh.distance
+            else:
+                users_to_replan |= self.move_veh_during(veh, veh_dts[i])
+            veh.notify(new_time)
+            veh.notify_passengers(new_time)
+
+        return users_to_replan
@@ -94,6 +94,7 @@ class DynamicSpaceSharing(object):
         self.graph.graph.update_link_costs(lid, costs)
         layer = self.graph.mapping_layer_services[mobility_service]
         layer.graph.links[lid].update_costs(costs)
+        layer.notify_link_costs_changed()
 
         # Gather the vehicles impacted by this banning
         # NB: a vehicle is considered to be impacted by the banning if it has the banned
@@ -145,6 +146,7 @@ class DynamicSpaceSharing(object):
         # Update link cost
         self.graph.graph.update_link_costs(lid, costs)
         layer.graph.links[lid].update_costs(costs)
+        layer.notify_link_costs_changed()
 
     def update(self, tcurrent: Time, vehicles: List[Vehicle]) -> List[Tuple[Vehicle, VehicleActivity]]:
         """Method that updates the banned links every _dt.
@@ -65,6 +65,9 @@ class AbstractLayer(CostFunctionLayer):
 
         self.shortest_paths = None
 
+        # Incremented at each update of the links costs, to invalidate the caches built on them
+        self.link_costs_version: int = 0
+
         # self._costs_functions: Dict[Dict[str, Callable]] = defaultdict(dict)
 
         self.mobility_services: Dict[str, AbstractMobilityService] = dict()
@@ -76,9 +79,13 @@ class AbstractLayer(CostFunctionLayer):
                 if observer is not None:
                     s.attach_vehicle_observer(observer)
 
+    def notify_link_costs_changed(self):
+        """Method to call when the costs of the links of this layer have been updated."""
+        self.link_costs_version += 1
+
     def add_mobility_service(self, service: AbstractMobilityService):
         service.layer = self
-        service.fleet = FleetManager(self._veh_type, service.id, service.is_personal())
+        service.fleet = FleetManager(self._veh_type, service.id, service.is_personal(), graph=self.graph)
         self.mobility_services[service.id] = service
 
     def load_shortest_paths(self, file):
@@ -459,6 +466,9 @@ class MultiLayerGraph(object):
                 if layer_link is not None:
                     layer_link.update_costs(costs)
 
+        for layer in self.layers.values():
+            layer.notify_link_costs_changed()
+
     def add_cost_function(self, layer_id: str, cost_name: str, cost_function: Callable, mobility_service: Optional[str] = None):
         # Retrieve layer
         if layer_id == 'TRANSIT':
@@ -1,5 +1,8 @@
+from typing import List
+
 from mnms.log import create_logger
 import numpy as np
+from scipy.spatial import cKDTree
 
 log = create_logger(__name__)
 
@@ -8,16 +11,90 @@ class OriginDestinationLayer(object):
         self.origins = dict()
         self.destinations = dict()
         self.id = "ODLAYER"
+        # Spatial indexes of origins and destinations, built at the first nearest node query
+        self._origins_index = None
+        self._destinations_index = None
 
     def create_origin_node(self, nid, pos: np.ndarray):
         # new_node = Node(nid, pos[0], pos[1], self.id)
 
         self.origins[nid] = pos
+        self._origins_index = None
 
     def create_destination_node(self, nid, pos: np.ndarray):
         # new_node = Node(nid, pos[0], pos[1], self.id)
 
         self.destinations[nid] = pos
+        self._destinations_index = None
+
+    @staticmethod
+    def _build_index(nodes):
+        ids = list(nodes.keys())
+        positions = np.array([position for position in nodes.values()], dtype=np.float64)
+        return ids, positions, cKDTree(positions)
+
+    @staticmethod
+    def _query_index(index, positions) -> List[str]:
+        """Method that finds the nearest node of each position, among equidistant nodes
+        the first created one is returned.
+
+        Args:
+            -index: the spatial index of the nodes
+            -positions: array of positions, one per row
+
+        Returns:
+            -nids: the ids of the nearest nodes
+        """
+        ids, nodes_pos, tree = index
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, nodes_pos.shape[1])
+        if len(positions) == 0:
+            return []
+        k = min(2, len(ids))
+        dists, inds = tree.query(positions, k=k)
+        if k == 1:
+            return [ids[i] for i in inds]
+        nearest = inds[:, 0]
+        # Nodes nearly as close as the nearest one may have been found in any order
+        ties = np.flatnonzero(dists[:, 1] <= dists[:, 0] * (1 + 1e-9))
+        for t in ties:
+            nearest[t] = np.argmin(np.linalg.norm(nodes_pos - positions[t], axis=1))
+        return [ids[i] for i in nearest]
+
+    def nearest_origins(self, positions) -> List[str]:
+        """Method that finds the nearest origin node of each position.
+
+        Args:
+            -positions: array or list of positions
+
+        Returns:
+            -nids: the ids of the nearest origin nodes, empty if there is no position or no origin node
+        """
+        if len(positions) == 0 or not self.origins:
+            return []
+        if self._origins_index is None:
+            self._origins_index = self._build_index(self.origins)
+        return self._query_index(self._origins_index, positions)
+
+    def nearest_destinations(self, positions) -> List[str]:
+        """Method that finds the nearest destination node of each position.
+
+        Args:
+            -positions: array or list of positions
+
+        Returns:
+            -nids: the ids of the nearest destination nodes, empty if there is no position or no destination node
+        """
+        if len(positions) == 0 or not self.destinations:
+            return []
+        if self._destinations_index is None:
+            self._destinations_index = self._build_index(self.destinations)
+        return self._query_index(self._destinations_index, positions)
+
+    def nearest_origin(self, position) -> str:
+        return self.nearest_origins([position])[0]
+
+    def nearest_destination(self, position) -> str:
+        return self.nearest_destinations([position])[0]
 
     def __dump__(self):
         return {'ORIGINS': {node: self.origins[node] for node in self.origins},
@@ -31,4 +108,4 @@ class OriginDestinationLayer(object):
         for nid, pos in data['DESTINATIONS'].items():
             new_obj.create_destination_node(nid, pos)
 
-        return new_obj
\ No newline at end of file
+        return new_obj
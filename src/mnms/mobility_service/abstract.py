@@ -1,5 +1,6 @@
+import heapq
 from abc import ABC, abstractmethod, ABCMeta
-from typing import List, Tuple, Optional, Dict
+from typing import List, Tuple, Optional, Dict, Iterable
 import numpy as np
 
 from mnms.log import create_logger
@@ -59,6 +60,95 @@ def compute_path_nodes_travel_time(path_nodes, gnodes, ms_id):
         tt += link.costs[ms_id]['travel_time']
     return tt
 
+def reverse_dijkstra(gnodes, target: str, ms_id: str, cost: str = 'travel_time', sources: Iterable[str] = None,
+                     max_cost: float = float('inf')) -> Dict[str, Tuple[float, Optional[str]]]:
+    """Method that computes the shortest paths from many nodes toward one target node at once,
+    with a Dijkstra search from the target on the reversed links. As in HiPOP, a missing link
+    cost counts as zero.
+
+    Args:
+        -gnodes: nodes of the graph
+        -target: the node toward which paths are computed
+        -ms_id: id of the mobility service whose link costs are used
+        -cost: name of the cost to minimize
+        -sources: the nodes for which paths are wanted, the search stops once they are all
+         reached, all nodes are searched if None
+        -max_cost: the search does not go beyond this cost
+
+    Returns:
+        -settled: dict with the reached nodes as keys, and as values the cost of their shortest path
+         toward target and the next node on this path (None for target)
+    """
+    remaining = set(sources) if sources is not None else None
+    settled = dict()
+    best_costs = {target: 0}
+    heap = [(0, target, None)]
+    while heap:
+        c, node, next_node = heapq.heappop(heap)
+        if node in settled:
+            continue
+        settled[node] = (c, next_node)
+        if remaining is not None:
+            remaining.discard(node)
+            if not remaining:
+                break
+        for un, link in gnodes[node].radj.items():
+            link_costs = link.costs.get(ms_id)
+            new_c = c + (link_costs.get(cost, 0) if link_costs is not None else 0)
+            if new_c <= max_cost and new_c < best_costs.get(un, float('inf')):
+                best_costs[un] = new_c
+                heapq.heappush(heap, (new_c, un, node))
+    return settled
+
+def reverse_dijkstra_path(settled: Dict[str, Tuple[float, Optional[str]]], source: str) -> Tuple[List[str], float]:
+    """Method that reads the shortest path of a node in the result of reverse_dijkstra.
+
+    Args:
+        -settled: the result of reverse_dijkstra
+        -source: the first node of the path
+
+    Returns:
+        -path: the list of nodes of the path, empty if the source is the target, or if it has not been reached
+        -cost: the cost of the path, infinite if the source has not been reached
+    """
+    if source not in settled:
+        return [], float('inf')
+    c, next_node = settled[source]
+    if next_node is None:
+        return [], 0
+    path = [source]
+    while next_node is not None:
+        path.append(next_node)
+        next_node = settled[next_node][1]
+    return path, c
+
+
+class PlanDurations(object):
+    def __init__(self, key: tuple, current_activity: Optional[VehicleActivity]):
+        """
+        Travel times of the plan of a vehicle cached by a mobility service.
+
+        Args:
+            -key: the versions of the vehicle plan, of the current activity path and of the links
+             costs on which the durations have been computed
+            -current_activity: the current activity of the vehicle, kept so that its identity
+             in the key cannot be reused
+        """
+        self.key = key
+        self.current_activity = current_activity
+        # Nodes of the current activity path, index of the first occurrence of each node,
+        # and travel time of the current activity path from each of its legs to its end
+        self.current_path_nodes: Optional[List[str]] = None
+        self.current_node_indices: Dict[str, int] = dict()
+        self.current_remaining_tts: List[float] = []
+        # Cumulated durations in ticks of the next activities paths, and versions of these paths
+        self.next_activities_cumulated_ticks: List[int] = []
+        self.next_activities_path_versions: Optional[List[int]] = None
+
+    @property
+    def next_activities_ticks(self) -> int:
+        return self.next_activities_cumulated_ticks[-1] if self.next_activities_cumulated_ticks else 0
+
 
 class Request(object):
 
@@ -760,21 +850,92 @@ class AbstractOnDemandMobilityService(AbstractMobilityService, metaclass=ABCMeta
     def get_idle_vehicles(self):
         """Method that returns the array of idle vehicles of this service.
         """
-        all_vehs = self.get_all_vehicles()
-        mask = [True if (veh.activity_type in [ActivityType.STOP, ActivityType.REPOSITIONING]) and (not veh.activities) \
-            else False for veh in all_vehs]
-        idle_vehs = all_vehs[mask]
-        return idle_vehs
+        return self.fleet.idle_vehicles_array()
 
     def get_all_vehicles(self):
         """Method that returns the array of all vehicles of this service.
         """
-        vehs = np.array(list(self.fleet.vehicles.values()))
-        return vehs
+        return self.fleet.vehicles_array()
 
     def service_level_costs(self, nodes: List[str]) -> dict:
         return create_service_costs()
 
+    def activity_duration(self, activity: VehicleActivity) -> int:
+        """Method that returns the travel time of an activity path, it is cached on the activity
+        until its path is modified or the costs of the links of the layer are updated.
+
+        Args:
+            -activity: the activity
+
+        Returns:
+            -ticks: the travel time of the activity path in ticks
+        """
+        key = (self.id, self.layer.link_costs_version)
+        cache = activity.duration_cache
+        if cache is not None and cache[0] == key:
+            return cache[1]
+        ticks = Dt(seconds=compute_path_travel_time(activity.path, self.gnodes, self.id)).ticks
+        activity.duration_cache = (key, ticks)
+        return ticks
+
+    def plan_durations(self, veh: Vehicle) -> PlanDurations:
+        """Method that returns the travel times of the plan of a vehicle, they are cached on the
+        vehicle until its plan or one of its activities path is modified, or the costs of the links
+        of the layer are updated. The next activities paths may be modified in place, only the
+        durations of the next activities are then recomputed, from the durations cached on them.
+
+        Args:
+            -veh: the vehicle
+
+        Returns:
+            -durations: the travel times of the vehicle plan
+        """
+        activity = veh.activity
+        key = (self.id, veh._plan_version, id(activity), None if activity is None else activity.path_version,
+               self.layer.link_costs_version)
+        durations = veh.plan_durations
+        if durations is None or durations.key != key:
+            durations = PlanDurations(key, activity)
+            if activity is not None and activity.activity_type is not ActivityType.STOP:
+                gnodes = self.gnodes
+                path = activity.path
+                path_nodes = veh.path_to_nodes(path)
+                durations.current_path_nodes = path_nodes
+                durations.current_node_indices = {n: i for i, n in reversed(list(enumerate(path_nodes)))}
+                remaining_tts = [0.] * (len(path) + 1)
+                for i in range(len(path) - 1, -1, -1):
+                    remaining_tts[i] = compute_path_travel_time(path[i:i+1], gnodes, self.id) + remaining_tts[i+1]
+                durations.current_remaining_tts = remaining_tts
+            veh.plan_durations = durations
+        path_versions = [a.path_version for a in veh.activities]
+        if durations.next_activities_path_versions != path_versions:
+            cumulated_ticks = 0
+            durations.next_activities_cumulated_ticks = []
+            for a in veh.activities:
+                cumulated_ticks += self.activity_duration(a)
+                durations.next_activities_cumulated_ticks.append(cumulated_ticks)
+            durations.next_activities_path_versions = path_versions
+        return durations
+
+    def estimate_remaining_plan_duration(self, veh: Vehicle) -> Dt:
+        """Method that estimates the time a vehicle needs to complete its current plan.
+
+        Args:
+            -veh: the vehicle
+
+        Returns:
+            -duration: the estimated duration of the end of current activity and of the next activities
+        """
+        durations = self.plan_durations(veh)
+        duration = Dt()
+        if durations.current_path_nodes is not None:
+            # NB: works only when an activity path does not contain several times the same node
+            curr_node_ind_in_path = durations.current_node_indices[veh.current_node]
+            duration += Dt(seconds=durations.current_remaining_tts[curr_node_ind_in_path+1])
+            current_link = self.gnodes[veh.current_node].adj[durations.current_path_nodes[curr_node_ind_in_path+1]]
+            duration += Dt(seconds=veh.remaining_link_length / current_link.costs[self.id]['speed'])
+        return duration + Dt.from_ticks(durations.next_activities_ticks)
+
 
 class AbstractOnDemandDepotMobilityService(AbstractOnDemandMobilityService):
     def __init__(self,
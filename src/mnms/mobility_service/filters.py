@@ -8,6 +8,7 @@ from mnms.graph.layers import AbstractLayer
 from mnms.graph.road import RoadDescriptor
 from mnms.mobility_service.interfaces import Depot
 from mnms.vehicles.custom_veh_type import Vehicle, ActivityType
+from mnms.vehicles.fleet import FleetManager, FleetSpatialIndex
 
 
 Mask = Union[NDArray[bool], List[bool]]
@@ -92,9 +93,15 @@ class CombinedVehicleFilter(object):
             return CombinedVehicleFilter(self.filters + [other])
 
 
+def get_index_mask(vehicles: Iterable[Vehicle], selected_vehicles: List[Vehicle]) -> Mask:
+    selected_ids = {veh.id for veh in selected_vehicles}
+    return np.array([veh.id in selected_ids for veh in vehicles], dtype=bool)
+
+
 class InRadiusFilter(VehicleFilter):
-    def __init__(self, radius: float):
+    def __init__(self, radius: float, spatial_index: FleetSpatialIndex = None):
         self.radius = radius
+        self.spatial_index = spatial_index
 
     def get_mask(self,
                  layer: AbstractLayer,
@@ -103,8 +110,11 @@ class InRadiusFilter(VehicleFilter):
                  deposits: List[Depot] = None) -> Mask:
         """
         Return a mask (boolean array), if vehicle in self.radius True else False
+        If a spatial index is given, only the vehicles in the cells around position are considered.
         """
-        if len(vehicles) > 0:
+        if len(vehicles) > 0 and self.spatial_index is not None:
+            return get_index_mask(vehicles, self.spatial_index.vehicles_in_radius(position, self.radius))
+        elif len(vehicles) > 0:
             veh_positions = np.array([veh.position for veh in vehicles])
             dist_vector = np.linalg.norm(veh_positions - np.array(position), axis=1)
             return dist_vector <= self.radius
@@ -112,8 +122,9 @@ class InRadiusFilter(VehicleFilter):
             return []
 
 class PlanEndsInRadiusFilter(VehicleFilter):
-    def __init__(self, radius: float):
+    def __init__(self, radius: float, spatial_index: FleetSpatialIndex = None):
         self.radius = radius
+        self.spatial_index = spatial_index
 
     def get_mask(self,
                  layer: AbstractLayer,
@@ -123,7 +134,11 @@ class PlanEndsInRadiusFilter(VehicleFilter):
         """
         Return a mask (boolean array), if vehicle in radius around position at the
         end of its plan True, else False.
+        If a spatial index is given, only the vehicles whose plan ends in the cells around
+        position are considered, the plan ends of the index should be up to date.
         """
+        if self.spatial_index is not None:
+            return get_index_mask(vehicles, self.spatial_index.plan_ends_in_radius(position, self.radius))
         vehs_last_nodes = [v.activity.node if not v.activities else v.activities[-1].node for v in vehicles]
         vehs_last_pos = np.array([layer.graph.nodes[n].position for n in vehs_last_nodes])
         dist_vector = np.linalg.norm(vehs_last_pos - np.array(position), axis=1)
@@ -132,6 +147,9 @@ class PlanEndsInRadiusFilter(VehicleFilter):
 
 
 class IsNearestFilter(VehicleFilter):
+    def __init__(self, spatial_index: FleetSpatialIndex = None):
+        self.spatial_index = spatial_index
+
     def get_mask(self,
                  layer: AbstractLayer,
                  vehicles: Iterable[Vehicle],
@@ -139,7 +157,15 @@ class IsNearestFilter(VehicleFilter):
                  deposits: List[Depot] = None) -> Mask:
         """
         Return a mask (boolean array), if vehicle is nearest vehicle from position True else False
+        If a spatial index is given and vehicles are all the vehicles of the index, only the cells
+        around position are searched.
         """
+        if self.spatial_index is not None and len(vehicles) == len(self.spatial_index) \
+                and all(veh in self.spatial_index for veh in vehicles):
+            nearest_veh = self.spatial_index.nearest_vehicle(position)
+            mask = [veh is nearest_veh for veh in vehicles]
+            if any(mask):
+                return mask
 
         veh_postions = np.array([veh.position for veh in vehicles])
         dist_vector = np.linalg.norm(veh_postions-np.array(position), axis=1)
@@ -163,6 +189,9 @@ class IsWaiting(VehicleFilter):
         return [True if veh.activity_type is ActivityType.STOP else False for veh in vehicles]
 
 class IsIdle(VehicleFilter):
+    def __init__(self, fleet: FleetManager = None):
+        self.fleet = fleet
+
     def get_mask(self,
                  layer: AbstractLayer,
                  vehicles: Iterable[Vehicle],
@@ -171,7 +200,10 @@ class IsIdle(VehicleFilter):
         """
         Return a mask (boolean array), if vehicle is idle (i.e. stop or repositionning without
         coming acitivities) True else False.
+        If a fleet is given, the idle vehicles maintained by the fleet are read.
         """
+        if self.fleet is not None:
+            return [self.fleet.is_idle(veh) for veh in vehicles]
         return [True if (veh.activity_type in [ActivityType.STOP, ActivityType.REPOSITIONING]) and (not veh.activities) \
             else False for veh in vehicles]
 
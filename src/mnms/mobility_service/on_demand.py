@@ -1,7 +1,8 @@
 from typing import Tuple, Dict, List
 
 import numpy as np
-from scipy.optimize import linear_sum_assignment
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
 import multiprocessing
 import sys
 import math
@@ -10,8 +11,9 @@ from hipop.shortest_path import dijkstra, parallel_dijkstra
 
 from mnms import create_logger
 from mnms.demand import User
-from mnms.mobility_service.abstract import AbstractOnDemandMobilityService, AbstractOnDemandDepotMobilityService, Request, compute_path_travel_time, compute_path_nodes_travel_time
-from mnms.mobility_service.filters import PlanEndsInRadiusFilter, IsIdle, InRadiusFilter, DepotIsNotFull, IsNearestDepotFilter
+from mnms.mobility_service.abstract import AbstractOnDemandMobilityService, AbstractOnDemandDepotMobilityService, Request, compute_path_nodes_travel_time, \
+    reverse_dijkstra, reverse_dijkstra_path
+from mnms.mobility_service.filters import IsIdle, DepotIsNotFull, IsNearestDepotFilter
 from mnms.time import Dt, Time
 from mnms.tools.exceptions import PathNotFound
 from mnms.vehicles.custom_veh_type import ActivityType, VehicleActivityServing, VehicleActivityStop, \
@@ -23,6 +25,39 @@ from mnms.tools.preprocessing import decode_shortest_path_tree
 log = create_logger(__name__)
 
 
+def sparse_assignment(rows: np.ndarray, cols: np.ndarray, costs: np.ndarray, unmatched_cost: float) -> np.ndarray:
+    """Function that solves a minimum cost assignment problem defined by its possible pairs only.
+    Each row can be left unmatched for unmatched_cost, so the number of matched rows is maximized
+    first, then the total cost of the matched pairs is minimized.
+
+    Args:
+        -rows: the row of each possible pair
+        -cols: the column of each possible pair, a (row, column) pair appears at most once
+        -costs: the cost of each possible pair
+        -unmatched_cost: the cost of leaving a row unmatched
+
+    Returns:
+        -matched_pairs: the indices of the matched pairs, sorted by row
+    """
+    if len(rows) == 0:
+        return np.empty(0, dtype=np.int64)
+    # Only the rows and columns with possible pairs are kept
+    unique_rows, pairs_rows = np.unique(rows, return_inverse=True)
+    unique_cols, pairs_cols = np.unique(cols, return_inverse=True)
+    nb_rows, nb_cols = len(unique_rows), len(unique_cols)
+    # Each row has its own dummy column for being unmatched, then the matching of all rows always exists.
+    # The costs are shifted by one because zero costs would be read as missing pairs, the shift does not
+    # change the optimal assignment as all rows are matched.
+    all_rows = np.concatenate([pairs_rows, np.arange(nb_rows)])
+    all_cols = np.concatenate([pairs_cols, nb_cols + np.arange(nb_rows)])
+    all_costs = np.concatenate([costs, np.full(nb_rows, unmatched_cost)]) + 1
+    graph = csr_matrix((all_costs, (all_rows, all_cols)), shape=(nb_rows, nb_cols + nb_rows))
+    row_ind, col_ind = min_weight_full_bipartite_matching(graph)
+    pairs_indices = {(r, c): i for i, (r, c) in enumerate(zip(pairs_rows.tolist(), pairs_cols.tolist()))}
+    return np.array([pairs_indices[(r, c)] for r, c in sorted(zip(row_ind.tolist(), col_ind.tolist())) if c < nb_cols],
+                    dtype=np.int64)
+
+
 class OnDemandMobilityService(AbstractOnDemandMobilityService):
 
     def __init__(self,
@@ -32,7 +67,9 @@ class OnDemandMobilityService(AbstractOnDemandMobilityService):
                  default_waiting_time: float = 0,
                  matching_strategy: str='nearest_idle_vehicle_in_radius_fifo',
                  radius: float = 10000,
-                 detour_ratio: float = 1.343):
+                 detour_ratio: float = 1.343,
+                 reverse_search: bool = True,
+                 zonal_batch_matching: bool = False):
         """Constructor of an OnDemandMobilityService object.
 
         Args:
@@ -47,11 +84,20 @@ class OnDemandMobilityService(AbstractOnDemandMobilityService):
             -matching_strategy: strategy to apply for the matching
             -radius: radius in meters used by matching strategies
             -detour_ratio: distance on the actual road network to straight line distance
+            -reverse_search: if True, the fifo strategies compute the paths of all the candidate
+             vehicles toward the user with one search from the user, bounded by the user's pickup
+             tolerance, otherwise one shortest path is computed per candidate vehicle
+            -zonal_batch_matching: if True and zones are defined, the batched strategies only match
+             requests and vehicles ending their plan in the same zone, and solve one matching per zone,
+             requests and vehicles outside all zones are matched together in one more matching
         """
         super(OnDemandMobilityService, self).__init__(id, veh_capacity=1, dt_matching=dt_matching,
             dt_periodic_maintenance=dt_periodic_maintenance, default_waiting_time=default_waiting_time)
         self.gnodes = dict()
         self.detour_ratio = detour_ratio
+        self.reverse_search = reverse_search
+        self.zonal_batch_matching = zonal_batch_matching
+        self._excluded_movements = None
 
         self._matching_strategy = matching_strategy
         self._radius = radius
@@ -225,6 +271,8 @@ class OnDemandMobilityService(AbstractOnDemandMobilityService):
         """
         reqs = list(self.user_buffer.values())
         sorted_reqs = sorted(reqs)
+        # The plans may have been modified since the last matching
+        self.fleet.spatial_index.refresh_plan_ends()
         for req in sorted_reqs:
             user = req.user
             drop_node = req.drop_node
@@ -261,11 +309,11 @@ class OnDemandMobilityService(AbstractOnDemandMobilityService):
             log.error(f'Matching strategy {self.matching_strategy} unknown for {self.id} mobility service')
             sys.exit(-1)
         vehs = np.array(vehs)
+        vehs_indices = {veh.id: vidx for vidx, veh in enumerate(vehs)}
+        self.fleet.spatial_index.refresh_plan_ends()
 
-        ### Compute the pickup times matrix (for all req-veh pairs)
-        inf = 10e8 # will be applied when veh is out of request's radius or service time out of user's tolerance
-        pickup_times_matrix = np.full((len(reqs), len(vehs)), inf)
-        veh_paths_matrix = np.full((len(reqs), len(vehs)), None)
+        ### Compute the pickup times of the candidate req-veh pairs
+        inf = 10e8 # cost of leaving a request unmatched
 
         ## Gathers params for calling Dijkstra in parallel once
         ridxs = []
@@ -274,13 +322,12 @@ class OnDemandMobilityService(AbstractOnDemandMobilityService):
         destinations = []
         for ridx, req in enumerate(reqs):
             # Search for the vehicles close to the user at the end of their plan (within radius)
-            filter = PlanEndsInRadiusFilter(self.radius)
-            mask = filter.get_mask(self.layer, vehs, position=req.user.position)
-            nearest_vehs = vehs[mask]
-            nearest_vehs_indices = list(np.where(mask)[0])
+            nearest_vehs = [veh for veh in self.fleet.spatial_index.plan_ends_in_radius(req.user.position, self.radius)
+                            if veh.id in vehs_indices]
 
             # Compute estimated pickup time for the vehicles nearby
-            for vidx, veh in zip(nearest_vehs_indices, nearest_vehs):
+            for veh in nearest_vehs:
+                vidx = vehs_indices[veh.id]
                 veh_last_node = veh.activity.node if not veh.activities else \
                         veh.activities[-1].node
                 ridxs.append(ridx)
@@ -301,7 +348,11 @@ class OnDemandMobilityService(AbstractOnDemandMobilityService):
             log.error(f'HiPOP.Error: {ex}')
             sys.exit(-1)
 
-        ## Parse outputs and complete the pickup times and veh paths matrices
+        ## Parse outputs and keep the pairs within user's waiting tolerance
+        pairs_ridxs = []
+        pairs_vidxs = []
+        pairs_pickup_times = []
+        pairs_veh_paths = []
         for i in range(len(paths)):
             ridx = ridxs[i]
             req = reqs[ridx]
@@ -312,34 +363,94 @@ class OnDemandMobilityService(AbstractOnDemandMobilityService):
             if tt == float('inf'):
                 continue
             service_dt = Dt(seconds=tt)
-            if veh.activity is not None and veh.activity.activity_type is not ActivityType.STOP:
-                veh_curr_act_path_nodes = veh.path_to_nodes(veh.activity.path)
-                veh_curr_node_ind_in_path = veh_curr_act_path_nodes.index(veh.current_node) # NB: works only when an acticity path does not contain several times the same node
-                service_dt += Dt(seconds=compute_path_travel_time(veh.activity.path[veh_curr_node_ind_in_path+1:], self.gnodes, self.id))
-                current_link = self.gnodes[veh.current_node].adj[veh_curr_act_path_nodes[veh_curr_node_ind_in_path+1]]
-                service_dt += Dt(seconds=veh.remaining_link_length / current_link.costs[self.id]['speed'])
-            for a in veh.activities:
-                service_dt += Dt(seconds=compute_path_travel_time(a.path, self.gnodes, self.id))
+            service_dt += self.estimate_remaining_plan_duration(veh)
             # Apply user's waiting tolerance
             if service_dt < req.user.pickup_dt[self.id]:
-                pickup_times_matrix[ridx][vidx] = service_dt.to_seconds()
-                veh_paths_matrix[ridx][vidx] = veh_path
-
-        ### Solve the minimum total pickup time matching problem
-        row_ind, col_ind = linear_sum_assignment(pickup_times_matrix)
-
-        ### Parse outputs and proceed to the matches when relevant
-        for i in range(len(row_ind)):
-            req_ind = row_ind[i]
-            req = reqs[req_ind]
-            veh_ind = col_ind[i]
-            veh = vehs[veh_ind]
-            if pickup_times_matrix[req_ind][veh_ind] < inf:
-                veh_path = veh_paths_matrix[req_ind][veh_ind]
-                self._cache_request_vehicles[req.user.id] = veh, veh_path
-                self.matching(req, dt)
-                self.cancel_request(req.user.id)
-                self._cache_request_vehicles = dict()
+                pairs_ridxs.append(ridx)
+                pairs_vidxs.append(vidx)
+                pairs_pickup_times.append(service_dt.to_seconds())
+                pairs_veh_paths.append(veh_path)
+        pairs_ridxs = np.array(pairs_ridxs, dtype=np.int64)
+        pairs_vidxs = np.array(pairs_vidxs, dtype=np.int64)
+        pairs_pickup_times = np.array(pairs_pickup_times, dtype=np.float64)
+
+        ### Solve the minimum total pickup time matching problem on the candidate pairs
+        if self.zonal_batch_matching and len(self.zones) > 0:
+            # Only pair requests and vehicles ending their plan in the same zone, and solve zone per zone
+            reqs_zones = self.locate_in_zones([req.user.position for req in reqs])
+            vehs_zones = self.locate_in_zones([self.gnodes[veh.activity.node if not veh.activities else
+                                                           veh.activities[-1].node].position for veh in vehs])
+            pairs_zones = reqs_zones[pairs_ridxs]
+            # NB: requests and vehicles outside all zones form one more group, located at index len(self.zones)
+            same_zone = pairs_zones == vehs_zones[pairs_vidxs]
+            matched_pairs = []
+            for zidx in np.unique(pairs_zones[same_zone]):
+                zone_pairs = np.where(same_zone & (pairs_zones == zidx))[0]
+                matched_pairs.extend(zone_pairs[sparse_assignment(pairs_ridxs[zone_pairs], pairs_vidxs[zone_pairs],
+                    pairs_pickup_times[zone_pairs], inf)])
+            matched_pairs.sort(key=lambda i: pairs_ridxs[i])
+        else:
+            matched_pairs = sparse_assignment(pairs_ridxs, pairs_vidxs, pairs_pickup_times, inf)
+
+        ### Parse outputs and proceed to the matches
+        for i in matched_pairs:
+            req = reqs[pairs_ridxs[i]]
+            veh = vehs[pairs_vidxs[i]]
+            self._cache_request_vehicles[req.user.id] = veh, pairs_veh_paths[i]
+            self.matching(req, dt)
+            self.cancel_request(req.user.id)
+            self._cache_request_vehicles = dict()
+
+    def locate_in_zones(self, positions: List[List[float]]) -> np.ndarray:
+        """Method that finds the zone of this service in which positions are located.
+
+        Args:
+            -positions: the positions to locate
+
+        Returns:
+            -zones_indices: the index of the first zone containing each position, the
+             number of zones for the positions outside all zones
+        """
+        zones_indices = np.full(len(positions), len(self.zones), dtype=np.int64)
+        if len(positions) == 0:
+            return zones_indices
+        for zidx, z in reversed(list(enumerate(self.zones.values()))):
+            zones_indices[np.asarray(z.is_inside(positions), dtype=bool)] = zidx
+        return zones_indices
+
+    def compute_paths_to_user(self, origins: List[str], user: User) -> List[Tuple[List[str], float]]:
+        """Method that computes the shortest paths in travel time from the nodes of candidate
+        vehicles to the current node of a user.
+        With the reverse search, the paths are read from one search from the user's node,
+        paths longer than the user's pickup tolerance are not computed. The reverse search does
+        not apply turn restrictions, when the layer has some, the paths are computed with HiPOP.
+
+        Args:
+            -origins: the nodes of the candidate vehicles
+            -user: the user
+
+        Returns:
+            -paths: the list of nodes and the travel time of the path from each origin, the travel
+             time is infinite when there is no path or a path longer than the pickup tolerance
+        """
+        gnodes = self.gnodes or self.graph.nodes
+        if self._excluded_movements is None:
+            self._excluded_movements = any(n.exclude_movements for n in gnodes.values())
+        if self.reverse_search and not self._excluded_movements:
+            settled = reverse_dijkstra(gnodes, user.current_node, self.id, 'travel_time', origins,
+                                       user.pickup_dt[self.id].to_seconds())
+            return [reverse_dijkstra_path(settled, o) for o in origins]
+        try:
+            return parallel_dijkstra(self.graph,
+                                     origins,
+                                     [user.current_node]*len(origins),
+                                     [{self.layer.id: self.id}]*len(origins),
+                                     'travel_time',
+                                     multiprocessing.cpu_count(),
+                                     [{self.layer.id}]*len(origins))
+        except ValueError as ex:
+            log.error(f'HiPOP.Error: {ex}')
+            sys.exit(-1)
 
     def request_nearest_idle_vehicle_in_radius_fifo(self, user: User, drop_node: str) -> Dt:
         """The nearest (in time) idle vehicle located within a certain radius around the
@@ -354,10 +465,9 @@ class OnDemandMobilityService(AbstractOnDemandMobilityService):
             -service_dt: waiting time before pick-up
         """
         # Get all idle vehicles of the fleet within radius around user
-        filter = IsIdle() & InRadiusFilter(self.radius)
-        all_vehs = self.get_all_vehicles()
-        mask = filter.get_mask(self.layer, all_vehs, position=user.position)
-        idle_vehs_in_radius = all_vehs[mask]
+        vehs_in_radius = self.fleet.spatial_index.vehicles_in_radius(user.position, self.radius)
+        mask = IsIdle(self.fleet).get_mask(self.layer, vehs_in_radius, position=user.position)
+        idle_vehs_in_radius = [veh for veh, is_idle in zip(vehs_in_radius, mask) if is_idle]
         if len(idle_vehs_in_radius) == 0:
             # There is no idle vehicle in radius, match is not possible
             return Dt(hours=24)
@@ -381,17 +491,7 @@ class OnDemandMobilityService(AbstractOnDemandMobilityService):
                 paths.append((veh_path, tt))
         else:
             # Let's compute the shortest paths
-            try:
-                paths = parallel_dijkstra(self.graph,
-                                        origins,
-                                        destinations,
-                                        [{self.layer.id: self.id}]*len(origins),
-                                        'travel_time',
-                                        multiprocessing.cpu_count(),
-                                        [{self.layer.id}]*len(origins))
-            except ValueError as ex:
-                log.error(f'HiPOP.Error: {ex}')
-                sys.exit(-1)
+            paths = self.compute_paths_to_user(origins, user)
 
         # Gather valid candidates
         candidates = []
@@ -426,38 +526,23 @@ class OnDemandMobilityService(AbstractOnDemandMobilityService):
             -service_dt: waiting time before pick-up
         """
         # Get all vehicles of the fleet within radius around user at the end of their plan
-        filter = PlanEndsInRadiusFilter(self.radius)
-        all_vehs = self.get_all_vehicles()
-        mask = filter.get_mask(self.layer, all_vehs, position=user.position)
-        vehs_in_radius = all_vehs[mask]
+        vehs_in_radius = self.fleet.spatial_index.plan_ends_in_radius(user.position, self.radius)
         if len(vehs_in_radius) == 0:
             # There is no vehicle in radius at the end of their plan
             return Dt(hours=24)
 
         # Compute service time for these vehs
         candidates = []
-        for veh in vehs_in_radius:
-            veh_last_node = veh.activity.node if not veh.activities else \
-                    veh.activities[-1].node
-            try:
-                veh_path, tt = dijkstra(self.graph, veh_last_node, user.current_node, 'travel_time', {self.layer.id: self.id}, {self.layer.id})
-            except ValueError as ex:
-                log.error(f'HiPOP.Error: {ex}')
-                sys.exit(-1)
+        vehs_last_nodes = [veh.activity.node if not veh.activities else veh.activities[-1].node for veh in vehs_in_radius]
+        paths = self.compute_paths_to_user(vehs_last_nodes, user)
+        for veh, (veh_path, tt) in zip(vehs_in_radius, paths):
             # If vehicle cannot reach user, skip and consider next vehicle
             if tt == float('inf'):
                 continue
 
             # Compute the estimated pickup time including end of current vehicle's plan plus the pickup activity for user
             service_dt = Dt(seconds=tt)
-            if veh.activity is not None and veh.activity.activity_type is not ActivityType.STOP:
-                veh_curr_act_path_nodes = veh.path_to_nodes(veh.activity.path)
-                veh_curr_node_ind_in_path = veh_curr_act_path_nodes.index(veh.current_node) # NB: works only when an acticity path does not contain several times the same node
-                service_dt += Dt(seconds=compute_path_travel_time(veh.activity.path[veh_curr_node_ind_in_path+1:], self.gnodes, self.id))
-                current_link = self.gnodes[veh.current_node].adj[veh_curr_act_path_nodes[veh_curr_node_ind_in_path+1]]
-                service_dt += Dt(seconds=veh.remaining_link_length / current_link.costs[self.id]['speed'])
-            for a in veh.activities:
-                service_dt += Dt(seconds=compute_path_travel_time(a.path, self.gnodes, self.id))
+            service_dt += self.estimate_remaining_plan_duration(veh)
             candidates.append((veh, service_dt, veh_path))
 
         # Select the veh with the smallest service time
@@ -566,13 +651,16 @@ class OnDemandMobilityService(AbstractOnDemandMobilityService):
                 "DEFAULT_WAITING_TIME": self.default_waiting_time,
                 "MATCHING_STRATEGY": self.matching_strategy,
                 "RADIUS": self.radius,
-                "DETOUR_RATIO": self.detour_ratio}
+                "DETOUR_RATIO": self.detour_ratio,
+                "REVERSE_SEARCH": self.reverse_search,
+                "ZONAL_BATCH_MATCHING": self.zonal_batch_matching}
 
     @classmethod
     def __load__(cls, data):
         new_obj = cls(data['ID'], data['DT_MATCHING'], data['DT_PERIODIC_MAINTENANCE'],
             data['DEFAULT_WAITING_TIME'], data['MATCHING_STRATEGY'], data['RADIUS'],
-            data['DETOUR_RATIO'])
+            data['DETOUR_RATIO'], data.get('REVERSE_SEARCH', True),
+            data.get('ZONAL_BATCH_MATCHING', False))
         return new_obj
 
 
@@ -584,9 +672,12 @@ class OnDemandDepotMobilityService(OnDemandMobilityService, AbstractOnDemandDepo
                  default_waiting_time: float = 0,
                  matching_strategy: str = 'nearest_idle_vehicle_in_radius_fifo',
                  radius: float = 10000,
-                 detour_ratio: float = 1.343):
+                 detour_ratio: float = 1.343,
+                 reverse_search: bool = True,
+                 zonal_batch_matching: bool = False):
         super(OnDemandDepotMobilityService, self).__init__(id, dt_matching, dt_periodic_maintenance=dt_periodic_maintenance,
-            matching_strategy=matching_strategy, radius=radius, detour_ratio=detour_ratio, default_waiting_time=default_waiting_time)
+            matching_strategy=matching_strategy, radius=radius, detour_ratio=detour_ratio, default_waiting_time=default_waiting_time,
+            reverse_search=reverse_search, zonal_batch_matching=zonal_batch_matching)
         #NB: super is the first mother class, do not init the second mother class because
         #    it contains the same attributes except depots
         self.gnodes = None
@@ -704,11 +795,14 @@ class OnDemandDepotMobilityService(OnDemandMobilityService, AbstractOnDemandDepo
                 "DEFAULT_WAITING_TIME": self.default_waiting_time,
                 "MATCHING_STRATEGY": self.matching_strategy,
                 "RADIUS": self.radius,
-                "DETOUR_RATIO": self.detour_ratio}
+                "DETOUR_RATIO": self.detour_ratio,
+                "REVERSE_SEARCH": self.reverse_search,
+                "ZONAL_BATCH_MATCHING": self.zonal_batch_matching}
 
     @classmethod
     def __load__(cls, data):
         new_obj = cls(data['ID'], data["DT_MATCHING"], data["DT_PERIODIC_MAINTENANCE"],
             data['DEFAULT_WAITING_TIME'], data['MATCHING_STRATEGY'], data['RADIUS'],
-            data['DETOUR_RATIO'])
+            data['DETOUR_RATIO'], data.get('REVERSE_SEARCH', True),
+            data.get('ZONAL_BATCH_MATCHING', False))
         return new_obj
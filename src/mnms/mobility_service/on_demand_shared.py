@@ -12,9 +12,9 @@ from mnms import create_logger
 from mnms.demand import User
 from mnms.demand.horizon import AbstractDemandHorizon
 from mnms.graph.zone import Zone
-from mnms.mobility_service.abstract import AbstractOnDemandMobilityService, compute_path_travel_time, Request
+from mnms.mobility_service.abstract import AbstractOnDemandMobilityService, Request
 from mnms.mobility_service.interfaces import Depot
-from mnms.mobility_service.filters import FilterProtocol, IsWaiting, InRadiusFilter
+from mnms.mobility_service.filters import FilterProtocol, IsWaiting
 from mnms.time import Dt, Time
 from mnms.tools.exceptions import PathNotFound
 from mnms.vehicles.custom_veh_type import Vehicle, VehicleActivity, ActivityType, VehicleActivityStop, VehicleActivityPickup, \
@@ -231,10 +231,7 @@ class OnDemandSharedMobilityService(AbstractOnDemandMobilityService):
         service_dt = Dt(hours=24)
 
         ## Get the vehicles currently within radius around user
-        vehs = self.get_all_vehicles()
-        filter = InRadiusFilter(self.radius)
-        mask = filter.get_mask(self.layer, vehs, position=user.position)
-        vehs_in_radius = vehs[mask]
+        vehs_in_radius = self.fleet.spatial_index.vehicles_in_radius(user.position, self.radius)
 
         ## Compute disutility of adding user's pickup and dropoff activities
         #  in each vehicle in radius
@@ -243,6 +240,10 @@ class OnDemandSharedMobilityService(AbstractOnDemandMobilityService):
         veh_new_plan = dict()
         for veh in vehs_in_radius:
             if self.able_to_serve_new_request(veh):
+                # Cache the durations of the current activities, they are reused by their copies in the new plan
+                for a in [veh.activity] + list(veh.activities):
+                    if a is not None:
+                        self.activity_duration(a)
                 activities = [VehicleActivityPickup(node=user.current_node,
                                                     user=user),
                               VehicleActivityServing(node=drop_node,
@@ -278,12 +279,12 @@ class OnDemandSharedMobilityService(AbstractOnDemandMobilityService):
         Returns:
             -pickup_time: the estimated pick-up time
         """
-        pickup_time = Dt()
+        pickup_ticks = 0
         for a in plan:
-            pickup_time += Dt(seconds=compute_path_travel_time(a.path, self.gnodes, self.id))
+            pickup_ticks += self.activity_duration(a)
             if isinstance(a, VehicleActivityPickup) and a.user == user:
                 break
-        return pickup_time
+        return Dt.from_ticks(pickup_ticks)
 
     def replanning(self, veh: Vehicle, new_activities: List[VehicleActivity]) -> List[VehicleActivity]:
         """Method that inserts new activities in vehicle's plan.
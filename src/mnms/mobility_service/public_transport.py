@@ -703,7 +703,7 @@ class PublicTransportMobilityService(AbstractMobilityService):
     def estimate_pickup_time_for_planning(self, pu_node):
         """Method that returns the estimated pickup time for a specific public transport
         node. The estimated pick up time corresponds to the headway of the line serving
-        the node divided by 2.
+        the node at the current time divided by 2.
 
         Args:
             -pu_node: pickup node
@@ -712,7 +712,7 @@ class PublicTransportMobilityService(AbstractMobilityService):
             -estimated_pickup_time: estimated pickup time in seconds
         """
         _, chosen_line = self.find_line(pu_node)
-        estimated_pickup_time = chosen_line['table'].get_freq() / 2
+        estimated_pickup_time = chosen_line['table'].get_freq(self._tcurrent) / 2
         return estimated_pickup_time
 
     def periodic_maintenance(self, dt: Dt):
@@ -10,6 +10,8 @@ import numpy as np
 
 from mnms.congestion_model import CongestionModel
 from mnms.demand import User
+from mnms.demand.user import UserPathIndex
+from mnms.demand.departures import DepartureQueue
 from mnms.graph.dynamic_space_sharing import DynamicSpaceSharing
 from mnms.graph.layers import MultiLayerGraph
 from mnms.flow.abstract import AbstractMFDFlowMotor
@@ -20,6 +22,7 @@ from mnms.mobility_service.public_transport import PublicTransportMobilityServic
 from mnms.time import Time, Dt
 from mnms.log import create_logger, attach_log_file, LOGLEVEL
 from mnms.tools.progress import ProgressBar
+from mnms.tools.profiling import TimingRegistry
 from mnms.vehicles.manager import VehicleManager
 from mnms.vehicles.veh_type import Vehicle, ActivityType
 
@@ -35,7 +38,9 @@ class Supervisor(object):
                  user_flow: UserFlow = None,
                  outfile: Optional[str] = None,
                  logfile: Optional[str] = None,
-                 loglevel: LOGLEVEL = LOGLEVEL.WARNING):
+                 loglevel: LOGLEVEL = LOGLEVEL.WARNING,
+                 timingsfile: Optional[str] = None,
+                 timings: bool = False):
         """
         Main class to launch a simulation.
 
@@ -49,6 +54,11 @@ class Supervisor(object):
                       of each link in the multi layer graph
             -logfile: file where simulation log should be printed
             -loglevel: level of log to print
+            -timingsfile: If not None write the timings of the simulation phases in this
+                          file at the end of the simulation, in JSON if it ends with .json
+                          and in CSV otherwise
+            -timings: If True record the timings of the simulation phases in self.timings,
+                      forced to True when timingsfile is not None
         """
 
         self._mlgraph: MultiLayerGraph = None
@@ -78,6 +88,9 @@ class Supervisor(object):
         if logfile is not None:
             attach_log_file(logfile, loglevel)
 
+        self._timingsfile = timingsfile
+        self.timings = TimingRegistry(enabled=timings or timingsfile is not None)
+
     def set_random_seed(self, seed: int):
         """Method that sets the seed for all modules that can be stochastic.
 
@@ -158,6 +171,9 @@ class Supervisor(object):
         if self._decision_model._write:
             self._decision_model._outfile.close()
 
+        if self._decision_model.route_cache is not None and self._decision_model.route_cache_file is not None:
+            self._decision_model.save_route_cache()
+
         if self._write:
             self._outfile.close()
 
@@ -170,17 +186,23 @@ class Supervisor(object):
                 if mservice._observer is not None:
                     mservice._observer.finish()
 
+        if self._timingsfile is not None:
+            self.timings.write(self._timingsfile)
+
         # Clean the class attributes
         VehicleManager.empty()
         Vehicle.reset_counter()
+        UserPathIndex.empty()
 
     def call_planning(self):
         """Calls the (re)planning module and measures execution time.
         """
         log.info('Launch (re)planning...')
         start = time()
+        nb_users = len(self._decision_model._users_for_planning)
         self._decision_model(self.tcurrent)
         end = time()
+        self.timings.record('planning', end - start, nb_users)
         log.info(f'(Re)planning done in [{end - start:.5} s]')
 
     def call_update_graph(self, threshold):
@@ -190,6 +212,7 @@ class Supervisor(object):
         start = time()
         self._flow_motor.update_graph(threshold)
         end = time()
+        self.timings.record('update_graph', end - start)
         log.info(f' Update graph done in [{end-start:.5} s]')
 
     def call_update_mobility_services(self, flow_dt:Dt):
@@ -206,6 +229,7 @@ class Supervisor(object):
                 mservice.update(flow_dt)
                 mservice.update_time(flow_dt)
                 end = time()
+                self.timings.record('update_mobility_service', end - start, component=mservice.id)
                 log.info(f' Update mobility service {mservice.id} done in [{end-start:.5} s]')
 
     def call_user_flow_step(self, flow_dt: Dt, users_step: List[User]):
@@ -223,6 +247,7 @@ class Supervisor(object):
         users_reach_dt_answer = self._user_flow.step(flow_dt, users_step)
         self._user_flow.update_time(flow_dt)
         end = time()
+        self.timings.record('user_flow_step', end - start, len(users_step))
         log.info(f' User flow step done [{end - start:.5} s]')
         return users_reach_dt_answer
 
@@ -238,8 +263,10 @@ class Supervisor(object):
             for ms in layer.mobility_services.values():
                 log.info(f' Perform matching for mobility service {ms.id}...')
                 start = time()
+                nb_requests = len(ms.user_buffer)
                 ms.launch_matching(new_users, self._user_flow, self._decision_model, flow_dt)
                 end = time()
+                self.timings.record('matching', end - start, nb_requests, component=ms.id)
                 log.info(f' Matching for mobility service {ms.id} done in [{end - start:.5} s]')
 
     def call_flow_motor_step(self, flow_dt: Dt):
@@ -253,6 +280,7 @@ class Supervisor(object):
         users_to_replan = self._flow_motor.step(flow_dt)
         self._flow_motor.update_time(flow_dt)
         end = time()
+        self.timings.record('flow_motor_step', end - start, self._flow_motor.nb_moving_vehicles)
         log.info(f' Flow motor step done in [{end - start:.5} s]')
         return users_to_replan
 
@@ -262,7 +290,9 @@ class Supervisor(object):
         """
         # Call the dynamic space sharing update to unban and ban links when relevant, and reroute
         # vehicles consequently
+        start = time()
         self._mlgraph.dynamic_space_sharing.update(self.tcurrent, list(VehicleManager._vehicles.values()))
+        self.timings.record('dynamic_space_sharing', time() - start)
 
     def get_new_users(self, principal_dt):
         """Gathers/Creates the users who depart during the coming affectation step.
@@ -274,41 +304,30 @@ class Supervisor(object):
             -new_users: list of users who depart during the coming affectation step
         """
         log.info(f'Getting next departures {self.tcurrent}->{self.tcurrent.add_time(principal_dt)} ...')
+        start = time()
         new_users = []
         if self._demand:
             new_users = self._demand.get_next_departures(self.tcurrent, self.tcurrent.add_time(principal_dt))
             self._demand.construct_user_parameters(new_users)
+        self.timings.record('get_new_users', time() - start, len(new_users))
         log.info(f'Getting next departures done: {len(new_users)} new departures')
 
         return new_users
 
-    def get_users_step(self, new_users: List[User], flow_dt: Dt):
+    def get_users_step(self, new_users: DepartureQueue, flow_dt: Dt):
         """Gathers the users who depart during the coming simulation flow step.
 
         Args:
-            -new_users: list of users who depart during the coming affectation step
+            -new_users: queue of the users who depart during the coming affectation step
             -flow_dt: the simulation flow time step
 
         Returns:
             -users_step: list of users who depart during the coming simulation flow step
-            -remaining_new_users: list of users who depart during the coming affectation step without
+            -remaining_new_users: queue of the users who depart during the coming affectation step without
                         users who depart during the coming simulation flow step
         """
-        if new_users == []:
-            return [], []
-        next_time = self.tcurrent.add_time(flow_dt)
-        iter_new_users = iter(new_users)
-        u = next(iter_new_users)
-        users_step = list()
-        remaining_new_users = new_users.copy()
-        try:
-            while self.tcurrent <= u.departure_time < next_time:
-                users_step.append(u)
-                remaining_new_users.remove(u)
-                u = next(iter_new_users)
-        except StopIteration:
-            pass
-        return users_step, remaining_new_users
+        users_step = new_users.pop_until(self.tcurrent.add_time(flow_dt))
+        return users_step, new_users
 
     def run(self, tstart: Time, tend: Time, flow_dt: Dt, affectation_factor: int, update_graph_threshold: float = 0., seed: int=None):
         """Launch a full simulation.
@@ -332,14 +351,14 @@ class Supervisor(object):
         self.tcurrent = tstart
         progress = ProgressBar(ceil((tend-tstart).to_seconds()/(flow_dt.to_seconds()*affectation_factor)))
         cm = CongestionModel.get_instance()
-        f = open(f'OUTPUTS{os.sep}congestion_file.csv', 'w')
-        f.write('TIMESTAMP,VEHICLE ID,PASSENGERS,CAPACITY,CONGESTION INDEX,NODE\n')
+        cm.open_output(f'OUTPUTS{os.sep}congestion_file.csv')
 
         ### Main loop
         while self.tcurrent < tend:
             progress.update()
             progress.show()
             log.info(f'Current time: {self.tcurrent}, affectation step: {affectation_step}')
+            self.timings.set_affectation_step(affectation_step)
 
             ## Get all departures during the next principal_dt and add the ones
             ## with no forced path in the list of users about to plan their journey
@@ -357,6 +376,7 @@ class Supervisor(object):
             for user in new_users:
                 for pt_ms in pt_mob_services_names:
                     user.set_pickup_dt(pt_ms, Dt(hours=24))
+            new_users = DepartureQueue(new_users)
 
             ## Call affectation_factor simulation flow steps
             for _ in range(affectation_factor):
@@ -398,24 +418,10 @@ class Supervisor(object):
                 self.tcurrent = self.tcurrent.add_time(flow_dt)
                 flow_step += 1
 
-                for vehicle_id in VehicleManager._vehicles:
-                    passengers = len(VehicleManager._vehicles[vehicle_id].passengers)
-                    capacity = VehicleManager._vehicles[vehicle_id].capacity
-                    CI = passengers/capacity
-                    node = VehicleManager._vehicles[vehicle_id].current_node
-                    if (VehicleManager._vehicles[vehicle_id].activity_type != ActivityType.REPOSITIONING and
-                            VehicleManager._vehicles[vehicle_id].activity_type != ActivityType.STOP):
-                        cm.update_congestion_model({
-                                                'TIMESTAMP': [str(self.tcurrent)],
-                                                'VEHICLE ID': [vehicle_id],
-                                                'PASSENGERS': [passengers],
-                                                'CAPACITY': [capacity],
-                                                'CONGESTION INDEX': [CI],
-                                                'NODE': [node]
-                                                })
-                        #cm.write_congestion('OUTPUTS')
-                        # ##Write here only because simulation crashes##
-                        f.write(f'{str(self.tcurrent)},{vehicle_id},{passengers},{capacity},{CI},{node}\n')
+                # Register the load of the vehicles serving users in the congestion model
+                cm.ingest_step(self.tcurrent, (veh for veh in VehicleManager._vehicles.values()
+                                               if veh.activity_type is not ActivityType.REPOSITIONING
+                                               and veh.activity_type is not ActivityType.STOP))
 
             ## Call the update graph
             self.call_update_graph(update_graph_threshold)
@@ -428,6 +434,7 @@ class Supervisor(object):
                     for mservice, costs in link.costs.items():
                         self._csvhandler.writerow([str(affectation_step), t_str, link.id, mservice, costs])
                 end = time()
+                self.timings.record('write_costs', end - start)
                 log.info(f'Done [{end - start:.5} s]')
 
             ## Update affectation step number
@@ -435,7 +442,7 @@ class Supervisor(object):
             affectation_step += 1
 
         ### Finalize simulation
-        f.close()
+        cm.close_output()
         cm.write_congestion('OUTPUTS')
         if self._user_flow._write:
             self._user_flow.write_result()
@@ -1,6 +1,5 @@
 import logging
 import sys
-from decimal import Decimal
 from typing import List
 
 import numpy as np
@@ -10,13 +9,25 @@ from mnms.log import create_logger
 log = create_logger(__name__)
 
 
+TICKS_PER_SECOND = 1000
+_TICKS_PER_MINUTE = 60 * TICKS_PER_SECOND
+_TICKS_PER_HOUR = 60 * _TICKS_PER_MINUTE
+
+
+def _seconds_to_ticks(seconds) -> int:
+    return int(round(seconds * TICKS_PER_SECOND))
+
+
 class Dt(object):
+    __slots__ = ('_ticks',)
+
     def __init__(self,
                  hours: int = 0,
                  minutes: int = 0,
                  seconds: float = 0):
         """
-        Class representing a delta time
+        Class representing a delta time, stored as an integer number of ticks
+        (see TICKS_PER_SECOND)
 
 
         Args:
@@ -28,90 +39,114 @@ class Dt(object):
         assert minutes >= 0
         assert seconds >= 0
 
-        new_seconds = Decimal(seconds)%60
-        new_minutes = minutes + seconds//60
-        hours = hours + new_minutes//60
-        minutes = new_minutes%60
-        seconds = new_seconds%60
+        self._ticks = int(hours) * _TICKS_PER_HOUR + int(minutes) * _TICKS_PER_MINUTE + _seconds_to_ticks(seconds)
+
+    @classmethod
+    def from_ticks(cls, ticks: int) -> "Dt":
+        """
+        Build a Dt instance from a number of ticks
+        Args:
+            ticks: The number of ticks
+
+        Returns:
+            Dt instance
+
+        """
+        assert ticks >= 0, f"{ticks}"
+        dt = cls.__new__(cls)
+        dt._ticks = ticks
+        return dt
+
+    @property
+    def ticks(self) -> int:
+        return self._ticks
+
+    @property
+    def _hours(self) -> int:
+        return self._ticks // _TICKS_PER_HOUR
+
+    @property
+    def _minutes(self) -> int:
+        return self._ticks % _TICKS_PER_HOUR // _TICKS_PER_MINUTE
 
-        self._hours = int(hours)
-        self._minutes = int(minutes)
-        self._seconds = Decimal(seconds)
+    @property
+    def _seconds(self) -> float:
+        return self._ticks % _TICKS_PER_MINUTE / TICKS_PER_SECOND
 
     def __mul__(self, other:int):
-        seconds = self._seconds*other
-        minutes = int(self._minutes*other)
-        hours = int(self._hours*other)
-        return Dt(hours, minutes, seconds)
+        return Dt.from_ticks(int(round(self._ticks * other)))
 
     def __add__(self, other):
-        seconds = self._seconds+other._seconds
-        minutes = int(self._minutes+other._minutes)
-        hours = int(self._hours+other._hours)
-        return Dt(hours, minutes, seconds)
+        return Dt.from_ticks(self._ticks + other._ticks)
 
     def __sub__(self, other):
-        seconds = self._seconds-other._seconds
-        minutes = int(self._minutes-int(other._minutes))
-        hours = int(self._hours-int(other._hours))
-        if seconds < 0:
-            seconds = 60 + seconds
-            minutes -= 1
-        if minutes < 0:
-            minutes = 60 + seconds
-            hours -= 1
-
-        return Dt(hours, minutes, seconds)
+        return Dt.from_ticks(self._ticks - other._ticks)
 
     def __repr__(self):
         return f"dt(hours:{self._hours}, minutes:{self._minutes}, seconds:{self._seconds})"
 
     def __eq__(self, other):
-        return self.to_seconds() == other.to_seconds()
+        return self._ticks == other._ticks
+
+    def __hash__(self):
+        return hash(self._ticks)
 
     def __lt__(self, other):
-        return self.to_seconds() < other.to_seconds()
+        return self._ticks < other._ticks
 
     def __le__(self, other):
-        return self.to_seconds() <= other.to_seconds()
+        return self._ticks <= other._ticks
 
     def __gt__(self, other):
-        return self.to_seconds() > other.to_seconds()
+        return self._ticks > other._ticks
 
     def __ge__(self, other):
-        return self.to_seconds() >= other.to_seconds()
+        return self._ticks >= other._ticks
 
     def to_seconds(self):
-        return float(int(self._hours * 3600) + int(self._minutes * 60) + self._seconds)
+        return self._ticks / TICKS_PER_SECOND
 
     def copy(self):
-        copy = Dt()
-        copy._hours = self._hours
-        copy._minutes = self._minutes
-        copy._seconds = self._seconds
-        return copy
+        return Dt.from_ticks(self._ticks)
 
 
 class Time(object):
+    __slots__ = ('_ticks', '_str')
+
     def __init__(self, strdate: str = "00:00:00"):
         """
-        Class representing time in mnms
+        Class representing time in mnms, stored as an integer number of ticks
+        (see TICKS_PER_SECOND) since midnight
 
         Args:
             strdate: A string representing a time with the format HH:MM:SS
         """
-        self._hours = None
-        self._minutes = None
-        self._seconds = None
+        self._ticks = 0
+        self._str = None
 
         if strdate != "":
             self._str_to_floats(strdate)
 
     def _str_to_floats(self, date):
         split_string = date.split(':')
-        self._hours = Decimal(split_string[0])
-        self._minutes = Decimal(split_string[1])
-        self._seconds = Decimal(split_string[2])
+        self._ticks = int(split_string[0]) * _TICKS_PER_HOUR + int(split_string[1]) * _TICKS_PER_MINUTE \
+            + _seconds_to_ticks(float(split_string[2]))
+
+    @classmethod
+    def from_ticks(cls, ticks: int) -> "Time":
+        """
+        Build a Time instance from a number of ticks
+        Args:
+            ticks: The number of ticks since midnight
+
+        Returns:
+            Time instance
+
+        """
+        time = cls.__new__(cls)
+        time._ticks = ticks
+        time._str = None
+        return time
 
     def to_seconds(self) -> float:
         """
@@ -121,7 +156,7 @@ class Time(object):
             Seconds
 
         """
-        return float(self._hours*3600+self._minutes*60+self._seconds)
+        return self._ticks / TICKS_PER_SECOND
 
     @classmethod
     def from_seconds(cls, seconds: float) -> "Time":
@@ -134,13 +169,8 @@ class Time(object):
             Time instance
 
         """
-        time = cls('')
-        m, s = divmod(seconds, 60)
-        h, m = divmod(m, 60)
-        time._seconds = s
-        time._minutes = int(m)
-        time._hours = int(h)
-        if time._hours > 24 or time._hours == 24 and (time._minutes > 0 or time._seconds > 0):
+        time = cls.from_ticks(_seconds_to_ticks(seconds))
+        if time._ticks > 24 * _TICKS_PER_HOUR:
             log.warning(f'Return a time with more than 24 hours')
 
         return time
@@ -155,12 +185,7 @@ class Time(object):
         Returns:
             Time instance
         """
-        time = cls('')
-        time._seconds = dt._seconds
-        time._minutes = dt._minutes
-        time._hours = dt._hours
-
-        return time
+        return cls.from_ticks(dt._ticks)
 
     def __repr__(self):
         return f"Time({self.time})"
@@ -169,143 +194,175 @@ class Time(object):
         return self.time
 
     def __eq__(self, other):
-        return self.to_seconds() == other.to_seconds()
+        return self._ticks == other._ticks
+
+    def __hash__(self):
+        return hash(self._ticks)
 
     def __lt__(self, other):
-        return self.to_seconds() < other.to_seconds()
+        return self._ticks < other._ticks
 
     def __le__(self, other):
-        return self.to_seconds() <= other.to_seconds()
+        return self._ticks <= other._ticks
 
     def __gt__(self, other):
-        return self.to_seconds() > other.to_seconds()
+        return self._ticks > other._ticks
 
     def __ge__(self, other):
-        return self.to_seconds() >= other.to_seconds()
+        return self._ticks >= other._ticks
 
     def __sub__(self, other):
-        return Dt(seconds=self.to_seconds()-other.to_seconds())
+        return Dt.from_ticks(self._ticks - other._ticks)
+
+    @property
+    def ticks(self) -> int:
+        return self._ticks
+
+    @property
+    def _hours(self) -> int:
+        return self._ticks // _TICKS_PER_HOUR
+
+    @property
+    def _minutes(self) -> int:
+        return self._ticks % _TICKS_PER_HOUR // _TICKS_PER_MINUTE
+
+    @property
+    def _seconds(self) -> float:
+        return self._ticks % _TICKS_PER_MINUTE / TICKS_PER_SECOND
 
     @property
     def seconds(self):
-        return float(self._seconds)
+        return self._seconds
 
     @seconds.setter
     def seconds(self, value):
         assert value < 60
-        self._seconds = Decimal(value)
+        self._ticks += _seconds_to_ticks(value) - self._ticks % _TICKS_PER_MINUTE
+        self._str = None
 
     @property
     def minutes(self):
-        return int(self._minutes)
+        return self._minutes
 
     @minutes.setter
     def minutes(self, value):
         assert value < 60
-        self._minutes = Decimal(value)
+        self._ticks += (int(value) - self._minutes) * _TICKS_PER_MINUTE
+        self._str = None
 
     @property
     def hours(self):
-        return int(self._hours)
+        return self._hours
 
     @hours.setter
     def hours(self, value):
         assert value < 24
-        self._hours = Decimal(value)
+        self._ticks += (int(value) - self._hours) * _TICKS_PER_HOUR
+        self._str = None
 
     @property
     def time(self):
-        return f"{str(self._hours) if self._hours >= 10 else '0' + str(self._hours)}:{str(self._minutes) if self._minutes >= 10 else '0' + str(self._minutes)}:{str(round(self._seconds, 2)) if self._seconds >= 10 else '0' + str(round(self._seconds, 2))}"
+        if self._str is None:
+            self._str = f"{self._hours:02d}:{self._minutes:02d}:{self._seconds:05.2f}"
+        return self._str
 
     def add_time(self, dt: Dt):
-        new_seconds = self._seconds + Decimal(dt._seconds)
-        new_minutes = self._minutes + Decimal(dt._minutes) + Decimal(new_seconds//60)
-        new_seconds = new_seconds%60
-        hours = self._hours + Decimal(dt._hours) + Decimal(new_minutes//60)
-        new_minutes = new_minutes%60
-        new_seconds = new_seconds%60
-        assert hours <= 24
-
-        new_time = Time("")
-        new_time._hours = hours
-        new_time._minutes = new_minutes
-        new_time._seconds = new_seconds
-        return new_time
+        ticks = self._ticks + dt._ticks
+        assert ticks < 25 * _TICKS_PER_HOUR
+        return Time.from_ticks(ticks)
 
     def remove_time(self, dt:Dt):
-        new_seconds = self._seconds - Decimal(dt._seconds%60)
-        new_minutes = self._minutes - (Decimal(dt._minutes) + Decimal(dt._seconds//60))
-        hours = self._hours - (Decimal(dt._hours) + Decimal(new_minutes//60))
-        new_minutes = new_minutes%60
-        new_seconds = new_seconds%60
-        if new_seconds < 0:
-            n = -new_seconds//60 + 1
-            new_seconds = 60*n + new_seconds%60
-            new_minutes -= n
-        if new_minutes < 0:
-            n = -new_minutes // 60 +1
-            new_minutes = 60*n + new_minutes%60
-            hours -= n
-
-        assert new_seconds >= 0, f"{new_seconds}"
-        assert new_minutes >= 0, f"{new_minutes}"
-        assert hours >= 0
-
-        new_time = Time("")
-        new_time._hours = hours
-        new_time._minutes = new_minutes
-        new_time._seconds = new_seconds
-        return new_time
+        ticks = self._ticks - dt._ticks
+        assert ticks >= 0, f"{ticks}"
+        return Time.from_ticks(ticks)
 
     def copy(self):
-        copy = Time()
-        copy._hours = self._hours
-        copy._minutes = self._minutes
-        copy._seconds = self._seconds
+        copy = Time.from_ticks(self._ticks)
+        copy._str = self._str
 
         return copy
 
 
 class TimeTable(object):
     def __init__(self, times: List[Time]=None):
-        self.table: List[Time] = times if times is not None else []
+        """
+        Class representing the departure times of a line, stored as a sorted
+        array of seconds
+
+        Args:
+            times: The departure times
+        """
+        seconds = [t.to_seconds() for t in times] if times is not None else []
+        self._set_departures(np.asarray(seconds, dtype=np.float64))
+
+    def _set_departures(self, departures: np.ndarray):
+        self.departures: np.ndarray = np.sort(departures)
+        self.headways: np.ndarray = np.diff(self.departures)
+        self._freq = float(np.mean(self.headways)) if len(self.headways) > 0 else None
+        self._table = None
+
+    @classmethod
+    def from_seconds(cls, departures) -> "TimeTable":
+        """
+        Build a TimeTable from departure times in seconds
+
+        Args:
+            departures: The departure times in seconds
+
+        Returns:
+            TimeTable instance
+        """
+        table = cls()
+        table._set_departures(np.asarray(departures, dtype=np.float64))
+        return table
+
+    @property
+    def table(self) -> List[Time]:
+        if self._table is None:
+            self._table = [Time.from_seconds(s) for s in self.departures]
+        return self._table
 
     @classmethod
     def create_table_freq(cls, start: str, end: str, dt:Dt):
-        assert dt._hours!=0 or dt._minutes!=0 or dt._seconds!=0
-        table = []
-        current_time = Time(start)
-        end_time = Time(end)
-        end_time_dt = end_time.remove_time(dt)
-        table.append(current_time)
-        while current_time <= end_time_dt:
-            ntime = current_time.add_time(dt)
-            table.append(ntime)
-            current_time = ntime
-        return cls(table)
+        assert dt._ticks != 0
+        start_ticks = Time(start)._ticks
+        end_ticks = max(Time(end)._ticks, start_ticks)
+        ticks = np.arange(start_ticks, end_ticks + 1, dt._ticks, dtype=np.int64)
+        return cls.from_seconds(ticks / TICKS_PER_SECOND)
 
     @classmethod
     def convert_table_freq(cls, departures: List[str]):
-        table = []
-        for departure in departures:
-            ntime = Time(departure)
-            table.append(ntime)
-        return cls(table)
+        return cls.from_seconds([Time(departure).to_seconds() for departure in departures])
 
     def get_next_departure(self, date):
-        for d in self.table:
-            if date < d:
-                return d
-
-    def get_freq(self):
-        if len(self.table) > 1:
-            waiting_times_seconds = [self.table[i+1].to_seconds()-self.table[i].to_seconds() for i in range(len(self.table)-1)]
-            return np.mean(waiting_times_seconds)
-        else:
+        ind = np.searchsorted(self.departures, date.to_seconds(), side='right')
+        if ind < len(self.departures):
+            return self.table[ind]
+
+    def get_freq(self, date: Time = None):
+        """
+        Returns the headway of the line. Without date, the mean headway over the
+        whole table, otherwise the headway of the departure interval containing date
+
+        Args:
+            date: The time of day at which the headway is evaluated
+
+        Returns:
+            The headway in seconds
+        """
+        if self._freq is None:
             log.warning("TimeTable has no Time and cant compute a frequency")
             return 24 * 60 * 60 # wait 24 hours at least
+        if date is None:
+            return self._freq
+        ind = np.searchsorted(self.departures, date.to_seconds(), side='right')
+        return float(self.headways[min(max(ind, 1), len(self.headways)) - 1])
+
+    def __len__(self):
+        return len(self.departures)
+
     def __add__(self, other):
-        return TimeTable(self.table + other.table)
+        return TimeTable.from_seconds(np.concatenate((self.departures, other.departures)))
 
     def __dump__(self):
         return [time.time for time in self.table]
@@ -0,0 +1,102 @@
+import csv
+import json
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from mnms.log import create_logger
+
+log = create_logger(__name__)
+
+_TYPE_KEY = Tuple[int, str, Optional[str]]
+
+
+class TimingRegistry(object):
+    def __init__(self, enabled: bool = False):
+        """
+        Registry of the execution times of the simulation phases. For each affectation
+        step, phase and (optional) component such as a mobility service, it records the
+        cumulated wall time, the number of calls and the number of items processed
+        (users planned, vehicles moved, requests matched, ...).
+
+        Args:
+            enabled: If False, nothing is recorded
+        """
+        self.enabled = enabled
+        self.affectation_step = 0
+        self._records: Dict[_TYPE_KEY, List[float]] = defaultdict(lambda: [0., 0, 0])
+
+    def set_affectation_step(self, step: int):
+        self.affectation_step = step
+
+    def record(self, phase: str, elapsed: float, items: int = 0, component: Optional[str] = None):
+        """Method that registers one call of a phase.
+
+        Args:
+            -phase: name of the phase
+            -elapsed: wall time of the call in seconds
+            -items: number of items processed during the call
+            -component: name of the component concerned by the call, e.g. a mobility service id
+        """
+        if not self.enabled:
+            return
+        rec = self._records[(self.affectation_step, phase, component)]
+        rec[0] += elapsed
+        rec[1] += 1
+        rec[2] += items
+
+    def clear(self):
+        self._records.clear()
+
+    def records(self, phase: Optional[str] = None, component: Optional[str] = None) -> List[dict]:
+        """Method that returns the registered timings, one dict per affectation step,
+        phase and component.
+
+        Args:
+            -phase: if not None, only return the records of this phase
+            -component: if not None, only return the records of this component
+
+        Returns:
+            -records: list of dict with keys AFFECTATION_STEP, PHASE, COMPONENT, WALL_TIME, CALLS, ITEMS
+        """
+        return [{'AFFECTATION_STEP': step, 'PHASE': ph, 'COMPONENT': comp,
+                 'WALL_TIME': rec[0], 'CALLS': rec[1], 'ITEMS': rec[2]}
+                for (step, ph, comp), rec in self._records.items()
+                if (phase is None or ph == phase) and (component is None or comp == component)]
+
+    def summary(self) -> Dict[Tuple[str, Optional[str]], dict]:
+        """Method that returns the timings cumulated over all affectation steps.
+
+        Returns:
+            -summary: dict (phase, component) -> dict with keys WALL_TIME, CALLS, ITEMS
+        """
+        summary = defaultdict(lambda: {'WALL_TIME': 0., 'CALLS': 0, 'ITEMS': 0})
+        for (_, phase, component), rec in self._records.items():
+            s = summary[(phase, component)]
+            s['WALL_TIME'] += rec[0]
+            s['CALLS'] += rec[1]
+            s['ITEMS'] += rec[2]
+        return dict(summary)
+
+    def to_csv(self, filename: str):
+        with open(filename, 'w') as f:
+            writer = csv.writer(f, delimiter=';', quotechar='|')
+            writer.writerow(['AFFECTATION_STEP', 'PHASE', 'COMPONENT', 'WALL_TIME', 'CALLS', 'ITEMS'])
+            for rec in self.records():
+                writer.writerow(rec.values())
+
+    def to_json(self, filename: str):
+        with open(filename, 'w') as f:
+            json.dump(self.records(), f, indent=2)
+
+    def write(self, filename: str):
+        """Method that writes the registered timings in JSON if filename ends with
+        .json, in CSV otherwise.
+
+        Args:
+            -filename: the output file
+        """
+        log.info(f'Writing simulation timings in {filename}')
+        if filename.endswith('.json'):
+            self.to_json(filename)
+        else:
+            self.to_csv(filename)
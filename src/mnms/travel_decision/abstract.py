@@ -1,12 +1,13 @@
 import sys
 from abc import ABC, abstractmethod
-from typing import List, Set, Dict, Callable, Tuple
+from typing import List, Set, Dict, Callable, Tuple, Optional
 from collections import defaultdict
 from enum import Enum
 import csv
 import multiprocessing
 import itertools
 import json
+import os
 
 import numpy as np
 from numpy.linalg import norm as _norm
@@ -18,6 +19,7 @@ from mnms.log import create_logger
 from mnms.time import Time
 from mnms.tools.dict_tools import sum_dict
 from mnms.tools.exceptions import PathNotFound
+from mnms.travel_decision.route_cache import RouteCache
 
 from hipop.shortest_path import parallel_k_shortest_path, parallel_k_intermodal_shortest_path, dijkstra, compute_path_length
 
@@ -44,7 +46,9 @@ class AbstractDecisionModel(ABC):
                  cost: str = 'travel_time',
                  thread_number: int = multiprocessing.cpu_count(),
                  mobility_services_graphs = None,
-                 save_routes_dynamically_and_reapply: bool = False):
+                 save_routes_dynamically_and_reapply: bool = False,
+                 route_cache_size: int = None,
+                 route_cache_file: str = None):
 
         """
         Base class for a travel decision model.
@@ -84,6 +88,10 @@ class AbstractDecisionModel(ABC):
                                                   for an origin, destination, and mode should be saved
                                                   dynamically and reapply for next departing users with
                                                   the same origin, destination and mode
+            -route_cache_size: maximum number of (origin, destination, mobility services) entries
+                               of the saved routes, unbounded if None
+            -route_cache_file: JSON file from which the saved routes are loaded if it exists, and
+                               in which they are written at the end of the simulation
         """
         self._considered_modes = considered_modes
         self._n_shortest_path = n_shortest_path
@@ -93,17 +101,29 @@ class AbstractDecisionModel(ABC):
         self._max_retry_to_find_k_paths = max_retry_to_find_k_paths
         self.personal_mob_service_park_radius = personal_mob_service_park_radius
         self._thread_number = thread_number
+        self._nb_shortest_path_queries = 0
+        self._nb_deduplicated_shortest_path_queries = 0
         self.mobility_services_graphs = mobility_services_graphs
         self.save_routes_dynamically_and_reapply = save_routes_dynamically_and_reapply
+        self.route_cache_file = route_cache_file
         if self.save_routes_dynamically_and_reapply:
-            self.saved_routes = {}
+            if route_cache_file is not None and os.path.isfile(route_cache_file):
+                self.route_cache = RouteCache.load(route_cache_file, route_cache_size)
+            else:
+                self.route_cache = RouteCache(route_cache_size)
+        else:
+            self.route_cache = None
 
         self._mlgraph = mlgraph
         self._cost = cost
         self._verbose_file = verbose_file
 
         self._refused_user: List[User] = list()
-        self._users_for_planning: List[Tuple[User, Event]] = list()
+        # Pickup time estimates and service level costs of the mobility services computed during
+        # the current (re)planning round, None outside of a round
+        self._planning_estimates: Dict[Tuple, object] = None
+        # Users who require a (re)planning and the event which triggered it, by user id in order of arrival
+        self._users_for_planning: Dict[str, Tuple[User, Event]] = dict()
         self._waiting_cost_functions = {'travel_time': lambda wt: wt}
         self._additional_cost_functions = defaultdict(lambda: lambda p,u: 0)
 
@@ -148,6 +168,20 @@ class AbstractDecisionModel(ABC):
     def path_choice(self, paths: List[Path], uid, tcurrent=None) -> Path:
         pass
 
+    def batch_path_choice(self, users_paths, tcurrent=None) -> Optional[Dict[str, Path]]:
+        """Method that proceeds to the selection of the paths of all users at once, decision
+        models which cannot choose in batch return None and choose user per user with path_choice.
+
+        Args:
+            -users_paths: dict with user id as key, and a dict as values
+             {'user': user object, 'paths': list of paths the user considers}
+            -tcurrent: current time
+
+        Returns:
+            -chosen_paths: dict with the path chosen by each user who has some paths, or None
+        """
+        return None
+
     @property
     def waiting_cost_functions(self):
         return self._waiting_cost_functions
@@ -185,15 +219,13 @@ class AbstractDecisionModel(ABC):
         """
         if users and events:
             assert len(users) == len(events), f'The list of users and events should have the same length.'
-            users_already_in_list = list(zip(*self._users_for_planning))
-            users_already_in_list = users_already_in_list[0] if users_already_in_list else []
-            users_events = []
+            users_for_planning = self._users_for_planning
             for u,e in zip(users, events):
-                if u in users_already_in_list:
+                # The first event which triggered the (re)planning of a user has priority
+                if u.id in users_for_planning:
                     log.warning(f'User {u.id} already undergone an event triggering a (re)planning, ignore new event {e}')
                 else:
-                    users_events.append((u,e))
-            self._users_for_planning.extend(users_events)
+                    users_for_planning[u.id] = (u,e)
 
     def manage_forced_initial_path(self, user):
         """Method that build the forced initial path of a user.
@@ -220,8 +252,6 @@ class AbstractDecisionModel(ABC):
         """
         personal_mob_services = set(self._mlgraph.get_all_mobility_services_of_type(PersonalMobilityService))
         odlayer = self._mlgraph.odlayer
-        origins_id = list(odlayer.origins.keys())
-        origins_pos = np.array([position for position in odlayer.origins.values()])
 
         new_planning_origins = {}
 
@@ -237,7 +267,7 @@ class AbstractDecisionModel(ABC):
                         user_far_from_personal_veh = _norm(np.array(parking_pos) - np.array(planning_origin)) > self.personal_mob_service_park_radius
                     else:
                         # User has not used her personal vehicle yet, check user position compared to her origin
-                        parking_node = u.origin if isinstance(u.origin, str) else origins_id[np.argmin(_norm(origins_pos - u.origin, axis=1))]
+                        parking_node = u.origin if isinstance(u.origin, str) else odlayer.nearest_origin(u.origin)
                         origin_pos = u.origin if isinstance(u.origin, np.ndarray) else gnodes[u.origin].position
                         user_far_from_personal_veh = _norm(np.array(origin_pos) - np.array(planning_origin)) > self.personal_mob_service_park_radius
                     if user_far_from_personal_veh:
@@ -281,7 +311,7 @@ class AbstractDecisionModel(ABC):
         personal_ms_planning_origins = {}
 
         ### Update the list of available_mobility_services for each user following the event
-        for u,e in self._users_for_planning:
+        for u,e in self._users_for_planning.values():
             ## If no mobility services graph for this user, apply the default rules
             if u.mobility_services_graph is None:
                 if e == Event.DEPARTURE:
@@ -337,7 +367,7 @@ class AbstractDecisionModel(ABC):
 
         ### Remove deadend users from the list for (re)planning
         for u,e in deadend_users:
-            self._users_for_planning.remove((u,e))
+            del self._users_for_planning[u.id]
             del users_paths[u.id]
 
         ### Return the eventual planning origins to consider for available personal mobility services
@@ -367,12 +397,12 @@ class AbstractDecisionModel(ABC):
         - chosen_mservices: list of dict with the mob service to take on each layer
         - nb_paths: list of the number of different paths that should be computed per mobility services combination
         """
-        # Retrieve keys (id) and values (pos) of all origins and destinations of odlayer
+        # Snap the coordinates origins and destinations of all users to the nodes of odlayer at once
         odlayer = self._mlgraph.odlayer
-        origins_id = list(odlayer.origins.keys())
-        origins_pos = np.array([position for position in odlayer.origins.values()])
-        destinations_id = list(odlayer.destinations.keys())
-        destinations_pos = np.array([position for position in odlayer.destinations.values()])
+        coord_origins_users = [u for u,_ in self._users_for_planning.values() if u.current_node is None and isinstance(u.origin, np.ndarray)]
+        snapped_origins = dict(zip([u.id for u in coord_origins_users], odlayer.nearest_origins([u.origin for u in coord_origins_users])))
+        coord_destinations_users = [u for u,_ in self._users_for_planning.values() if isinstance(u.destination, np.ndarray)]
+        snapped_destinations = dict(zip([u.id for u in coord_destinations_users], odlayer.nearest_destinations([u.destination for u in coord_destinations_users])))
 
         # Init lists
         uids = []
@@ -383,14 +413,14 @@ class AbstractDecisionModel(ABC):
         nb_paths = []
 
         # Loop on users requiring (re)planning
-        for u,_ in self._users_for_planning:
+        for u,_ in self._users_for_planning.values():
 
             ## Get origin of the (re)planning depending on users' state
             if u.state in [UserState.STOP, UserState.WAITING_ANSWER, UserState.WAITING_VEHICLE]:
                 if u.current_node is None:
                     # User has just departed from her origin, get the name of origin node
                     if isinstance(u.origin, np.ndarray):
-                        u_origin = origins_id[np.argmin(_norm(origins_pos - u.origin, axis=1))]
+                        u_origin = snapped_origins[u.id]
                     else:
                         u_origin = u.origin
                 else:
@@ -414,7 +444,7 @@ class AbstractDecisionModel(ABC):
 
             ## Get destination
             if isinstance(u.destination, np.ndarray):
-                u_destination = destinations_id[np.argmin(_norm(destinations_pos - u.destination, axis=1))]
+                u_destination = snapped_destinations[u.id]
             else:
                 u_destination = u.destination
 
@@ -507,6 +537,7 @@ class AbstractDecisionModel(ABC):
              {'user': user object, 'paths': list of paths the user considers}
         """
         gnodes = self._mlgraph.graph.nodes
+        chosen_paths = self.batch_path_choice(users_paths, tcurrent)
 
         for uid, d in users_paths.items():
             user = d['user']
@@ -514,7 +545,7 @@ class AbstractDecisionModel(ABC):
             event = d['event']
             if user_paths:
                 ## Some paths have been found
-                chosen_path = self.path_choice(user_paths, uid, tcurrent)
+                chosen_path = self.path_choice(user_paths, uid, tcurrent) if chosen_paths is None else chosen_paths[uid]
                 # print(f'User {user.id} chosen path {chosen_path}')
                 log.info(f"User {user.id} chose path {chosen_path} after {event} among {len(user_paths)} shortest paths for this round of (re)planning (state={user.state}).")
 
@@ -584,7 +615,7 @@ class AbstractDecisionModel(ABC):
                 self.manage_no_path_found(user, event, tcurrent)
 
             # Remove user from the list of users who need (re)planning
-            self._users_for_planning.remove((user,event))
+            del self._users_for_planning[uid]
 
     def manage_no_path_found(self, user, event, tcurrent):
         """Method that manages the case when no path was found for a user during
@@ -687,7 +718,7 @@ class AbstractDecisionModel(ABC):
                     # Path can be valid only if it does not pass several times per the same nodes
                     if (len(p[0]) == len(set(p[0]))):
                         if self.save_routes_dynamically_and_reapply:
-                            self.save_computed_route(p[0], chosen_mservices[i], intermodality)
+                            self.route_cache.add(p[0], self.cast_chosen_mservice_intermodality_to_str(chosen_mservices[i], intermodality))
                         p = Path(p[1], p[0]) # at this stage, p.path_cost contains the first stage cost
                         self.treat_path(p, chosen_mservices[i], user, gnodes)
                         # NB: we save this path even if equal to an already saved path, it is useful for testing purposes
@@ -714,13 +745,55 @@ class AbstractDecisionModel(ABC):
         path_mobservices = [chosen_mservice[layer_id] for layer_id,_ in p.layers]
         p.set_mobility_services(path_mobservices)
         # Second stage path cost computation = take into account waiting time
-        estim_waiting_time = sum([self._mlgraph.layers[layer].mobility_services[service].estimate_pickup_time_for_planning(p.nodes[node_inds][0]) for (layer, node_inds), service in zip(p.layers, p.mobility_services) if service != 'WALK'])
+        estim_waiting_time = sum([self.estimate_pickup_time(layer, service, p.nodes[node_inds][0]) for (layer, node_inds), service in zip(p.layers, p.mobility_services) if service != 'WALK'])
         p.increment_path_cost(self.waiting_cost_functions[self._cost](estim_waiting_time))
         # Third stage path cost computation = eventually add additional cost
         p.increment_path_cost(self.additional_cost_functions[self._cost](p, user))
-        service_costs = sum_dict(*(self._mlgraph.layers[layer].mobility_services[service].service_level_costs(p.nodes[node_inds]) for (layer, node_inds), service in zip(p.layers, p.mobility_services) if service != 'WALK'))
+        service_costs = sum_dict(*(self.service_level_costs(layer, service, p.nodes[node_inds]) for (layer, node_inds), service in zip(p.layers, p.mobility_services) if service != 'WALK'))
         p.service_costs = service_costs
 
+    def estimate_pickup_time(self, layer, service, pu_node):
+        """Method that returns the pickup time estimated by a mobility service at a node,
+        the estimate is computed once per (re)planning round.
+
+        Args:
+            -layer: the id of the layer of the mobility service
+            -service: the id of the mobility service
+            -pu_node: the pickup node
+
+        Returns:
+            -estimated pickup time in seconds
+        """
+        if self._planning_estimates is None:
+            return self._mlgraph.layers[layer].mobility_services[service].estimate_pickup_time_for_planning(pu_node)
+        key = ('PICKUP', layer, service, pu_node)
+        estimate = self._planning_estimates.get(key)
+        if estimate is None:
+            estimate = self._mlgraph.layers[layer].mobility_services[service].estimate_pickup_time_for_planning(pu_node)
+            self._planning_estimates[key] = estimate
+        return estimate
+
+    def service_level_costs(self, layer, service, nodes):
+        """Method that returns the costs of a mobility service on a leg,
+        the costs are computed once per (re)planning round.
+
+        Args:
+            -layer: the id of the layer of the mobility service
+            -service: the id of the mobility service
+            -nodes: the nodes of the leg
+
+        Returns:
+            -service_costs: dict of the costs of the service on this leg, it should not be modified
+        """
+        if self._planning_estimates is None:
+            return self._mlgraph.layers[layer].mobility_services[service].service_level_costs(nodes)
+        key = ('COSTS', layer, service, tuple(nodes))
+        costs = self._planning_estimates.get(key)
+        if costs is None:
+            costs = self._mlgraph.layers[layer].mobility_services[service].service_level_costs(nodes)
+            self._planning_estimates[key] = costs
+        return costs
+
     def __call__(self, tcurrent: Time):
         ### If no user require a (re)planning, do nothing
         log.info(f'There are {len(self._users_for_planning)} users that are going to (re)plan their journey')
@@ -728,7 +801,10 @@ class AbstractDecisionModel(ABC):
             return
 
         ### Some initializations
-        users_paths = {u.id: {'user': u, 'event': e, 'paths': []} for u,e in self._users_for_planning}
+        # The estimates of the mobility services are updated by their maintenance only, out of the
+        # (re)planning rounds, they are computed once for all the paths of this round
+        self._planning_estimates = dict()
+        users_paths = {u.id: {'user': u, 'event': e, 'paths': []} for u,e in self._users_for_planning.values()}
 
         ### Manage users after event
         personal_ms_planning_origins = self._manage_users_after_event(users_paths, tcurrent)
@@ -747,22 +823,7 @@ class AbstractDecisionModel(ABC):
                     uids, origins, destinations, available_layers, chosen_mservices, nb_paths, users_paths)
 
             ## Compute the shorest paths in parallel
-            try:
-                paths = parallel_k_shortest_path(self._mlgraph.graph,
-                                             origins,
-                                             destinations,
-                                             self._cost,
-                                             chosen_mservices,
-                                             available_layers,
-                                             self._max_diff_cost,
-                                             self._max_dist_in_common,
-                                             self._cost_multiplier_to_find_k_paths,
-                                             self._max_retry_to_find_k_paths,
-                                             nb_paths,
-                                             self._thread_number)
-            except ValueError as ex:
-                log.error(f'HiPOP.Error: {ex}')
-                sys.exit(-1)
+            paths = self.compute_shortest_paths(origins, destinations, available_layers, chosen_mservices, nb_paths)
 
             ## Parse the outputs of HiPOP and proceed to path selection
             users_paths = self.parse_paths(paths, uids, chosen_mservices, nb_paths, users_paths)
@@ -785,47 +846,119 @@ class AbstractDecisionModel(ABC):
                         uids, origins, destinations, available_layers, chosen_mservices, nb_paths, users_paths, intermodality=considered_mode[1])
 
                 ## Compute the shorest paths in parallel with the proper method
-                if considered_mode[1] is None:
-                    try:
-                        paths = parallel_k_shortest_path(self._mlgraph.graph,
-                                                        origins,
-                                                        destinations,
+                paths = self.compute_shortest_paths(origins, destinations, available_layers, chosen_mservices, nb_paths,
+                    intermodality=considered_mode[1])
+                ## Parse the outputs of HiPOP and proceed to path selection
+                users_paths = self.parse_paths(paths, uids, chosen_mservices, nb_paths, users_paths, intermodality=considered_mode[1])
+
+
+        ### Path selection
+        # Users' choices may modify the services state, estimates of this round are no longer valid
+        self._planning_estimates = None
+        self.path_selection(users_paths, tcurrent)
+
+    def deduplicate_shortest_path_inputs(self, origins, destinations, available_layers, chosen_mservices, nb_paths):
+        """Method that collapses the identical shortest path queries of a HiPOP call.
+        Two queries are identical when they have the same origin, destination, available layers,
+        chosen mobility services and number of paths, the intermodality being common to all the
+        queries of a call.
+
+        Args:
+            -origins: the list of origins of the queries
+            -destinations: the list of destinations of the queries
+            -available_layers: the list of available layers of the queries
+            -chosen_mservices: the list of chosen mobility services of the queries
+            -nb_paths: the list of number of paths to find of the queries
+
+        Returns:
+            -unique_origins: the list of origins of the unique queries
+            -unique_destinations: the list of destinations of the unique queries
+            -unique_available_layers: the list of available layers of the unique queries
+            -unique_chosen_mservices: the list of chosen mobility services of the unique queries
+            -unique_nb_paths: the list of number of paths to find of the unique queries
+            -query_indices: for each query, the index of the unique query answering it
+        """
+        unique_queries = {}
+        unique_inds = []
+        query_indices = []
+        for i, (o, d, layers, mservices, k) in enumerate(zip(origins, destinations, available_layers, chosen_mservices, nb_paths)):
+            key = (o, d, frozenset(layers), frozenset(mservices.items()), k)
+            ind = unique_queries.get(key)
+            if ind is None:
+                ind = unique_queries[key] = len(unique_inds)
+                unique_inds.append(i)
+            query_indices.append(ind)
+        return [origins[i] for i in unique_inds], [destinations[i] for i in unique_inds], \
+            [available_layers[i] for i in unique_inds], [chosen_mservices[i] for i in unique_inds], \
+            [nb_paths[i] for i in unique_inds], query_indices
+
+    def compute_shortest_paths(self, origins, destinations, available_layers, chosen_mservices, nb_paths, intermodality=None):
+        """Method that computes the k shortest paths of a list of queries with HiPOP,
+        the identical queries are computed once and their result is shared.
+
+        Args:
+            -origins: the list of origins of the queries
+            -destinations: the list of destinations of the queries
+            -available_layers: the list of available layers of the queries
+            -chosen_mservices: the list of chosen mobility services of the queries
+            -nb_paths: the list of number of paths to find of the queries
+            -intermodality: specifies the pair of layers groups between which intermodality is
+                            mandatory, None if it is not
+
+        Returns:
+            -paths: for each query, the list of k shortest paths found
+        """
+        u_origins, u_destinations, u_available_layers, u_chosen_mservices, u_nb_paths, query_indices = \
+            self.deduplicate_shortest_path_inputs(origins, destinations, available_layers, chosen_mservices, nb_paths)
+        self._nb_shortest_path_queries += len(query_indices)
+        self._nb_deduplicated_shortest_path_queries += len(query_indices) - len(u_origins)
+        if len(query_indices) > 0:
+            log.info(f'{len(query_indices)} shortest path queries, {len(u_origins)} computed after deduplication '\
+                f'(hit rate {1 - len(u_origins) / len(query_indices):.1%}, cumulated hit rate '\
+                f'{self._nb_deduplicated_shortest_path_queries / self._nb_shortest_path_queries:.1%})')
+
+        try:
+            if intermodality is None:
+                unique_paths = parallel_k_shortest_path(self._mlgraph.graph,
+                                                        u_origins,
+                                                        u_destinations,
                                                         self._cost,
-                                                        chosen_mservices,
-                                                        available_layers,
+                                                        u_chosen_mservices,
+                                                        u_available_layers,
                                                         self._max_diff_cost,
                                                         self._max_dist_in_common,
                                                         self._cost_multiplier_to_find_k_paths,
                                                         self._max_retry_to_find_k_paths,
-                                                        nb_paths,
+                                                        u_nb_paths,
                                                         self._thread_number)
-                    except ValueError as ex:
-                        log.error(f'HiPOP.Error: {ex}')
-                        sys.exit(-1)
-                else:
-                    try:
-                        paths = parallel_k_intermodal_shortest_path(self._mlgraph.graph,
-                                                                    origins,
-                                                                    destinations,
-                                                                    chosen_mservices,
-                                                                    self._cost,
-                                                                    self._thread_number,
-                                                                    considered_mode[1],
-                                                                    self._max_diff_cost,
-                                                                    self._max_dist_in_common,
-                                                                    self._cost_multiplier_to_find_k_paths,
-                                                                    self._max_retry_to_find_k_paths,
-                                                                    nb_paths,
-                                                                    available_layers)
-                    except ValueError as ex:
-                        log.error(f'HiPOP.Error: {ex}')
-                        sys.exit(-1)
-                ## Parse the outputs of HiPOP and proceed to path selection
-                users_paths = self.parse_paths(paths, uids, chosen_mservices, nb_paths, users_paths, intermodality=considered_mode[1])
-
+            else:
+                unique_paths = parallel_k_intermodal_shortest_path(self._mlgraph.graph,
+                                                                   u_origins,
+                                                                   u_destinations,
+                                                                   u_chosen_mservices,
+                                                                   self._cost,
+                                                                   self._thread_number,
+                                                                   intermodality,
+                                                                   self._max_diff_cost,
+                                                                   self._max_dist_in_common,
+                                                                   self._cost_multiplier_to_find_k_paths,
+                                                                   self._max_retry_to_find_k_paths,
+                                                                   u_nb_paths,
+                                                                   u_available_layers)
+        except ValueError as ex:
+            log.error(f'HiPOP.Error: {ex}')
+            sys.exit(-1)
 
-        ### Path selection
-        self.path_selection(users_paths, tcurrent)
+        # Fan the results back out, each query gets its own copy of the nodes lists
+        paths = []
+        answered = set()
+        for ind in query_indices:
+            if ind in answered:
+                paths.append([(list(nodes), cost) for nodes, cost in unique_paths[ind]])
+            else:
+                answered.add(ind)
+                paths.append(unique_paths[ind])
+        return paths
 
     def compute_path(self, origin: str, destination: str, accessible_layers: Set[str], chosen_services: Dict[str, str]):
         try:
@@ -874,16 +1007,15 @@ class AbstractDecisionModel(ABC):
             mss = chosen_mservices[i]
             mss_str = self.cast_chosen_mservice_intermodality_to_str(mss, intermodality)
             k = nb_paths[i]
-            if o in self.saved_routes and d in self.saved_routes[o] and mss_str in self.saved_routes[o][d] and len(self.saved_routes[o][d][mss_str]) >= k:
-                    # Recompute path cost with current costs
-                    candidates_paths = [Path(self.compute_path_cost(pnodes, mss, gnodes), pnodes) for pnodes in self.saved_routes[o][d][mss_str]]
-                    # Select the k bests
-                    candidates_paths = sorted(candidates_paths, key=lambda p: p.path_cost)
-                    candidates_paths = candidates_paths[:k]
-                    # Assign them to the user
-                    for p in candidates_paths:
-                        self.treat_path(p, mss, user, gnodes)
-                        users_paths[uid]['paths'].append(p)
+            routes = self.route_cache.get(o, d, mss_str, k)
+            if routes is not None:
+                # Recompute path cost with current costs and select the k bests
+                costs = self.route_cache.rescore(routes, lambda un, dn: self.compute_link_cost(un, dn, mss, gnodes))
+                # Assign them to the user
+                for j in np.argsort(costs, kind='stable')[:k]:
+                    p = Path(float(costs[j]), self.route_cache.nodes(routes[j]))
+                    self.treat_path(p, mss, user, gnodes)
+                    users_paths[uid]['paths'].append(p)
             else:
                 # The k shortest paths will be recomputed
                 new_uids.append(uid)
@@ -895,29 +1027,13 @@ class AbstractDecisionModel(ABC):
         log.info(f'{len(uids)-len(new_uids)} / {len(uids)} are reapplied from saved routes')
         return new_uids, new_origins, new_destinations, new_available_layers, new_chosen_mservices, new_nb_paths, users_paths
 
-    def save_computed_route(self, path_nodes, chosen_mservices, intermodality):
-        """Method that saves a path computed for a certain set of mobility services.
+    def save_route_cache(self, filename: str = None):
+        """Method that writes the saved routes into a JSON file.
 
         Args:
-            -path_nodes: the list of nodes constituting the path to save
-            -chosen_mservices: the dictionnary indicating the available layers and
-             the mobility service chosen for each of them
-            -intemrodality: specifies if specific layers must be passed through
+            -filename: the JSON file, if None the route cache file of the decision model is used
         """
-        o = path_nodes[0]
-        d = path_nodes[-1]
-        if o in self.saved_routes:
-            if d in self.saved_routes[o]:
-                chosen_mservices_str = self.cast_chosen_mservice_intermodality_to_str(chosen_mservices, intermodality)
-                if chosen_mservices_str in self.saved_routes[o][d]:
-                    if path_nodes not in self.saved_routes[o][d][chosen_mservices_str]:
-                        self.saved_routes[o][d][chosen_mservices_str].append(path_nodes)
-                else:
-                    self.saved_routes[o][d][chosen_mservices_str] = [path_nodes]
-            else:
-                self.saved_routes[o][d] = {self.cast_chosen_mservice_intermodality_to_str(chosen_mservices, intermodality): [path_nodes]}
-        else:
-            self.saved_routes[o] = {d: {self.cast_chosen_mservice_intermodality_to_str(chosen_mservices, intermodality): [path_nodes]}}
+        self.route_cache.save(self.route_cache_file if filename is None else filename)
 
     def cast_chosen_mservice_intermodality_to_str(self, mss, intermodality):
         """Method that casts a dict of chosen mobility service per layer and an intermodality
@@ -943,8 +1059,17 @@ class AbstractDecisionModel(ABC):
         """
         path_cost = 0
         for i in range(len(path_nodes)-1):
-            un = path_nodes[i]
-            dn = path_nodes[i+1]
-            l = gnodes[un].adj[dn]
-            path_cost += l.costs[chosen_mservices[l.label]][self._cost]
+            path_cost += self.compute_link_cost(path_nodes[i], path_nodes[i+1], chosen_mservices, gnodes)
         return path_cost
+
+    def compute_link_cost(self, un, dn, chosen_mservices, gnodes):
+        """Method that computes the cost of a link.
+
+        Args:
+            -un: the upstream node of the link
+            -dn: the downstream node of the link
+            -chosen_mservices: the dict specifying which mobility service is used on each layer
+            -gnodes: the dict of nodes of the multi layer graph
+        """
+        l = gnodes[un].adj[dn]
+        return l.costs[chosen_mservices[l.label]][self._cost]
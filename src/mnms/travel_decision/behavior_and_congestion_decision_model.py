@@ -9,9 +9,8 @@ from mnms.congestion_model import CongestionModel
 from mnms.demand.user import Path
 from mnms.time import Time
 from mnms.travel_decision.abstract import AbstractDecisionModel
+from mnms.travel_decision.behavior_index import AbstractBehaviorIndexStore, BehaviorIndexCache, RedisBehaviorIndexStore
 from mnms.graph.layers import MultiLayerGraph
-import pandas as pd
-import redis
 from datetime import datetime, timedelta
 import time
 import re
@@ -23,7 +22,8 @@ class BehaviorCongestionDecisionModel(AbstractDecisionModel):
     def __init__(self, mmgraph: MultiLayerGraph, considered_modes=None, cost='travel_time', outfile: str = None,
                  verbose_file=False, alpha=1, beta=1, gamma=1,
                  baseline=False, top_k=3, n_shortest_path=10,
-                 congestion_prediction_technique=None):
+                 congestion_prediction_technique=None, behavior_index_store: AbstractBehaviorIndexStore = None,
+                 behavior_index_cache_size=100000):
         """Behavior- and congestion-driven decision model for the path of a user.
         All routes computed are considered on an equal footing for the choice.
 
@@ -40,6 +40,9 @@ class BehaviorCongestionDecisionModel(AbstractDecisionModel):
                                                   for an origin, destination, and mode should be saved
                                                   dynamically and reapply for next departing users with
                                                   the same origin, destination and mode
+            -behavior_index_store: store of the users behavior indexes, if None a Redis store
+                                   on localhost is used
+            -behavior_index_cache_size: maximum number of (user, time bin) whose behavior indexes are cached
         """
         super(BehaviorCongestionDecisionModel, self).__init__(mmgraph,
                                                               considered_modes=considered_modes,
@@ -48,8 +51,12 @@ class BehaviorCongestionDecisionModel(AbstractDecisionModel):
                                                               verbose_file=verbose_file,
                                                               n_shortest_path=n_shortest_path
                                                               )
-        # Connect to Redis (adjust host and port)
-        self.redis_client = redis.StrictRedis(host='localhost', port=6379, decode_responses=True)
+        if behavior_index_store is None:
+            # Connect to Redis (adjust host and port)
+            behavior_index_store = RedisBehaviorIndexStore(host='localhost', port=6379)
+        self.behavior_index = BehaviorIndexCache(behavior_index_store, behavior_index_cache_size)
+        # Boarding stops of the paths of the users of the current path selection, computed once per path
+        self._boarding_stops = dict()
 
         self._seed = None
         self._rng = None
@@ -83,39 +90,25 @@ class BehaviorCongestionDecisionModel(AbstractDecisionModel):
         Returns:
             -selected_path: path chosen
         """
-        print('N PATHS:', len(paths))
+        log.debug(f'User {uid} chooses among {len(paths)} paths')
         if len(paths) > 1:
             cost_score = [p.path_cost for p in paths]
             CI_score = [0 for i in range(len(paths))]
             BI_score = [0 for i in range(len(paths))]
 
-            for p in range(len(paths)):
-                path_tt = paths[p].get_link_cost(self._mlgraph, self._cost)
-                # EXCLUDE THE ORIGIN AND DESTINAION FROM COMPUTATION
-                i = 0
-                line_changes = 1
-                if self.alpha != 0 or self.beta != 0:
-                    x = paths[p].nodes[1]
-                    # Get line ID. Ex. TRAMT5
-                    if 'METRO' in x or 'TRAM' in x or 'BUS' in x:
-                        line = x.split('_')[0] + x.split('_')[1]
-                    else:
-                        line = ''
-                    for x in paths[p].nodes[1:-1]:
-                        print('X', x)
-                        if 'METRO' in x or 'TRAM' in x or 'BUS' in x:
-                            next_line = x.split('_')[0] + x.split('_')[1]
-                            if line != next_line or i == 0:
-                                t = timedelta(seconds=sum(path_tt[:i])) + datetime.strptime(str(tcurrent),
-                                                                                            '%H:%M:%S.%f')
-                                #t = datetime.strptime(str(tcurrent), '%H:%M:%S.%f') - timedelta(seconds=30)
-                                #print(str(tcurrent), sum(path_tt[:i]), t)
-                                line = next_line
-                                CI_score[p] += self.get_CI(x)
-                                BI_score[p] += self.get_BI(uid, x, t)
-                                if i != 0:
-                                    line_changes = line_changes + 1
-                        i += 1
+            if self.alpha != 0 or self.beta != 0:
+                # Gather the boarding stops of all paths to predict their congestion in one batch
+                stops = self._boarding_stops.get(uid)
+                if stops is None:
+                    stops = [self.get_boarding_stops(path, tcurrent) for path in paths]
+                CIs = self.get_CIs([x for path_stops in stops for x, _ in path_stops])
+                start = 0
+                for p, path_stops in enumerate(stops):
+                    # Boarding at the first node is not a line change
+                    line_changes = len(path_stops) + (0 if self.is_pt_node(paths[p].nodes[1]) else 1)
+                    CI_score[p] = sum(CIs[start:start+len(path_stops)].tolist())
+                    BI_score[p] = sum(self.get_BI(uid, x, t) for x, t in path_stops)
+                    start += len(path_stops)
                     CI_score[p] = self.alpha * CI_score[p] / line_changes
                     BI_score[p] = self.beta * BI_score[p] / line_changes
 
@@ -125,32 +118,107 @@ class BehaviorCongestionDecisionModel(AbstractDecisionModel):
                 criteria = {'CI': (CI_score, False), 'BI': (BI_score, True), 'C': (cost_score, False)}
             # CREATE C RANKS AND SORT PATH. THEN COMBINE THE SCORE BASED ON VALUE AND POSITION WITHIN THE RANKS
             # AND GET THE TOP K
-            ranked_paths = self.rank_paths(criteria, len(paths)).iloc[:self.top_k, :]
-            random_path = ranked_paths.iloc[np.random.randint(low=0, high=len(ranked_paths)), 0]
-            print('Path', random_path, paths)
-            random_path = paths[random_path]
-            return random_path
+            ranked_paths = self.top_ranked_paths(self.rank_paths(criteria, len(paths)), self.top_k)
+            random_path = ranked_paths[np.random.randint(low=0, high=len(ranked_paths))]
+            log.debug(f'User {uid} chose path {random_path} among {paths}')
+            return paths[random_path]
         elif len(paths) == 1:
             return paths[0]
         else:
             return None
 
-    def rank_paths(self, criteria, P):
-        rankings = [
-            pd.DataFrame({'ID': list(range(P)), c: criteria[c][0]}).sort_values(by=c,
-                                                                                ascending=criteria[c][1]).reset_index(
-                drop=True)
-            for c in criteria]
-        ranked_paths = pd.DataFrame({'ID': list(range(P)), 'SCORE': [0.0] * P})
+    def get_boarding_stops(self, path: Path, tcurrent) -> List[Tuple[str, datetime]]:
+        """Method that returns the stops where the user boards a public transport line
+        along a path, origin and destination excluded.
 
-        for p in ranked_paths.index:
-            for rank in rankings:
-                path = rank[rank['ID'] == p]
-                ranked_paths.iloc[p, 1] += (path.index[0] + 1)  # POSITION
-        return ranked_paths
+        Args:
+            -path: the path
+            -tcurrent: the departure time of the user
+
+        Returns:
+            -stops: list of (node, estimated time of arrival at the node)
+        """
+        path_tt = path.get_link_cost(self._mlgraph, self._cost)
+        tstart = datetime.strptime(str(tcurrent), '%H:%M:%S.%f')
+        stops = []
+        line = ''
+        tt = 0
+        for i, x in enumerate(path.nodes[1:-1]):
+            if self.is_pt_node(x):
+                # Get line ID. Ex. TRAMT5
+                next_line = x.split('_')[0] + x.split('_')[1]
+                if line != next_line or i == 0:
+                    line = next_line
+                    stops.append((x, timedelta(seconds=tt) + tstart))
+            if i < len(path_tt):
+                tt += path_tt[i]
+        return stops
+
+    @staticmethod
+    def is_pt_node(node: str) -> bool:
+        return 'METRO' in node or 'TRAM' in node or 'BUS' in node
+
+    def path_selection(self, users_paths, tcurrent: Time):
+        """Selects the path for each user in the users_paths dict, the behavior indexes
+        of all the users are fetched in one batch beforehand.
+
+        Args:
+            -users_paths: dict with user id as key, and a dict as values
+             {'user': user object, 'paths': list of paths the user considers}
+        """
+        if self.beta != 0 or self.alpha != 0:
+            lookups = []
+            for uid, d in users_paths.items():
+                if len(d['paths']) > 1:
+                    stops = [self.get_boarding_stops(path, tcurrent) for path in d['paths']]
+                    self._boarding_stops[uid] = stops
+                    lookups.extend((uid, self.clean_route(x), self.get_current_time_bin(t))
+                                   for path_stops in stops for x, t in path_stops)
+            self.behavior_index.prefetch(lookups)
+        try:
+            super(BehaviorCongestionDecisionModel, self).path_selection(users_paths, tcurrent)
+        finally:
+            self._boarding_stops = dict()
+
+    @staticmethod
+    def rank_paths(criteria, P) -> np.ndarray:
+        """Method that scores the paths with the sum of their positions in the ranking
+        of each criterion.
+
+        Args:
+            -criteria: dict criterion name -> (scores of the paths, True to rank by ascending score)
+            -P: the number of paths
+
+        Returns:
+            -scores: array of the scores of the paths
+        """
+        scores = np.zeros(P)
+        for values, ascending in criteria.values():
+            values = np.asarray(values, dtype=np.float64)
+            order = np.argsort(values if ascending else -values, kind='stable')
+            positions = np.empty(P)
+            positions[order] = np.arange(1, P+1)
+            scores += positions
+        return scores
+
+    @staticmethod
+    def top_ranked_paths(scores: np.ndarray, top_k: int) -> np.ndarray:
+        """Method that returns the paths with the lowest scores, ties are broken by path order.
+
+        Args:
+            -scores: array of the scores of the paths
+            -top_k: the number of paths to return
+
+        Returns:
+            -ranked_paths: indices of the top_k paths with the lowest scores, from the best one
+        """
+        return np.argsort(scores, kind='stable')[:top_k]
 
     def get_CI(self, node):
         return CongestionModel.get_instance(self.congestion_prediction_technique).predict_congestion(node)
+
+    def get_CIs(self, nodes):
+        return CongestionModel.get_instance(self.congestion_prediction_technique).predict_many(nodes)
         # print(node, tcurrent)
         # CI = self.CI_data[self.CI_data['NODE'] == node].copy(deep=True)
         # if len(CI) == 0:
@@ -171,15 +239,8 @@ class BehaviorCongestionDecisionModel(AbstractDecisionModel):
         #     return CI
 
     def get_BI(self, uid, x, tcurrent):
-        user = uid
         bin = self.get_current_time_bin(tcurrent)
-        target = f'{self.clean_route(x)}-{bin}'
-
-        BI_value = self.redis_client.hget(user, target)
-        if BI_value is None:
-            BI_value = 0
-        print('BI', BI_value)
-        return float(BI_value)
+        return self.behavior_index.get(uid, self.clean_route(x), bin)
 
     def get_current_time_bin(self, tcurrent, bin_minutes=10):
         # Calculate the start of the bin
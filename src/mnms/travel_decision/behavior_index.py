@@ -0,0 +1,215 @@
+import sqlite3
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from mnms.log import create_logger
+
+log = create_logger(__name__)
+
+
+class AbstractBehaviorIndexStore(ABC):
+    """
+    Store of the behavior indexes of the users. The behavior indexes of a user are
+    stored as fields '<stop>-<time bin>' of a hash named after the user.
+    """
+
+    @abstractmethod
+    def get_many(self, user: str, fields: Sequence[str]) -> List[Optional[float]]:
+        """Method that returns the values of several fields of a user.
+
+        Args:
+            -user: the user id
+            -fields: the fields
+
+        Returns:
+            -values: list of values, None for the missing fields
+        """
+        pass
+
+    def get_many_users(self, requests: Dict[str, Sequence[str]]) -> Dict[str, List[Optional[float]]]:
+        """Method that returns the values of several fields for several users.
+
+        Args:
+            -requests: dict user id -> fields
+
+        Returns:
+            -values: dict user id -> list of values, None for the missing fields
+        """
+        return {user: self.get_many(user, fields) for user, fields in requests.items()}
+
+    def close(self):
+        pass
+
+
+class DictBehaviorIndexStore(AbstractBehaviorIndexStore):
+    def __init__(self, data: Optional[Dict[str, Dict[str, float]]] = None):
+        """In-process behavior index store.
+
+        Args:
+            -data: dict user id -> dict field -> behavior index
+        """
+        self.data = dict() if data is None else data
+
+    def set(self, user: str, field: str, value: float):
+        self.data.setdefault(user, dict())[field] = value
+
+    def get_many(self, user, fields):
+        user_data = self.data.get(user)
+        if user_data is None:
+            return [None] * len(fields)
+        return [user_data.get(f) for f in fields]
+
+
+class SQLiteBehaviorIndexStore(AbstractBehaviorIndexStore):
+    def __init__(self, filename: str = ':memory:', table: str = 'behavior_index'):
+        """Behavior index store in a SQLite database, for offline runs.
+
+        Args:
+            -filename: the database file
+            -table: the table of the behavior indexes, with columns USER, FIELD, BI
+        """
+        self.table = table
+        self._connection = sqlite3.connect(filename)
+        self._connection.execute(f'CREATE TABLE IF NOT EXISTS {table} '
+                                 f'(USER TEXT NOT NULL, FIELD TEXT NOT NULL, BI REAL, PRIMARY KEY (USER, FIELD))')
+
+    def set_many(self, rows: Iterable[Tuple[str, str, float]]):
+        """Method that inserts or replaces behavior indexes.
+
+        Args:
+            -rows: iterable of (user id, field, behavior index)
+        """
+        with self._connection:
+            self._connection.executemany(f'INSERT OR REPLACE INTO {self.table} (USER, FIELD, BI) VALUES (?, ?, ?)', rows)
+
+    def get_many(self, user, fields):
+        if len(fields) == 0:
+            return []
+        values = dict()
+        # Stay below the default limit of SQLite on the number of variables in a query
+        for start in range(0, len(fields), 900):
+            chunk = fields[start:start+900]
+            cursor = self._connection.execute(f'SELECT FIELD, BI FROM {self.table} WHERE USER = ? '
+                                              f'AND FIELD IN ({",".join("?"*len(chunk))})', (user, *chunk))
+            values.update(cursor.fetchall())
+        return [values.get(f) for f in fields]
+
+    def close(self):
+        self._connection.close()
+
+
+class RedisBehaviorIndexStore(AbstractBehaviorIndexStore):
+    def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0, client=None):
+        """Behavior index store in a Redis server, all the lookups of a batch are sent
+        in one pipeline with one HMGET per user.
+
+        Args:
+            -host: the host of the Redis server
+            -port: the port of the Redis server
+            -db: the Redis database
+            -client: an already connected Redis client, if not None host, port and db are ignored
+        """
+        if client is None:
+            import redis
+            client = redis.StrictRedis(host=host, port=port, db=db, decode_responses=True)
+        self.client = client
+
+    def get_many(self, user, fields):
+        if len(fields) == 0:
+            return []
+        return self.client.hmget(user, list(fields))
+
+    def get_many_users(self, requests):
+        requests = {user: list(fields) for user, fields in requests.items() if len(fields) > 0}
+        if not requests:
+            return dict()
+        pipe = self.client.pipeline(transaction=False)
+        for user, fields in requests.items():
+            pipe.hmget(user, fields)
+        return dict(zip(requests.keys(), pipe.execute()))
+
+    def close(self):
+        self.client.close()
+
+
+class BehaviorIndexCache(object):
+    def __init__(self, store: AbstractBehaviorIndexStore, max_size: int = 100000):
+        """Memoization of the behavior indexes per (user, time bin), the least recently
+        used (user, time bin) entries are evicted when more than max_size are cached.
+
+        Args:
+            -store: the behavior index store
+            -max_size: the maximum number of cached (user, time bin) entries
+        """
+        self.store = store
+        self.max_size = max_size
+        self._cache: Dict[Tuple[str, str], Dict[str, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def prefetch(self, lookups: Iterable[Tuple[str, str, str]]):
+        """Method that fetches in one batch all the behavior indexes not cached yet.
+
+        Args:
+            -lookups: iterable of (user id, stop, time bin)
+        """
+        # user id -> ordered set of the missing (stop, time bin)
+        missing = defaultdict(dict)
+        for user, target, time_bin in lookups:
+            entry = self._cache.get((user, time_bin))
+            if entry is None or target not in entry:
+                missing[user][(target, time_bin)] = None
+        if not missing:
+            return
+
+        requests = {user: [f'{target}-{time_bin}' for target, time_bin in targets] for user, targets in missing.items()}
+        results = self.store.get_many_users(requests)
+        for user, targets in missing.items():
+            for (target, time_bin), value in zip(targets, results.get(user, [])):
+                self._entry(user, time_bin)[target] = 0. if value is None else float(value)
+
+    def get(self, user: str, target: str, time_bin: str) -> float:
+        """Method that returns the behavior index of a user at a stop during a time bin,
+        it is fetched from the store if not cached.
+
+        Args:
+            -user: the user id
+            -target: the stop
+            -time_bin: the time bin
+
+        Returns:
+            -BI: the behavior index, 0 if unknown
+        """
+        entry = self._cache.get((user, time_bin))
+        if entry is not None:
+            self._cache.move_to_end((user, time_bin))
+            BI = entry.get(target)
+            if BI is not None:
+                self.hits += 1
+                return BI
+        self.misses += 1
+        value = self.store.get_many(user, [f'{target}-{time_bin}'])[0]
+        BI = 0. if value is None else float(value)
+        self._entry(user, time_bin)[target] = BI
+        return BI
+
+    def _entry(self, user: str, time_bin: str) -> Dict[str, float]:
+        key = (user, time_bin)
+        entry = self._cache.get(key)
+        if entry is None:
+            entry = dict()
+            self._cache[key] = entry
+            if len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return entry
+
+    def clear(self):
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
@@ -9,7 +9,8 @@ from mnms.travel_decision.abstract import AbstractDecisionModel
 class DummyDecisionModel(AbstractDecisionModel):
     def __init__(self, mmgraph: MultiLayerGraph, considered_modes=None, cost='travel_time', outfile:str=None,
         verbose_file=False, personal_mob_service_park_radius:float=100, random_choice_for_equal_costs:bool=False,
-        save_routes_dynamically_and_reapply: bool = False):
+        save_routes_dynamically_and_reapply: bool = False,
+        route_cache_size: int = None, route_cache_file: str = None):
         """
         Deterministic decision model: the path with the lowest cost is chosen.
 
@@ -28,12 +29,18 @@ class DummyDecisionModel(AbstractDecisionModel):
                                                   for an origin, destination, and mode should be saved
                                                   dynamically and reapply for next departing users with
                                                   the same origin, destination and mode
+            -route_cache_size: maximum number of (origin, destination, mobility services) entries
+                               of the saved routes, unbounded if None
+            -route_cache_file: JSON file from which the saved routes are loaded if it exists, and
+                               in which they are written at the end of the simulation
         """
         super(DummyDecisionModel, self).__init__(mmgraph, considered_modes=considered_modes,
                                                  n_shortest_path=1, outfile=outfile,
                                                  verbose_file=verbose_file,
                                                  cost=cost, personal_mob_service_park_radius=personal_mob_service_park_radius,
-                                                 save_routes_dynamically_and_reapply=save_routes_dynamically_and_reapply)
+                                                 save_routes_dynamically_and_reapply=save_routes_dynamically_and_reapply,
+                                                 route_cache_size=route_cache_size,
+                                                 route_cache_file=route_cache_file)
         self.random_choice_for_equal_costs = random_choice_for_equal_costs
         self._seed = None
         self._rng = None
@@ -13,9 +13,39 @@ from mnms.graph.layers import MultiLayerGraph
 log = create_logger(__name__)
 
 
+def batch_logit_choice(costs: List[List[float]], theta: float, rng=None) -> np.ndarray:
+    """Function that draws one alternative per chooser following a logit model, the
+    probabilities of all choosers are computed at once with a log-sum-exp on the padded
+    costs matrix and all the draws are made with one call to the random generator.
+
+    Args:
+        -costs: list of the costs of the alternatives of each chooser, each chooser has at least one alternative
+        -theta: parameter of the logit
+        -rng: the numpy random generator, if None the global numpy random state is used
+
+    Returns:
+        -choices: the index of the alternative chosen by each chooser
+    """
+    if len(costs) == 0:
+        return np.empty(0, dtype=np.int64)
+    nb_alternatives = np.fromiter((len(c) for c in costs), dtype=np.int64, count=len(costs))
+    utilities = np.full((len(costs), nb_alternatives.max()), -np.inf)
+    mask = np.arange(utilities.shape[1]) < nb_alternatives[:, None]
+    utilities[mask] = -theta * np.fromiter((c for chooser_costs in costs for c in chooser_costs), dtype=np.float64,
+                                           count=int(nb_alternatives.sum()))
+    max_utilities = utilities.max(axis=1, keepdims=True)
+    log_sum_exp = max_utilities + np.log(np.exp(utilities - max_utilities).sum(axis=1, keepdims=True))
+    cumulated_probas = np.cumsum(np.exp(utilities - log_sum_exp), axis=1)
+    draws = rng.random(len(costs)) if rng is not None else np.random.random(len(costs))
+    choices = (cumulated_probas < draws[:, None]).sum(axis=1)
+    # Protect against rounding errors on the last cumulated probability
+    return np.minimum(choices, nb_alternatives - 1)
+
+
 class LogitDecisionModel(AbstractDecisionModel):
     def __init__(self, mmgraph: MultiLayerGraph, theta=0.01, considered_modes=None, n_shortest_path=3, cost='travel_time', outfile:str=None, verbose_file=False,
-        personal_mob_service_park_radius:float=100, save_routes_dynamically_and_reapply:bool=False):
+        personal_mob_service_park_radius:float=100, save_routes_dynamically_and_reapply:bool=False,
+        route_cache_size:int=None, route_cache_file:str=None, batch_choice:bool=False):
         """Logit decision model for the path of a user.
         All routes computed are considered on an equal footing for the choice.
 
@@ -35,6 +65,11 @@ class LogitDecisionModel(AbstractDecisionModel):
                                                   for an origin, destination, and mode should be saved
                                                   dynamically and reapply for next departing users with
                                                   the same origin, destination and mode
+            -route_cache_size: maximum number of (origin, destination, mobility services) entries
+                               of the saved routes, unbounded if None
+            -route_cache_file: JSON file from which the saved routes are loaded if it exists, and
+                               in which they are written at the end of the simulation
+            -batch_choice: if True, the paths of all the users of a (re)planning round are chosen at once
         """
         super(LogitDecisionModel, self).__init__(mmgraph,
                                                  considered_modes=considered_modes,
@@ -43,8 +78,11 @@ class LogitDecisionModel(AbstractDecisionModel):
                                                  verbose_file=verbose_file,
                                                  cost=cost,
                                                  personal_mob_service_park_radius=personal_mob_service_park_radius,
-                                                 save_routes_dynamically_and_reapply=save_routes_dynamically_and_reapply)
+                                                 save_routes_dynamically_and_reapply=save_routes_dynamically_and_reapply,
+                                                 route_cache_size=route_cache_size,
+                                                 route_cache_file=route_cache_file)
         self._theta = theta
+        self.batch_choice = batch_choice
         self._seed = None
         self._rng = None
 
@@ -59,11 +97,13 @@ class LogitDecisionModel(AbstractDecisionModel):
             rng = np.random.default_rng(self._seed)
             self._rng = rng
 
-    def path_choice(self, paths:List[Path], tcurrent=None) -> Path:
+    def path_choice(self, paths:List[Path], uid=None, tcurrent=None) -> Path:
         """Method that proceeds to the selection of the path.
 
         Args:
             -paths: list of paths to consider for the choice
+            -uid: id of the user who chooses
+            -tcurrent: current time
 
         Returns:
             -selected_path: path chosen
@@ -86,9 +126,28 @@ class LogitDecisionModel(AbstractDecisionModel):
         path_selected = paths[selected_ind]
         return path_selected
 
+    def batch_path_choice(self, users_paths, tcurrent=None):
+        """Method that proceeds to the selection of the paths of all users at once
+        when the batch choice is activated.
+
+        Args:
+            -users_paths: dict with user id as key, and a dict as values
+             {'user': user object, 'paths': list of paths the user considers}
+            -tcurrent: current time
+
+        Returns:
+            -chosen_paths: dict with the path chosen by each user who has some paths, or None
+        """
+        if not self.batch_choice:
+            return None
+        uids = [uid for uid, d in users_paths.items() if d['paths']]
+        choices = batch_logit_choice([[p.path_cost for p in users_paths[uid]['paths']] for uid in uids], self._theta, self._rng)
+        return {uid: users_paths[uid]['paths'][c] for uid, c in zip(uids, choices)}
+
 class ModeCentricLogitDecisionModel(AbstractDecisionModel):
     def __init__(self, mmgraph: MultiLayerGraph, considered_modes, theta=0.01, cost='travel_time', outfile:str=None, verbose_file=False,
-        personal_mob_service_park_radius:float=100, save_routes_dynamically_and_reapply:bool=False):
+        personal_mob_service_park_radius:float=100, save_routes_dynamically_and_reapply:bool=False,
+        route_cache_size:int=None, route_cache_file:str=None, batch_choice:bool=False):
         """Mode centric logit decision model for the path selection of a user.
         In this decision model, the choice for a mode route is deterministic, the choice
         for a mode is logit. This model requires to define the modes by the considered_modes argument.
@@ -106,6 +165,11 @@ class ModeCentricLogitDecisionModel(AbstractDecisionModel):
                                                   for an origin, destination, and mode should be saved
                                                   dynamically and reapply for next departing users with
                                                   the same origin, destination and mode
+            -route_cache_size: maximum number of (origin, destination, mobility services) entries
+                               of the saved routes, unbounded if None
+            -route_cache_file: JSON file from which the saved routes are loaded if it exists, and
+                               in which they are written at the end of the simulation
+            -batch_choice: if True, the paths of all the users of a (re)planning round are chosen at once
         """
         super(ModeCentricLogitDecisionModel, self).__init__(mmgraph,
                                                             considered_modes=considered_modes,
@@ -113,8 +177,11 @@ class ModeCentricLogitDecisionModel(AbstractDecisionModel):
                                                             verbose_file=verbose_file,
                                                             cost=cost,
                                                             personal_mob_service_park_radius=personal_mob_service_park_radius,
-                                                            save_routes_dynamically_and_reapply=save_routes_dynamically_and_reapply)
+                                                            save_routes_dynamically_and_reapply=save_routes_dynamically_and_reapply,
+                                                            route_cache_size=route_cache_size,
+                                                            route_cache_file=route_cache_file)
         self._theta = theta
+        self.batch_choice = batch_choice
         self._seed = None
         self._rng = None
 
@@ -129,7 +196,15 @@ class ModeCentricLogitDecisionModel(AbstractDecisionModel):
             rng = np.random.default_rng(self._seed)
             self._rng = rng
 
-    def path_choice(self, paths:List[Path], tcurrent=None) -> Path:
+    def preselect_paths(self, paths:List[Path]) -> List[Path]:
+        """Method that selects the best path of each considered mode.
+
+        Args:
+            -paths: list of paths to consider for the choice
+
+        Returns:
+            -preselected_paths: the best path of each considered mode with at least one path
+        """
         # Group paths per considered modes
         grouped_paths = {}
         for mi, m in enumerate(self._considered_modes):
@@ -147,12 +222,27 @@ class ModeCentricLogitDecisionModel(AbstractDecisionModel):
                     if layers_set.issubset(layers_group) and (layers_set & intermodality[0]) and (layers_set & intermodality[1]):
                         grouped_paths[mi].append(p)
 
-        # Start by selecting the best route for each mode
+        # Select the best route of each mode
         preselected_paths = []
         for k,v in grouped_paths.items():
             if v:
                 v.sort(key=lambda p: p.path_cost)
                 preselected_paths.append(v[0])
+        return preselected_paths
+
+    def path_choice(self, paths:List[Path], uid=None, tcurrent=None) -> Path:
+        """Method that proceeds to the selection of the path.
+
+        Args:
+            -paths: list of paths to consider for the choice
+            -uid: id of the user who chooses
+            -tcurrent: current time
+
+        Returns:
+            -selected_path: path chosen
+        """
+        # Start by selecting the best route for each mode
+        preselected_paths = self.preselect_paths(paths)
 
         # Then select a mode
         sum_cost_exp = 0
@@ -169,3 +259,22 @@ class ModeCentricLogitDecisionModel(AbstractDecisionModel):
         else:
             selected_ind = np.random.choice(range(len(proba_path)), 1,  p=proba_path)[0]
         return preselected_paths[selected_ind]
+
+    def batch_path_choice(self, users_paths, tcurrent=None):
+        """Method that proceeds to the selection of the paths of all users at once
+        when the batch choice is activated.
+
+        Args:
+            -users_paths: dict with user id as key, and a dict as values
+             {'user': user object, 'paths': list of paths the user considers}
+            -tcurrent: current time
+
+        Returns:
+            -chosen_paths: dict with the path chosen by each user who has some paths, or None
+        """
+        if not self.batch_choice:
+            return None
+        uids = [uid for uid, d in users_paths.items() if d['paths']]
+        preselected_paths = [self.preselect_paths(users_paths[uid]['paths']) for uid in uids]
+        choices = batch_logit_choice([[p.path_cost for p in paths] for paths in preselected_paths], self._theta, self._rng)
+        return {uid: paths[c] for uid, paths, c in zip(uids, preselected_paths, choices)}
@@ -0,0 +1,165 @@
+import json
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from mnms.log import create_logger
+
+log = create_logger(__name__)
+
+
+class RouteCache(object):
+    def __init__(self, max_size: Optional[int] = None):
+        """
+        Cache of the routes computed for an origin, a destination and a combination of mobility
+        services. The nodes of the routes are interned as integers, the least recently used
+        entries are evicted when the cache holds more than max_size entries.
+
+        Args:
+            -max_size: maximum number of (origin, destination, mobility services) entries, unbounded if None
+        """
+        self.max_size = max_size
+        self._node_ids: Dict[str, int] = dict()
+        self._nodes: List[str] = list()
+        self._routes: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._routes)
+
+    def __contains__(self, key: Tuple[str, str, str]):
+        return key in self._routes
+
+    def _intern(self, path_nodes: List[str]) -> np.ndarray:
+        node_ids = self._node_ids
+        nodes = self._nodes
+        route = np.empty(len(path_nodes), dtype=np.int32)
+        for i, n in enumerate(path_nodes):
+            nid = node_ids.get(n)
+            if nid is None:
+                nid = node_ids[n] = len(nodes)
+                nodes.append(n)
+            route[i] = nid
+        return route
+
+    def _evict(self):
+        if self.max_size is not None:
+            while len(self._routes) > self.max_size:
+                self._routes.popitem(last=False)
+
+    def add(self, path_nodes: List[str], services: str):
+        """Method that saves a route, a route already saved for the same mobility services is ignored.
+
+        Args:
+            -path_nodes: the list of nodes constituting the route
+            -services: the mobility services used on the route cast into a string
+        """
+        key = (path_nodes[0], path_nodes[-1], services)
+        route = self._intern(path_nodes)
+        routes = self._routes.get(key)
+        if routes is None:
+            self._routes[key] = [route]
+            self._evict()
+        else:
+            self._routes.move_to_end(key)
+            if not any(np.array_equal(route, r) for r in routes):
+                routes.append(route)
+
+    def get(self, origin: str, destination: str, services: str, k: int = 1) -> Optional[List[np.ndarray]]:
+        """Method that returns the routes saved for an origin, a destination and mobility services
+        if there are at least k of them.
+
+        Args:
+            -origin: the origin of the routes
+            -destination: the destination of the routes
+            -services: the mobility services used on the routes cast into a string
+            -k: the minimum number of routes
+
+        Returns:
+            -routes: the interned routes, None if less than k routes are saved
+        """
+        key = (origin, destination, services)
+        routes = self._routes.get(key)
+        if routes is None or len(routes) < k:
+            self.misses += 1
+            return None
+        self._routes.move_to_end(key)
+        self.hits += 1
+        return routes
+
+    def nodes(self, route: np.ndarray) -> List[str]:
+        """Method that returns the nodes names of an interned route.
+
+        Args:
+            -route: the interned route
+
+        Returns:
+            -path_nodes: the list of nodes constituting the route
+        """
+        nodes = self._nodes
+        return [nodes[i] for i in route]
+
+    def rescore(self, routes: List[np.ndarray], link_cost: Callable[[str, str], float]) -> np.ndarray:
+        """Method that computes the current costs of routes, the cost of a link shared by several
+        routes is computed once.
+
+        Args:
+            -routes: the interned routes, each containing at least two nodes
+            -link_cost: function returning the current cost of the link between two nodes
+
+        Returns:
+            -costs: the costs of the routes
+        """
+        nb_nodes = len(self._nodes)
+        links = np.concatenate([r[:-1].astype(np.int64) * nb_nodes + r[1:] for r in routes])
+        unique_links, inverse = np.unique(links, return_inverse=True)
+        nodes = self._nodes
+        unique_costs = np.fromiter((link_cost(nodes[l // nb_nodes], nodes[l % nb_nodes]) for l in unique_links.tolist()),
+                                   dtype=np.float64, count=len(unique_links))
+        starts = np.cumsum([0] + [len(r) - 1 for r in routes[:-1]])
+        return np.add.reduceat(unique_costs[inverse], starts)
+
+    def clear(self):
+        self._node_ids.clear()
+        self._nodes.clear()
+        self._routes.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def save(self, filename: str):
+        """Method that writes the cache into a JSON file, from the least to the most recently used entry.
+
+        Args:
+            -filename: the JSON file
+        """
+        data = {'NODES': self._nodes,
+                'ROUTES': [{'ORIGIN': o, 'DESTINATION': d, 'SERVICES': services,
+                            'PATHS': [r.tolist() for r in routes]} for (o, d, services), routes in self._routes.items()]}
+        with open(filename, 'w') as f:
+            json.dump(data, f)
+        log.info(f'{len(self._routes)} entries of the route cache saved in {filename}')
+
+    @classmethod
+    def load(cls, filename: str, max_size: Optional[int] = None) -> "RouteCache":
+        """Method that reads a cache written by save.
+
+        Args:
+            -filename: the JSON file
+            -max_size: maximum number of entries of the loaded cache, unbounded if None
+
+        Returns:
+            -cache: the route cache
+        """
+        with open(filename, 'r') as f:
+            data = json.load(f)
+        cache = cls(max_size)
+        cache._nodes = list(data['NODES'])
+        cache._node_ids = {n: i for i, n in enumerate(cache._nodes)}
+        for entry in data['ROUTES']:
+            cache._routes[(entry['ORIGIN'], entry['DESTINATION'], entry['SERVICES'])] = \
+                [np.array(r, dtype=np.int32) for r in entry['PATHS']]
+        cache._evict()
+        log.info(f'{len(cache)} entries of the route cache loaded from {filename}')
+        return cache
@@ -1,14 +1,240 @@
-from typing import Type, Dict, Optional, List
+from collections import defaultdict
+from math import floor
+from typing import Type, Dict, Optional, List, Tuple
+
+import numpy as np
 
 from mnms.vehicles.manager import VehicleManager
-from mnms.vehicles.veh_type import Vehicle, VehicleActivity, VehicleActivityStop
+from mnms.vehicles.veh_type import Vehicle, VehicleActivity, VehicleActivityStop, ActivityType
+
+_IDLE_ACTIVITY_TYPES = (ActivityType.STOP, ActivityType.REPOSITIONING)
+
+
+class FleetSpatialIndex(object):
+    def __init__(self, cell_size: float = 500, graph=None):
+        """
+        Uniform grid index of the vehicles of a fleet, on their current position and on the position
+        of the node at the end of their plan. The current positions are kept up to date by the vehicles
+        when they move. The plan ends are updated by the fleet manager when the plans are modified, the
+        modifications of the activities themselves (node, path) are caught by refresh_plan_ends.
+        The vehicles returned by the queries are in the order they have been added to the index.
+
+        Args:
+            -cell_size: size of the side of the grid cells
+            -graph: the graph on which the vehicles move, the plan ends are not indexed if None
+        """
+        self.cell_size = cell_size
+        self.graph = graph
+        self._gnodes = dict()
+        self._vehicles: Dict[str, Vehicle] = dict()
+        self._rank: Dict[str, int] = dict()
+        self._counter = 0
+        # Current positions
+        self._position_cells: Dict[str, Tuple[int, int]] = dict()
+        self._position_grid: Dict[Tuple[int, int], Dict[str, Vehicle]] = defaultdict(dict)
+        # Plan ends
+        self._plan_end_nodes: Dict[str, str] = dict()
+        self._plan_end_positions: Dict[str, np.ndarray] = dict()
+        self._plan_end_cells: Dict[str, Tuple[int, int]] = dict()
+        self._plan_end_grid: Dict[Tuple[int, int], Dict[str, Vehicle]] = defaultdict(dict)
+
+    def __len__(self):
+        return len(self._vehicles)
+
+    def __contains__(self, veh: Vehicle):
+        return self._vehicles.get(veh.id) is veh
+
+    def _cell(self, position) -> Tuple[int, int]:
+        return floor(position[0] / self.cell_size), floor(position[1] / self.cell_size)
+
+    @staticmethod
+    def _move(grid, cells, veh: Vehicle, cell: Optional[Tuple[int, int]]):
+        previous_cell = cells.get(veh.id)
+        if previous_cell == cell:
+            return
+        if previous_cell is not None:
+            vehs = grid[previous_cell]
+            del vehs[veh.id]
+            if not vehs:
+                del grid[previous_cell]
+        if cell is None:
+            cells.pop(veh.id, None)
+        else:
+            cells[veh.id] = cell
+            grid[cell][veh.id] = veh
+
+    def add(self, veh: Vehicle):
+        """Method that adds a vehicle to the index, the vehicle notifies its next moves to the index.
+
+        Args:
+            -veh: the vehicle to add
+        """
+        if veh.id not in self._rank:
+            self._rank[veh.id] = self._counter
+            self._counter += 1
+        self._vehicles[veh.id] = veh
+        veh._spatial_index = self
+        self.update_position(veh)
+        self.update_plan_end(veh)
+
+    def remove(self, veh: Vehicle):
+        """Method that removes a vehicle from the index.
+
+        Args:
+            -veh: the vehicle to remove
+        """
+        if self._vehicles.pop(veh.id, None) is not None:
+            self._rank.pop(veh.id)
+            self._move(self._position_grid, self._position_cells, veh, None)
+            self._move(self._plan_end_grid, self._plan_end_cells, veh, None)
+            self._plan_end_nodes.pop(veh.id, None)
+            self._plan_end_positions.pop(veh.id, None)
+        if veh._spatial_index is self:
+            veh._spatial_index = None
+
+    def update_position(self, veh: Vehicle):
+        """Method called by a vehicle of the index when its position changes.
+
+        Args:
+            -veh: the vehicle
+        """
+        position = veh.position
+        self._move(self._position_grid, self._position_cells, veh,
+                   self._cell(position) if position is not None else None)
+
+    def update_plan_end(self, veh: Vehicle):
+        """Method that updates the node at the end of the plan of a vehicle, called by the
+        fleet manager when the plan of a vehicle of the index changes.
+
+        Args:
+            -veh: the vehicle
+        """
+        if self.graph is None:
+            return
+        if veh.activities:
+            node = veh.activities[-1].node
+        else:
+            node = veh.activity.node if veh.activity is not None else None
+        if self._plan_end_nodes.get(veh.id) == node:
+            return
+        if node is None:
+            self._plan_end_nodes.pop(veh.id, None)
+            self._plan_end_positions.pop(veh.id, None)
+            self._move(self._plan_end_grid, self._plan_end_cells, veh, None)
+            return
+        self._plan_end_nodes[veh.id] = node
+        position = self._node_position(node)
+        self._plan_end_positions[veh.id] = position
+        self._move(self._plan_end_grid, self._plan_end_cells, veh, self._cell(position))
+
+    def _node_position(self, node: str):
+        # The nodes of the graph are copied once, and again only when a node has been added since
+        try:
+            return self._gnodes[node].position
+        except KeyError:
+            self._gnodes = self.graph.nodes
+            return self._gnodes[node].position
+
+    def refresh_plan_ends(self):
+        """Method that updates the plan end of all the vehicles of the index, it should be
+        called before querying the plan ends when the activities of the plans may have been modified.
+        """
+        for veh in self._vehicles.values():
+            self.update_plan_end(veh)
+
+    def _query_in_radius(self, grid, get_position, position: List[float], radius: float) -> List[Vehicle]:
+        cs = self.cell_size
+        x, y = position[0], position[1]
+        cx0, cx1 = floor((x - radius) / cs), floor((x + radius) / cs)
+        cy0, cy1 = floor((y - radius) / cs), floor((y + radius) / cs)
+        candidates = []
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) <= len(grid):
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    vehs = grid.get((cx, cy))
+                    if vehs:
+                        candidates.extend(vehs.values())
+        else:
+            for (cx, cy), vehs in grid.items():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    candidates.extend(vehs.values())
+        if not candidates:
+            return []
+        dist_vector = np.linalg.norm(np.array([get_position(v) for v in candidates]) - np.array(position), axis=1)
+        rank = self._rank
+        return sorted((v for v, d in zip(candidates, dist_vector) if d <= radius), key=lambda v: rank[v.id])
+
+    def vehicles_in_radius(self, position: List[float], radius: float) -> List[Vehicle]:
+        """Method that returns the vehicles currently located within a radius around a position.
+
+        Args:
+            -position: the center of the search
+            -radius: the radius of the search
+
+        Returns:
+            -vehs: the vehicles in radius, in the order they have been added to the index
+        """
+        return self._query_in_radius(self._position_grid, lambda v: v.position, position, radius)
+
+    def plan_ends_in_radius(self, position: List[float], radius: float) -> List[Vehicle]:
+        """Method that returns the vehicles whose plan ends within a radius around a position.
+
+        Args:
+            -position: the center of the search
+            -radius: the radius of the search
+
+        Returns:
+            -vehs: the vehicles in radius at the end of their plan, in the order they have been added to the index
+        """
+        positions = self._plan_end_positions
+        return self._query_in_radius(self._plan_end_grid, lambda v: positions[v.id], position, radius)
+
+    def nearest_vehicle(self, position: List[float]) -> Optional[Vehicle]:
+        """Method that returns the vehicle currently located the nearest from a position, the
+        cells are searched by rings of increasing size around the position.
+
+        Args:
+            -position: the position
+
+        Returns:
+            -veh: the nearest vehicle, the first added to the index in case of equal distances,
+                  None if no vehicle is located
+        """
+        grid = self._position_grid
+        if not grid:
+            return None
+        cx, cy = self._cell(position)
+        max_ring = max(max(abs(c[0] - cx), abs(c[1] - cy)) for c in grid)
+        rank = self._rank
+        position = np.array(position)
+        best = None
+        best_key = (float('inf'), 0)
+        for k in range(max_ring + 1):
+            if k == 0:
+                ring = [(cx, cy)]
+            else:
+                ring = [(cx + i, cy + j) for i in range(-k, k + 1) for j in (-k, k)] + \
+                       [(cx + i, cy + j) for i in (-k, k) for j in range(-k + 1, k)]
+            candidates = [v for c in ring for v in grid.get(c, {}).values()]
+            if candidates:
+                dist_vector = np.linalg.norm(np.array([v.position for v in candidates]) - position, axis=1)
+                for v, d in zip(candidates, dist_vector):
+                    key = (d, rank[v.id])
+                    if key < best_key:
+                        best, best_key = v, key
+            # Vehicles in the next rings are farther than k cells
+            if best_key[0] < k * self.cell_size:
+                break
+        return best
 
 
 class FleetManager(object):
     def __init__(self,
                  veh_type: Type[Vehicle],
                  mobility_service: str,
-                 is_personal: bool):
+                 is_personal: bool,
+                 graph=None,
+                 spatial_index_cell_size: float = 500):
         """
         Manage a fleet of Vehicles
 
@@ -16,26 +242,112 @@ class FleetManager(object):
             -veh_type: Type of vehicle
             -mobility_service: the associated mobility service
             -is_personal: bool specifying of the fleet manages personal vehicles or not
+            -graph: the graph on which the vehicles move, used to index the plan ends
+            -spatial_index_cell_size: size of the cells of the spatial index of the vehicles
         """
         self.__veh_manager = VehicleManager()
         self.vehicles: Dict[str, Vehicle] = dict()
         self._constructor: Type[Vehicle] = veh_type
         self._mobility_service = mobility_service
         self._is_personal = is_personal
+        self.spatial_index = FleetSpatialIndex(spatial_index_cell_size, graph)
+        self._vehicles_array = None
+        # Activity type of each vehicle, number of vehicles per activity type and idle vehicles,
+        # kept up to date by the vehicles at each modification of their plan
+        self._activity_types: Dict[str, Optional[ActivityType]] = dict()
+        self._activity_counts: Dict[Optional[ActivityType], int] = {a: 0 for a in ActivityType}
+        self._idle_vehicles: Dict[str, Vehicle] = dict()
+        self._idle_vehicles_array = None
+        self._rank: Dict[str, int] = dict()
+        self._counter = 0
 
     def create_vehicle(self, node: str, capacity: int, activities: Optional[List[VehicleActivity]]):
         new_veh = self._constructor(node, capacity, self._mobility_service, self._is_personal, activities=activities)
         self.vehicles[new_veh.id] = new_veh
         self.__veh_manager.add_vehicle(new_veh)
+        self.spatial_index.add(new_veh)
+        self._vehicles_array = None
+        self._rank[new_veh.id] = self._counter
+        self._counter += 1
+        new_veh._fleet = self
+        self.update_vehicle_plan(new_veh)
         return new_veh
 
     def create_waiting_vehicle(self, node: str, capacity: int):
         return self.create_vehicle(node, capacity, [VehicleActivityStop(node, is_done=False)])
 
     def delete_vehicle(self, vehid:str):
-        self.__veh_manager.remove_vehicle(self.vehicles[vehid])
+        veh = self.vehicles[vehid]
+        self.__veh_manager.remove_vehicle(veh)
+        self.spatial_index.remove(veh)
         del self.vehicles[vehid]
+        self._vehicles_array = None
+        self._activity_counts[self._activity_types.pop(vehid)] -= 1
+        if self._idle_vehicles.pop(vehid, None) is not None:
+            self._idle_vehicles_array = None
+        del self._rank[vehid]
+        veh._fleet = None
+
+    def update_vehicle_plan(self, veh: Vehicle):
+        """Method called by a vehicle of the fleet when its current activity or its next activities change.
+
+        Args:
+            -veh: the vehicle
+        """
+        activity_type = veh.activity_type
+        vehid = veh.id
+        previous_activity_type = self._activity_types.get(vehid, activity_type)
+        if vehid not in self._activity_types or previous_activity_type is not activity_type:
+            if vehid in self._activity_types:
+                self._activity_counts[previous_activity_type] -= 1
+            self._activity_types[vehid] = activity_type
+            self._activity_counts[activity_type] = self._activity_counts.get(activity_type, 0) + 1
+        is_idle = activity_type in _IDLE_ACTIVITY_TYPES and not veh.activities
+        if is_idle is not (vehid in self._idle_vehicles):
+            if is_idle:
+                self._idle_vehicles[vehid] = veh
+            else:
+                del self._idle_vehicles[vehid]
+            self._idle_vehicles_array = None
+        if veh._spatial_index is self.spatial_index:
+            self.spatial_index.update_plan_end(veh)
+
+    def is_idle(self, veh: Vehicle) -> bool:
+        """Method that returns if a vehicle of the fleet is idle, i.e. stopped or repositioning
+        without coming activities.
+
+        Args:
+            -veh: the vehicle
+        """
+        return veh.id in self._idle_vehicles
+
+    def idle_vehicles_array(self) -> np.ndarray:
+        """Method that returns the array of the idle vehicles of the fleet, in the order
+        they have been created, built once until a vehicle becomes idle or busy.
+        """
+        if self._idle_vehicles_array is None:
+            rank = self._rank
+            self._idle_vehicles_array = np.array(sorted(self._idle_vehicles.values(), key=lambda v: rank[v.id]))
+        return self._idle_vehicles_array
+
+    def count_idle_vehicles(self) -> int:
+        return len(self._idle_vehicles)
+
+    def count_vehicles(self, activity_type: Optional[ActivityType]) -> int:
+        """Method that returns the number of vehicles of the fleet currently performing an activity type.
+
+        Args:
+            -activity_type: the activity type, None counts the vehicles without current activity
+        """
+        return self._activity_counts.get(activity_type, 0)
+
+    def vehicles_array(self) -> np.ndarray:
+        """Method that returns the array of the vehicles of the fleet, built once
+        until a vehicle is created or deleted.
+        """
+        if self._vehicles_array is None:
+            self._vehicles_array = np.array(list(self.vehicles.values()))
+        return self._vehicles_array
 
     def vehicle_type(self):
         return self._constructor.__name__ if self._constructor is not None else None
-
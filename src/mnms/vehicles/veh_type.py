@@ -38,6 +38,8 @@ class VehicleActivity(ABC):
             user: the user linked to the activity
             is_done: indicates if the activity is terminated
             iter_path: the iterator of the path
+            duration_cache: the travel time of the path computed by a mobility service, reset when the path is modified
+            path_version: incremented at each modification of the path
 
     """
     activity_type: ActivityType
@@ -51,6 +53,9 @@ class VehicleActivity(ABC):
 
     is_done: bool = False
 
+    duration_cache: tuple = field(default=None, init=False, repr=False, compare=False)
+    path_version: int = field(default=0, init=False, repr=False, compare=False)
+
     def __post_init__(self):
         self.reset_path_iterator()
 
@@ -67,6 +72,8 @@ class VehicleActivity(ABC):
         if new_path:
             self.node = new_path[-1][0][1]
         self.reset_path_iterator()
+        self.duration_cache = None
+        self.path_version += 1
 
     def modify_path_and_next(self, new_path: _TYPE_PATH):
         """Method to update this activity path and set the iterator on path to the next node.
@@ -98,10 +105,12 @@ class VehicleActivity(ABC):
         return
 
     def copy(self):
-        return self.__class__(deepcopy(self.node),
-                              deepcopy(self.path),
-                              self.user,
-                              self.is_done)
+        new_activity = self.__class__(deepcopy(self.node),
+                                      deepcopy(self.path),
+                                      self.user,
+                                      self.is_done)
+        new_activity.duration_cache = self.duration_cache
+        return new_activity
 
 
 @dataclass(slots=True)
@@ -243,6 +252,72 @@ class VehicleActivityServing(VehicleActivity):
         self.user.notify(tcurrent)
 
 
+class VehiclePlan(deque):
+    """Deque of the next activities of a vehicle, the vehicle is notified of each modification."""
+
+    def __init__(self, activities=(), veh: "Vehicle" = None):
+        super(VehiclePlan, self).__init__(activities)
+        self._veh = veh
+
+    def _notify(self):
+        if self._veh is not None:
+            self._veh.plan_changed()
+
+    def append(self, activity):
+        super(VehiclePlan, self).append(activity)
+        self._notify()
+
+    def appendleft(self, activity):
+        super(VehiclePlan, self).appendleft(activity)
+        self._notify()
+
+    def extend(self, activities):
+        super(VehiclePlan, self).extend(activities)
+        self._notify()
+
+    def extendleft(self, activities):
+        super(VehiclePlan, self).extendleft(activities)
+        self._notify()
+
+    def insert(self, i, activity):
+        super(VehiclePlan, self).insert(i, activity)
+        self._notify()
+
+    def pop(self):
+        activity = super(VehiclePlan, self).pop()
+        self._notify()
+        return activity
+
+    def popleft(self):
+        activity = super(VehiclePlan, self).popleft()
+        self._notify()
+        return activity
+
+    def remove(self, activity):
+        super(VehiclePlan, self).remove(activity)
+        self._notify()
+
+    def clear(self):
+        super(VehiclePlan, self).clear()
+        self._notify()
+
+    def rotate(self, n=1):
+        super(VehiclePlan, self).rotate(n)
+        self._notify()
+
+    def __setitem__(self, i, activity):
+        super(VehiclePlan, self).__setitem__(i, activity)
+        self._notify()
+
+    def __delitem__(self, i):
+        super(VehiclePlan, self).__delitem__(i)
+        self._notify()
+
+    def __iadd__(self, activities):
+        self.extend(activities)
+        return self
+
+
 class Vehicle(TimeDependentSubject):
 
     _counter = 0
@@ -286,7 +361,12 @@ class Vehicle(TimeDependentSubject):
         self._dt_move = None
         self._achieved_path = []
         self._achieved_path_since_last_notify = []
+        self._spatial_index = None                  # spatial index of the fleet notified of the moves
+        self._fleet = None                          # fleet manager notified of the plan modifications
+        self._plan_version = 0                      # incremented at each plan modification
+        self.plan_durations = None                  # durations of the plan cached by the mobility service
 
+        self._activity = None
         self.activities: Deque[VehicleActivity] = deque([])
         self.activity = None                        # current activity
 
@@ -350,6 +430,30 @@ class Vehicle(TimeDependentSubject):
     def position(self):
         return self._position
 
+    @property
+    def activities(self) -> Deque[VehicleActivity]:
+        return self._activities
+
+    @activities.setter
+    def activities(self, activities: Deque[VehicleActivity]):
+        self._activities = VehiclePlan(activities, self)
+        self.plan_changed()
+
+    @property
+    def activity(self) -> VehicleActivity:
+        return self._activity
+
+    @activity.setter
+    def activity(self, activity: VehicleActivity):
+        self._activity = activity
+        self.plan_changed()
+
+    def plan_changed(self):
+        """Method called when the current activity or the next activities change."""
+        self._plan_version += 1
+        if self._fleet is not None:
+            self._fleet.update_vehicle_plan(self)
+
     @property
     def activity_type(self) -> ActivityType:
         return self.activity.activity_type if self.activity is not None else None
@@ -444,6 +548,8 @@ class Vehicle(TimeDependentSubject):
 
     def set_position(self, position: np.ndarray):
         self._position = position
+        if self._spatial_index is not None:
+            self._spatial_index.update_position(self)
 
     def drop_user(self, tcurrent:Time, user:'User', drop_pos:np.ndarray):
         log.info(f"{user} is dropped at {self._current_link[0]}")
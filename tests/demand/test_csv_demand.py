@@ -1,6 +1,7 @@
 import unittest
 from pathlib import Path
 from mnms.demand.manager import CSVDemandManager, CSVDemandParseError
+from mnms.graph.specific_layers import OriginDestinationLayer
 from mnms.time import Time
 
 import numpy as np
@@ -99,3 +100,16 @@ class TestCSVDemand(unittest.TestCase):
 
         with self.assertRaises(CSVDemandParseError):
             CSVDemandManager(self.file_bad_optional_columns2)
+
+    def test_demand_coordinate_snapped(self):
+        odlayer = OriginDestinationLayer()
+        odlayer.create_origin_node("ORIGIN_0", [10, 0])
+        odlayer.create_origin_node("ORIGIN_1", [1000, 1000])
+        odlayer.create_destination_node("DESTINATION_0", [0, 0])
+        odlayer.create_destination_node("DESTINATION_1", [990, 1000])
+        demand = CSVDemandManager(self.file_coordinate, odlayer=odlayer)
+        users = demand.get_next_departures(Time("07:00:00"), Time("08:00:00"))
+
+        self.assertEqual(demand._demand_type, "coordinate")
+        self.assertEqual(["ORIGIN_0", "ORIGIN_0"], [u.origin for u in users])
+        self.assertEqual(["DESTINATION_1", "DESTINATION_1"], [u.destination for u in users])
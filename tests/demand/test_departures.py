@@ -0,0 +1,38 @@
+import unittest
+
+from mnms.demand import User, DepartureQueue
+from mnms.time import Time
+
+
+class TestDepartureQueue(unittest.TestCase):
+    def setUp(self):
+        """Initiates the test.
+        """
+        self.users = [User('U0', '0', '1', Time('07:00:00')),
+                      User('U1', '0', '1', Time('07:00:30')),
+                      User('U2', '0', '1', Time('07:00:10')),
+                      User('U3', '0', '1', Time('07:00:30')),
+                      User('U4', '0', '1', Time('07:01:00'))]
+
+    def tearDown(self):
+        """Concludes and closes the test.
+        """
+
+    def test_pop_until(self):
+        queue = DepartureQueue(self.users)
+        self.assertEqual(5, len(queue))
+
+        self.assertEqual(['U0', 'U2'], [u.id for u in queue.pop_until(Time('07:00:30'))])
+        self.assertEqual(['U1', 'U3', 'U4'], [u.id for u in queue])
+        self.assertEqual([], queue.pop_until(Time('07:00:20')))
+        self.assertEqual(['U1', 'U3'], [u.id for u in queue.pop_until(Time('07:00:31'))])
+        self.assertEqual(1, len(queue))
+        self.assertEqual(['A', 'U4'], [u if isinstance(u, str) else u.id for u in ['A'] + queue])
+        self.assertEqual(['U4'], [u.id for u in queue.pop_until(Time('08:00:00'))])
+        self.assertEqual(0, len(queue))
+        self.assertEqual([], queue.pop_until(Time('09:00:00')))
+
+    def test_empty(self):
+        queue = DepartureQueue([])
+        self.assertEqual(0, len(queue))
+        self.assertEqual([], queue.pop_until(Time('07:00:00')))
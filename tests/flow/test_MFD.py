@@ -286,3 +286,36 @@ def test_move_veh_res_change():
 
     VehicleManager.empty()
     Vehicle._counter = 0
+
+
+def test_vehicle_zone_lookup():
+    roads = generate_line_road([0, 0], [0, 30], 4)
+    roads.add_zone(construct_zone_from_sections(roads, "LEFT", ["0_1", "1_2"]))
+    roads.add_zone(construct_zone_from_sections(roads, "RIGHT", ["2_3"]))
+
+    car_layer = CarLayer(roads, services=[PersonalMobilityService()])
+    car_layer.create_node("C0", "0")
+    car_layer.create_node("C3", "3")
+    car_layer.create_link("C0_C3", "C0", "C3", {}, ["0_1", "1_2", "2_3"])
+
+    mlgraph = MultiLayerGraph([car_layer])
+
+    flow = MFDFlowMotor()
+    flow.set_graph(mlgraph)
+    flow.add_reservoir(Reservoir(roads.zones["LEFT"], ["CAR"], lambda x: {k: 20 for k in x}))
+    flow.add_reservoir(Reservoir(roads.zones['RIGHT'], ["CAR"], lambda x: {k: 2 for k in x}))
+    flow.initialize()
+
+    veh = Vehicle('C0', 1, 'PersonalVehicle', True)
+    veh._current_link = ('C0', 'C3')
+    for remaining_length, res_id in [(30, 'LEFT'), (10.5, 'LEFT'), (10, 'RIGHT'), (0, 'RIGHT')]:
+        veh._remaining_link_length = remaining_length
+        assert res_id == flow.get_vehicle_zone(veh)
+    assert 0 == flow.nb_zone_errors
+
+    veh._current_link = ('C3', 'C0')
+    assert flow.get_vehicle_zone(veh) is None
+    assert 1 == flow.nb_zone_errors
+
+    VehicleManager.empty()
+    Vehicle._counter = 0
@@ -181,3 +181,51 @@ class TestCostsFunctions(unittest.TestCase):
             self.assertEqual(self.parse_costs(df__step[df__step['ID']=='ORIGIN_L1b_S2b']['COSTS'].iloc[0])['generalized_cost'], 2.)
             self.assertEqual(self.parse_costs(df__step[df__step['ID']=='L1a_S2a_DESTINATION']['COSTS'].iloc[0])['generalized_cost'], 0.)
             self.assertEqual(self.parse_costs(df__step[df__step['ID']=='L1b_S1b_DESTINATION']['COSTS'].iloc[0])['generalized_cost'], 0.)
+
+
+def test_update_graph_multi_reservoir_link():
+    roads = RoadDescriptor()
+    roads.register_node('0', [0, 0])
+    roads.register_node('1', [1000, 0])
+    roads.register_node('2', [4000, 0])
+    roads.register_section('0_1', '0', '1')
+    roads.register_section('1_2', '1', '2')
+    roads.add_zone(construct_zone_from_sections(roads, "res1", ["0_1"]))
+    roads.add_zone(construct_zone_from_sections(roads, "res2", ["1_2"]))
+
+    car_layer = CarLayer(roads, services=[PersonalMobilityService()])
+    car_layer.create_node('C0', '0')
+    car_layer.create_node('C1', '1')
+    car_layer.create_node('C2', '2')
+    car_layer.create_link('C0_C1', 'C0', 'C1', {}, ['0_1'])
+    car_layer.create_link('C0_C2', 'C0', 'C2', {}, ['0_1', '1_2'])
+
+    mlgraph = MultiLayerGraph([car_layer])
+    mlgraph.initialize_costs(1.42)
+
+    flow = MFDFlowMotor()
+    flow.set_graph(mlgraph)
+    flow.add_reservoir(Reservoir(roads.zones['res1'], ["CAR"], lambda x: {'CAR': 10}))
+    flow.add_reservoir(Reservoir(roads.zones['res2'], ["CAR"], lambda x: {'CAR': 2}))
+    flow.initialize()
+
+    flow.update_graph(0)
+    costs = mlgraph.graph.links['C0_C2'].costs['PersonalVehicle']
+    assert (1000*10 + 3000*2) / 4000 == costs['speed']
+    assert 4000 / costs['speed'] == costs['travel_time']
+    assert costs == car_layer.graph.links['C0_C2'].costs['PersonalVehicle']
+    assert 10 == mlgraph.graph.links['C0_C1'].costs['PersonalVehicle']['speed']
+
+    # Below threshold, costs are not updated
+    flow.reservoirs['res2'].f_speed = lambda x: {'CAR': 2.5}
+    flow.reservoirs['res2'].update_speeds()
+    flow.update_graph(1)
+    assert 4 == mlgraph.graph.links['C0_C2'].costs['PersonalVehicle']['speed']
+    flow.update_graph(0)
+    assert (1000*10 + 3000*2.5) / 4000 == mlgraph.graph.links['C0_C2'].costs['PersonalVehicle']['speed']
+
+    # Speeds written outside of the flow motor are taken into account
+    mlgraph.initialize_costs(1.42)
+    assert car_layer.default_speed == mlgraph.graph.links['C0_C2'].costs['PersonalVehicle']['speed']
+    flow.update_graph(1)
+    assert (1000*10 + 3000*2.5) / 4000 == mlgraph.graph.links['C0_C2'].costs['PersonalVehicle']['speed']
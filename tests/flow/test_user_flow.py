@@ -1,7 +1,10 @@
 import unittest
 from tempfile import TemporaryDirectory
 
-from mnms.demand.user import User, Path
+import numpy as np
+
+from mnms.demand import DepartureQueue
+from mnms.demand.user import User, Path, UserState, UserPathIndex
 from mnms.flow.user_flow import UserFlow
 from mnms.graph.layers import MultiLayerGraph, CarLayer, BusLayer
 from mnms.graph.road import RoadDescriptor
@@ -70,6 +73,7 @@ class TestUserFlow(unittest.TestCase):
         """
         self.tempfile.cleanup()
         VehicleManager.empty()
+        UserPathIndex.empty()
 
     def test_fill(self):
         self.assertTrue(self.mlgraph is self.user_flow._graph)
@@ -84,3 +88,128 @@ class TestUserFlow(unittest.TestCase):
         self.user_flow.step(Dt(minutes=1), [user])
 
         self.assertIn('U0', self.user_flow.users)
+
+    def test_waiting_answer_deadlines(self):
+        class FakeService:
+            _id = 'FAKE'
+            def __init__(self):
+                self.canceled = []
+            def cancel_request(self, uid):
+                self.canceled.append(uid)
+
+        service = FakeService()
+        users = [User('U0', '0', '4', Time('00:01:00'), response_dt=Dt(minutes=3)),
+                 User('U1', '0', '4', Time('00:01:00'), response_dt=Dt(minutes=1)),
+                 User('U2', '0', '4', Time('00:01:00'), response_dt=Dt(minutes=2))]
+        for u in users:
+            self.user_flow.users[u.id] = u
+            u.set_state_waiting_answer()
+            self.user_flow._register_waiting_answer(u, service)
+
+        self.assertEqual([], self.user_flow.check_user_waiting_answers(Dt(seconds=30)))
+        self.assertEqual([users[1]], self.user_flow.check_user_waiting_answers(Dt(seconds=30)))
+        self.assertEqual(['U1'], service.canceled)
+        self.assertIsNone(users[1].path)
+
+        # U2 got an answer, U0 requests again and restarts waiting
+        users[2].state = UserState.WAITING_VEHICLE
+        users[0].set_state_stop()
+        self.assertEqual([], self.user_flow.check_user_waiting_answers(Dt(seconds=30)))
+        users[0].set_state_waiting_answer()
+        self.user_flow._register_waiting_answer(users[0], service)
+        self.assertEqual([], self.user_flow.check_user_waiting_answers(Dt(seconds=60)))
+        self.assertEqual([], self.user_flow.check_user_waiting_answers(Dt(seconds=60)))
+        self.assertEqual([users[0]], self.user_flow.check_user_waiting_answers(Dt(seconds=60)))
+        self.assertEqual(['U1', 'U0'], service.canceled)
+        self.assertEqual({}, self.user_flow._waiting_answer)
+
+    def test_user_state_index(self):
+        users = [User(f'U{i}', '0', '4', Time('00:01:00')) for i in range(4)]
+        for u in users:
+            self.user_flow.user_states.add(u)
+        self.assertEqual(users, self.user_flow.user_states.users(UserState.STOP))
+
+        users[1].set_state_walking()
+        self.user_flow._walking['U1'] = 10
+        users[2].set_state_inside_vehicle()
+        users[0].set_state_inside_vehicle()
+        users[0].set_state_stop()
+        self.assertEqual([users[0], users[3]], self.user_flow.user_states.users(UserState.STOP))
+        self.assertEqual([users[1]], self.user_flow.user_states.users(UserState.WALKING))
+        self.assertEqual(1, self.user_flow.user_states.count(UserState.INSIDE_VEHICLE))
+
+        # Leaving the WALKING state removes the user from the walking users
+        users[1].set_state_deadend(Time('00:02:00'))
+        self.assertNotIn('U1', self.user_flow._walking)
+        self.assertEqual([users[1]], self.user_flow.user_states.users(UserState.DEADEND))
+
+        self.user_flow.user_states.remove(users[0])
+        users[0].set_state_walking()
+        self.assertEqual([users[3]], self.user_flow.user_states.users(UserState.STOP))
+        self.assertEqual([], self.user_flow.user_states.users(UserState.WALKING))
+        self.assertEqual(3, len(self.user_flow.user_states))
+
+    def test_batched_walking(self):
+        self.mlgraph.connect_layers('C1_B3', 'C1', 'L1_B3', 300, {})
+        self.user_flow._gnodes = self.mlgraph.graph.nodes
+        users = [User('U0', '0', '4', Time('00:01:00')), User('U1', '0', '4', Time('00:01:00'))]
+        for u, remaining in zip(users, [300, 50]):
+            u.set_path(Path(cost=300, nodes=['C1', 'L1_B3']))
+            u.current_node = 'C1'
+            u.current_link = ('C1', 'L1_B3')
+            u.set_state_walking()
+            self.user_flow.users[u.id] = u
+            self.user_flow.user_states.add(u)
+            self.user_flow._walking[u.id] = remaining
+
+        self.user_flow._user_walking(Dt(seconds=50))
+
+        # U0 keeps walking on its link
+        self.assertAlmostEqual(300 - 71, self.user_flow._walking['U0'])
+        self.assertAlmostEqual(300 - 71, users[0].remaining_link_length)
+        self.assertAlmostEqual(71, users[0].distance)
+        gnodes = self.mlgraph.graph.nodes
+        direction = np.array(gnodes['L1_B3'].position) - np.array(gnodes['C1'].position)
+        expected_position = np.array(gnodes['C1'].position) + direction / np.linalg.norm(direction) * (np.linalg.norm(direction) - (300 - 71))
+        np.testing.assert_allclose(expected_position, users[0].position)
+        # U1 arrives at destination
+        self.assertEqual(UserState.ARRIVED, users[1].state)
+        self.assertAlmostEqual(50, users[1].distance)
+        self.assertEqual(Time('00:01:00').add_time(Dt(seconds=50/1.42)), users[1].arrival_time)
+        self.assertNotIn('U1', self.user_flow.users)
+        self.assertEqual(['U0'], list(self.user_flow._walking))
+
+    def test_find_users_on_links(self):
+        users = [User(f'U{i}', '0', '4', Time('00:01:00')) for i in range(4)]
+        users[0].set_path(Path(cost=0, nodes=['C0', 'C1']))
+        users[1].set_path(Path(cost=0, nodes=['C0', 'C2', 'L1_B2', 'L1_B3']))
+        users[2].set_path(Path(cost=0, nodes=['C0', 'C2', 'L1_B2']))
+        users[3].set_path(Path(cost=0, nodes=['C0', 'C2']))
+        self.user_flow.step(Dt(minutes=0), [users[2], users[1]])
+        new_users = DepartureQueue([users[3], users[0]])
+
+        self.assertEqual([users[2], users[1], users[3]],
+                         self.user_flow.find_users_on_links([('C0', 'C2'), ('C2', 'C3')], new_users))
+        self.assertEqual([users[1]], self.user_flow.find_users_on_links([('L1_B2', 'L1_B3')], new_users))
+        self.assertEqual([users[0]], self.user_flow.find_users_on_links([('C0', 'C1')], [users[0]]))
+
+        # The index follows the paths of the users
+        users[2].interrupt_path(Time('00:01:00'))
+        users[3].set_path(Path(cost=0, nodes=['C0', 'C1']))
+        self.assertEqual([users[1]], self.user_flow.find_users_on_links([('C0', 'C2')], new_users))
+        self.assertEqual([users[3], users[0]], self.user_flow.find_users_on_links([('C0', 'C1')], new_users))
+        users[1].finish_trip(Time('00:02:00'))
+        self.assertEqual([], self.user_flow.find_users_on_links([('C0', 'C2')], new_users))
+
+    def test_find_users_on_links_same_id(self):
+        user = User('U0', '0', '4', Time('00:01:00'))
+        user.set_path(Path(cost=0, nodes=['C0', 'C2', 'L1_B2']))
+        self.user_flow.step(Dt(minutes=0), [user])
+
+        # Another user object with the same id, e.g. from a demand horizon, does not hide the user
+        other = User('U0', '0', '4', Time('00:01:00'))
+        self.assertEqual([user], self.user_flow.find_users_on_links([('C0', 'C2')]))
+        other.set_path(Path(cost=0, nodes=['C0', 'C2']))
+        departing = User('U0', '0', '4', Time('00:01:00'))
+        self.assertEqual([user], self.user_flow.find_users_on_links([('C0', 'C2')], DepartureQueue([departing])))
+        self.assertEqual([user, other], self.user_flow.find_users_on_links([('C0', 'C2')], DepartureQueue([other])))
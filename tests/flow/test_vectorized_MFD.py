@@ -0,0 +1,89 @@
+import unittest
+
+import numpy as np
+import pytest
+
+from mnms.demand import User
+from mnms.demand.user import Path
+from mnms.flow.MFD import MFDFlowMotor, Reservoir
+from mnms.flow.vectorized_MFD import VectorizedMFDFlowMotor
+from mnms.generation.roads import generate_line_road
+from mnms.generation.layers import generate_matching_origin_destination_layer
+from mnms.graph.layers import MultiLayerGraph, CarLayer
+from mnms.graph.zone import construct_zone_from_sections
+from mnms.mobility_service.abstract import Request
+from mnms.mobility_service.personal_vehicle import PersonalMobilityService
+from mnms.time import Dt, Time
+from mnms.vehicles.manager import VehicleManager
+from mnms.vehicles.veh_type import Vehicle
+
+
+def run_line_scenario(flow_motor_class, nb_steps):
+    roads = generate_line_road([0, 0], [0, 400], 5)
+    roads.add_zone(construct_zone_from_sections(roads, "LEFT", ["0_1", "1_2"]))
+    roads.add_zone(construct_zone_from_sections(roads, "RIGHT", ["2_3", "3_4"]))
+
+    personal_car = PersonalMobilityService()
+    car_layer = CarLayer(roads, services=[personal_car])
+    car_layer.create_node("C0", "0")
+    car_layer.create_node("C2", "2")
+    car_layer.create_node("C4", "4")
+    car_layer.create_link("C0_C2", "C0", "C2", {}, ["0_1", "1_2"])
+    car_layer.create_link("C2_C4", "C2", "C4", {}, ["2_3", "3_4"])
+    car_layer.create_link("C0_C4", "C0", "C4", {}, ["0_1", "1_2", "2_3", "3_4"])
+
+    mlgraph = MultiLayerGraph([car_layer], generate_matching_origin_destination_layer(roads), 1e-3)
+    mlgraph.initialize_costs(1.42)
+
+    flow = flow_motor_class()
+    flow.set_graph(mlgraph)
+    flow.add_reservoir(Reservoir(roads.zones["LEFT"], ["CAR"], lambda x: {k: 7.3 for k in x}))
+    flow.add_reservoir(Reservoir(roads.zones["RIGHT"], ["CAR"], lambda x: {k: 3.1 for k in x}))
+    flow.set_time(Time('09:00:00'))
+    flow.initialize()
+
+    users = [User('U0', '0', '4', Time('09:00:00')), User('U1', '0', '4', Time('09:00:00'))]
+    users[0].set_path(Path(400, ['C0', 'C4', 'DESTINATION_4']))
+    users[1].set_path(Path(400, ['C0', 'C2', 'C4', 'DESTINATION_4']))
+    for user in users:
+        personal_car.add_request(user, 'C4', Time('09:00:00'))
+        personal_car.matching(Request(user, 'C4', Time('09:00:00')), Dt(seconds=1))
+
+    states = []
+    for _ in range(nb_steps):
+        flow.step(Dt(seconds=5))
+        flow.update_time(Dt(seconds=5))
+        for veh in personal_car.fleet.vehicles.values():
+            states.append((veh.id, veh.current_link, veh.remaining_link_length, veh.distance,
+                           None if veh.position is None else tuple(veh.position), veh.speed))
+    trip_lengths = {rid: res.trip_lengths for rid, res in flow.reservoirs.items()}
+    return states, trip_lengths, [u.distance for u in users]
+
+
+class TestVectorizedMFDFlowMotor(unittest.TestCase):
+    def tearDown(self):
+        """Concludes and closes the test.
+        """
+        VehicleManager.empty()
+        Vehicle.reset_counter()
+
+    def test_same_results_as_mfd_flow_motor(self):
+        ref_states, ref_trip_lengths, ref_user_distances = run_line_scenario(MFDFlowMotor, 30)
+        # Start the second run with the same vehicles ids
+        VehicleManager.empty()
+        Vehicle.reset_counter()
+        states, trip_lengths, user_distances = run_line_scenario(VectorizedMFDFlowMotor, 30)
+
+        assert ref_states == states
+        assert ref_trip_lengths == trip_lengths
+        assert ref_user_distances == user_distances
+        assert len(ref_trip_lengths["LEFT"]["CAR"]) == 2
+
+    def test_batched_move(self):
+        states, _, user_distances = run_line_scenario(VectorizedMFDFlowMotor, 2)
+        veh_id, link, remaining_length, distance, position, speed = states[-2]
+        assert ('C0', 'C4') == link
+        assert 400 - 2*5*7.3 == pytest.approx(remaining_length)
+        assert 2*5*7.3 == pytest.approx(distance)
+        assert np.allclose([0, 2*5*7.3], position)
+        assert 7.3 == speed
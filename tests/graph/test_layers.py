@@ -1,7 +1,10 @@
 import unittest
 
+import numpy as np
+
 from mnms.graph.layers import CarLayer, BusLayer
 from mnms.graph.road import RoadDescriptor
+from mnms.graph.specific_layers import OriginDestinationLayer
 from mnms.graph.zone import construct_zone_from_sections
 from mnms.mobility_service.personal_vehicle import PersonalMobilityService
 from mnms.mobility_service.public_transport import PublicTransportMobilityService
@@ -143,3 +146,26 @@ class TestSerializationLayers(unittest.TestCase):
         self.assertDictEqual(new_bus_layer.map_reference_nodes, bus_layer.map_reference_nodes)
         self.assertSetEqual(set(new_bus_layer.graph.nodes.keys()), set(bus_layer.graph.nodes.keys()))
         self.assertSetEqual(set(new_bus_layer.graph.links.keys()), set(bus_layer.graph.links.keys()))
+
+    def test_odlayer_nearest_nodes(self):
+        odlayer = OriginDestinationLayer()
+        odlayer.create_origin_node("O0", [0, 0])
+        odlayer.create_origin_node("O1", [2, 0])
+        odlayer.create_origin_node("O2", [0, 2])
+        odlayer.create_destination_node("D0", np.array([5, 5]))
+
+        self.assertEqual(["O0", "O1", "O2"], odlayer.nearest_origins(np.array([[0.2, 0.1], [1.9, -3], [0.5, 1.8]])))
+        # Among equidistant nodes the first created one is returned
+        self.assertEqual(["O0", "O1"], odlayer.nearest_origins([[1, 0], [2, 1]]))
+        self.assertEqual("D0", odlayer.nearest_destination([0, 0]))
+        self.assertEqual([], odlayer.nearest_destinations([]))
+
+        # The index follows the creation of nodes
+        odlayer.create_origin_node("O3", [1, 0.1])
+        self.assertEqual("O3", odlayer.nearest_origin(np.array([1, 0])))
+
+        # No node to search
+        odlayer = OriginDestinationLayer()
+        odlayer.create_origin_node("O0", [0, 0])
+        self.assertEqual([], odlayer.nearest_destinations(np.empty((0, 2))))
+        self.assertEqual([], odlayer.nearest_destinations([[0, 0]]))
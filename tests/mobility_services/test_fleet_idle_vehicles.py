@@ -0,0 +1,77 @@
+import unittest
+from collections import deque
+
+import numpy as np
+
+from mnms.generation.roads import generate_manhattan_road
+from mnms.generation.layers import generate_layer_from_roads
+from mnms.mobility_service.on_demand import OnDemandMobilityService
+from mnms.mobility_service.filters import IsIdle
+from mnms.vehicles.veh_type import ActivityType, VehicleActivityRepositioning, VehicleActivityStop, \
+    VehicleActivityPickup
+from mnms.vehicles.manager import VehicleManager
+from mnms.demand.user import User
+from mnms.time import Time
+
+
+class TestFleetIdleVehicles(unittest.TestCase):
+    def setUp(self):
+        """Initiates the test.
+        """
+        roads = generate_manhattan_road(5, 100, extended=False)
+        self.service = OnDemandMobilityService('UBER', 0)
+        self.layer = generate_layer_from_roads(roads, 'RIDEHAILING', mobility_services=[self.service])
+        self.nodes = list(self.layer.graph.nodes.keys())
+        for i in range(50):
+            self.service.create_waiting_vehicle(self.nodes[i % len(self.nodes)])
+        self.fleet = self.service.fleet
+        self.user = User('U0', self.nodes[0], self.nodes[-1], Time('07:00:00'))
+        self.vehs = self.service.get_all_vehicles()
+
+    def tearDown(self):
+        """Concludes and closes the test.
+        """
+        VehicleManager.empty()
+
+    def assert_fleet_consistent(self):
+        expected = [veh for veh in self.vehs if veh.activity_type in [ActivityType.STOP, ActivityType.REPOSITIONING]
+                    and not veh.activities]
+        self.assertEqual(expected, list(self.service.get_idle_vehicles()))
+        self.assertEqual(len(expected), self.fleet.count_idle_vehicles())
+        self.assertEqual([veh in expected for veh in self.vehs], IsIdle(self.fleet).get_mask(self.layer, self.vehs))
+        self.assertEqual(IsIdle().get_mask(self.layer, self.vehs), IsIdle(self.fleet).get_mask(self.layer, self.vehs))
+        for activity_type in ActivityType:
+            self.assertEqual(sum(veh.activity_type is activity_type for veh in self.vehs),
+                             self.fleet.count_vehicles(activity_type))
+
+    def test_idle_vehicles(self):
+        self.assert_fleet_consistent()
+        self.assertEqual(len(self.vehs), self.fleet.count_vehicles(ActivityType.STOP))
+
+        rng = np.random.default_rng(0)
+        for _ in range(300):
+            veh = self.vehs[rng.integers(len(self.vehs))]
+            node = self.nodes[rng.integers(len(self.nodes))]
+            action = rng.integers(6)
+            if action == 0:
+                veh.add_activities([VehicleActivityRepositioning(node)])
+            elif action == 1:
+                veh.activities.insert(0, VehicleActivityStop(node))
+            elif action == 2 and veh.activities:
+                veh.next_activity(None)
+            elif action == 3 and veh.activities:
+                veh.override_current_activity(None)
+            elif action == 4:
+                veh.activities = deque([VehicleActivityStop(node)] * int(rng.integers(2)))
+            elif action == 5:
+                veh.activity = VehicleActivityPickup(node, user=self.user) if rng.integers(2) else VehicleActivityStop(node)
+            self.assert_fleet_consistent()
+
+    def test_delete_vehicle(self):
+        veh = self.vehs[0]
+        self.fleet.delete_vehicle(veh.id)
+        self.vehs = self.vehs[1:]
+        self.assert_fleet_consistent()
+        # The deleted vehicle does not notify the fleet anymore
+        veh.add_activities([VehicleActivityRepositioning(self.nodes[0])])
+        self.assert_fleet_consistent()
@@ -0,0 +1,94 @@
+import unittest
+
+import numpy as np
+
+from mnms.generation.roads import generate_manhattan_road
+from mnms.generation.layers import generate_layer_from_roads
+from mnms.mobility_service.on_demand import OnDemandMobilityService
+from mnms.mobility_service.filters import InRadiusFilter, PlanEndsInRadiusFilter, IsNearestFilter
+from mnms.vehicles.veh_type import VehicleActivityRepositioning
+from mnms.vehicles.manager import VehicleManager
+
+
+class TestFleetSpatialIndex(unittest.TestCase):
+    def setUp(self):
+        """Initiates the test.
+        """
+        roads = generate_manhattan_road(10, 100, extended=False)
+        self.service = OnDemandMobilityService('UBER', 0)
+        self.layer = generate_layer_from_roads(roads, 'RIDEHAILING', mobility_services=[self.service])
+        self.nodes = list(self.layer.graph.nodes.keys())
+        self.rng = np.random.default_rng(0)
+        for i in range(200):
+            self.service.create_waiting_vehicle(self.nodes[i % len(self.nodes)])
+        self.vehs = self.service.get_all_vehicles()
+        self.index = self.service.fleet.spatial_index
+
+    def tearDown(self):
+        """Concludes and closes the test.
+        """
+        VehicleManager.empty()
+
+    def move_vehicles(self):
+        for veh in self.vehs:
+            veh.set_position(self.rng.uniform(-100, 1000, 2))
+
+    def test_in_radius(self):
+        self.move_vehicles()
+        for _ in range(50):
+            position = self.rng.uniform(-100, 1000, 2)
+            radius = self.rng.uniform(0, 500)
+            expected = InRadiusFilter(radius).get_mask(self.layer, self.vehs, position)
+            self.assertEqual(list(self.vehs[expected]), self.index.vehicles_in_radius(position, radius))
+            mask = InRadiusFilter(radius, self.index).get_mask(self.layer, self.vehs, position)
+            np.testing.assert_array_equal(expected, mask)
+
+    def test_nearest(self):
+        self.move_vehicles()
+        for _ in range(50):
+            position = self.rng.uniform(-500, 1500, 2)
+            expected = IsNearestFilter().get_mask(self.layer, self.vehs, position)
+            mask = IsNearestFilter(self.index).get_mask(self.layer, self.vehs, position)
+            self.assertEqual(expected, mask)
+
+        # Vehicles which are not those of the index, with the same number of vehicles
+        other_service = OnDemandMobilityService('LYFT', 0)
+        other_layer = generate_layer_from_roads(generate_manhattan_road(10, 100, extended=False), 'RIDEHAILING2',
+                                                mobility_services=[other_service])
+        other_veh = other_service.create_waiting_vehicle(next(iter(other_layer.graph.nodes)))
+        position = self.rng.uniform(-500, 1500, 2)
+        other_veh.set_position(position)
+        vehs = list(self.vehs[:-1]) + [other_veh]
+        self.assertEqual([veh is other_veh for veh in vehs], list(IsNearestFilter(self.index).get_mask(self.layer, vehs, position)))
+
+        # Equal distances, the first vehicle wins
+        for veh in self.vehs:
+            veh.set_position(np.array([50., 50.]))
+        self.assertIs(self.vehs[0], self.index.nearest_vehicle([0, 0]))
+
+    def test_plan_ends(self):
+        # Adding activities updates the plan ends
+        for veh in self.vehs[:100]:
+            veh.add_activities([VehicleActivityRepositioning(self.rng.choice(self.nodes))])
+        for _ in range(20):
+            position = self.rng.uniform(0, 900, 2)
+            expected = PlanEndsInRadiusFilter(250).get_mask(self.layer, self.vehs, position)
+            self.assertEqual(list(self.vehs[expected]), self.index.plan_ends_in_radius(position, 250))
+
+        # Other plan modifications are caught by a refresh
+        for veh in self.vehs[100:]:
+            veh.activity.node = self.rng.choice(self.nodes)
+        self.index.refresh_plan_ends()
+        for _ in range(20):
+            position = self.rng.uniform(0, 900, 2)
+            expected = PlanEndsInRadiusFilter(250).get_mask(self.layer, self.vehs, position)
+            mask = PlanEndsInRadiusFilter(250, self.index).get_mask(self.layer, self.vehs, position)
+            np.testing.assert_array_equal(expected, mask)
+
+    def test_delete_vehicle(self):
+        self.move_vehicles()
+        veh = self.vehs[0]
+        self.service.fleet.delete_vehicle(veh.id)
+        self.assertNotIn(veh, self.index)
+        self.assertNotIn(veh, self.index.vehicles_in_radius(veh.position, 1))
+        self.assertEqual(len(self.vehs) - 1, len(self.service.get_all_vehicles()))
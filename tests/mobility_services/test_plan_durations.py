@@ -0,0 +1,113 @@
+import unittest
+
+import numpy as np
+from hipop.shortest_path import dijkstra
+
+from mnms.generation.roads import generate_manhattan_road
+from mnms.generation.layers import generate_layer_from_roads
+from mnms.mobility_service.abstract import compute_path_travel_time
+from mnms.mobility_service.on_demand import OnDemandMobilityService
+from mnms.time import Dt
+from mnms.vehicles.manager import VehicleManager
+from mnms.vehicles.veh_type import VehicleActivityRepositioning
+
+
+class TestPlanDurations(unittest.TestCase):
+    def setUp(self):
+        """Initiates the test.
+        """
+        roads = generate_manhattan_road(6, 100, extended=False)
+        self.service = OnDemandMobilityService('UBER', 0)
+        self.layer = generate_layer_from_roads(roads, 'RIDEHAILING', mobility_services=[self.service])
+        rng = np.random.default_rng(0)
+        for un, node in self.layer.graph.nodes.items():
+            for dn, link in node.adj.items():
+                speed = float(rng.integers(5, 15))
+                link.update_costs({'UBER': {'travel_time': 100 / speed, 'length': 100, 'speed': speed}})
+        self.gnodes = self.layer.graph.nodes
+        self.service.gnodes = self.gnodes
+        self.nodes = list(self.gnodes.keys())
+
+        activities = [VehicleActivityRepositioning(self.nodes[35], self.veh_path(self.nodes[0], self.nodes[35])),
+                      VehicleActivityRepositioning(self.nodes[5], self.veh_path(self.nodes[35], self.nodes[5])),
+                      VehicleActivityRepositioning(self.nodes[30], self.veh_path(self.nodes[5], self.nodes[30]))]
+        self.veh = self.service.fleet.create_vehicle(self.nodes[0], 4, activities)
+        # Move the vehicle on the third link of its current activity
+        self.veh._current_node = self.veh.activity.path[2][0][0]
+        self.veh._remaining_link_length = 40
+
+    def tearDown(self):
+        """Concludes and closes the test.
+        """
+        VehicleManager.empty()
+
+    def veh_path(self, origin, destination):
+        nodes, _ = dijkstra(self.layer.graph, origin, destination, 'travel_time', {'RIDEHAILING': 'UBER'}, {'RIDEHAILING'})
+        return [((u, d), 100) for u, d in zip(nodes[:-1], nodes[1:])]
+
+    def expected_remaining_plan_duration(self, veh):
+        service_dt = Dt()
+        veh_curr_act_path_nodes = veh.path_to_nodes(veh.activity.path)
+        veh_curr_node_ind_in_path = veh_curr_act_path_nodes.index(veh.current_node)
+        service_dt += Dt(seconds=compute_path_travel_time(veh.activity.path[veh_curr_node_ind_in_path+1:], self.gnodes, 'UBER'))
+        current_link = self.gnodes[veh.current_node].adj[veh_curr_act_path_nodes[veh_curr_node_ind_in_path+1]]
+        service_dt += Dt(seconds=veh.remaining_link_length / current_link.costs['UBER']['speed'])
+        for a in veh.activities:
+            service_dt += Dt(seconds=compute_path_travel_time(a.path, self.gnodes, 'UBER'))
+        return service_dt
+
+    def test_remaining_plan_duration(self):
+        self.assertEqual(self.expected_remaining_plan_duration(self.veh), self.service.estimate_remaining_plan_duration(self.veh))
+        durations = self.veh.plan_durations
+        self.assertEqual(2, len(durations.next_activities_cumulated_ticks))
+
+        # The durations are reused while the vehicle moves
+        self.veh._current_node = self.veh.activity.path[3][0][0]
+        self.veh._remaining_link_length = 60
+        self.assertEqual(self.expected_remaining_plan_duration(self.veh), self.service.estimate_remaining_plan_duration(self.veh))
+        self.assertIs(durations, self.veh.plan_durations)
+
+    def test_invalidation_on_plan_modification(self):
+        self.service.estimate_remaining_plan_duration(self.veh)
+        durations = self.veh.plan_durations
+
+        self.veh.add_activities([VehicleActivityRepositioning(self.nodes[0], self.veh_path(self.nodes[30], self.nodes[0]))])
+        self.assertEqual(self.expected_remaining_plan_duration(self.veh), self.service.estimate_remaining_plan_duration(self.veh))
+        self.assertIsNot(durations, self.veh.plan_durations)
+        self.assertEqual(3, len(self.veh.plan_durations.next_activities_cumulated_ticks))
+
+        # Modifying the path of a next activity only updates the durations of the next activities
+        durations = self.veh.plan_durations
+        self.veh.activities[0].modify_path(self.veh_path(self.nodes[35], self.nodes[4]))
+        self.assertEqual(self.expected_remaining_plan_duration(self.veh), self.service.estimate_remaining_plan_duration(self.veh))
+        self.assertIs(durations, self.veh.plan_durations)
+
+        # Modifying the path of an activity outside of the plan keeps the durations
+        VehicleActivityRepositioning(self.nodes[0]).modify_path(self.veh_path(self.nodes[5], self.nodes[0]))
+        self.service.estimate_remaining_plan_duration(self.veh)
+        self.assertIs(durations, self.veh.plan_durations)
+
+        # Modifying the path of the current activity invalidates the durations
+        current_path = self.veh.activity.path
+        self.veh.activity.modify_path(current_path[:2] + self.veh_path(current_path[2][0][0], self.nodes[29]))
+        self.assertEqual(self.expected_remaining_plan_duration(self.veh), self.service.estimate_remaining_plan_duration(self.veh))
+        self.assertIsNot(durations, self.veh.plan_durations)
+
+    def test_invalidation_on_costs_update(self):
+        self.service.estimate_remaining_plan_duration(self.veh)
+        a = self.veh.activities[0]
+        link = self.gnodes[a.path[0][0][0]].adj[a.path[0][0][1]]
+        link.update_costs({'UBER': {'travel_time': 100, 'length': 100, 'speed': 1}})
+        self.layer.notify_link_costs_changed()
+        self.assertEqual(self.expected_remaining_plan_duration(self.veh), self.service.estimate_remaining_plan_duration(self.veh))
+
+    def test_activity_duration_copy(self):
+        a = self.veh.activities[0]
+        ticks = self.service.activity_duration(a)
+        self.assertEqual(Dt(seconds=compute_path_travel_time(a.path, self.gnodes, 'UBER')).ticks, ticks)
+        copied = a.copy()
+        self.assertEqual(a.duration_cache, copied.duration_cache)
+        copied.modify_path(self.veh_path(self.nodes[35], self.nodes[4]))
+        self.assertIsNone(copied.duration_cache)
+        self.assertEqual(Dt(seconds=compute_path_travel_time(copied.path, self.gnodes, 'UBER')).ticks,
+                         self.service.activity_duration(copied))
@@ -182,3 +182,20 @@ class TestPublicTransport(unittest.TestCase):
         link_list_bus2 = dfveh2['LINK'].tolist()
         link_list_bus2 = [l for i,l in enumerate(link_list_bus2) if i == 0 or (i > 0 and l != link_list_bus2[i-1])]
         self.assertEqual(link_list_bus2, ['L0r-_S2r L0r-_S1r'])
+
+    def test_estimate_pickup_time_for_planning(self):
+        roads = generate_line_road([0, 0], [0, 3000], 4)
+        roads.register_stop('S0', '0_1', 0.10)
+        roads.register_stop('S1', '1_2', 0.50)
+        bus_service = PublicTransportMobilityService('B0')
+        pblayer = PublicTransportLayer(roads, 'BUS', Bus, 13, services=[bus_service])
+        pblayer.create_line('L0',
+                            ['S0', 'S1'],
+                            [['0_1', '1_2']],
+                            TimeTable([Time('07:00:00'), Time('07:10:00'), Time('07:30:00')]))
+
+        # Half of the headway at the current time
+        bus_service.set_time(Time('07:05:00'))
+        self.assertEqual(300, bus_service.estimate_pickup_time_for_planning('L0_S0'))
+        bus_service.set_time(Time('07:15:00'))
+        self.assertEqual(600, bus_service.estimate_pickup_time_for_planning('L0_S0'))
@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+from hipop.shortest_path import dijkstra
+
+from mnms.generation.roads import generate_manhattan_road
+from mnms.generation.layers import generate_layer_from_roads
+from mnms.mobility_service.abstract import reverse_dijkstra, reverse_dijkstra_path
+from mnms.mobility_service.on_demand import OnDemandMobilityService
+from mnms.demand.user import User
+from mnms.time import Time, Dt
+from mnms.vehicles.manager import VehicleManager
+
+
+class TestReverseSearch(unittest.TestCase):
+    def setUp(self):
+        """Initiates the test.
+        """
+        roads = generate_manhattan_road(6, 100, extended=False)
+        self.service = OnDemandMobilityService('UBER', 0)
+        self.layer = generate_layer_from_roads(roads, 'RIDEHAILING', mobility_services=[self.service])
+        rng = np.random.default_rng(0)
+        for un, node in self.layer.graph.nodes.items():
+            for dn, link in node.adj.items():
+                link.update_costs({'UBER': {'travel_time': float(rng.integers(5, 20)), 'length': 100, 'speed': 10}})
+        self.gnodes = self.layer.graph.nodes
+        self.nodes = list(self.gnodes.keys())
+
+    def tearDown(self):
+        """Concludes and closes the test.
+        """
+        VehicleManager.empty()
+
+    def test_reverse_dijkstra(self):
+        target = self.nodes[14]
+        settled = reverse_dijkstra(self.gnodes, target, 'UBER')
+        self.assertEqual(len(self.nodes), len(settled))
+        for source in self.nodes:
+            path, tt = reverse_dijkstra_path(settled, source)
+            expected_path, expected_tt = dijkstra(self.layer.graph, source, target, 'travel_time',
+                                                  {'RIDEHAILING': 'UBER'}, {'RIDEHAILING'})
+            self.assertAlmostEqual(expected_tt, tt)
+            self.assertEqual(len(expected_path), len(path))
+            if path:
+                self.assertEqual(source, path[0])
+                self.assertEqual(target, path[-1])
+                self.assertAlmostEqual(tt, sum(self.gnodes[u].adj[d].costs['UBER']['travel_time']
+                                               for u, d in zip(path[:-1], path[1:])))
+
+    def test_bounded_reverse_dijkstra(self):
+        target = self.nodes[0]
+        settled = reverse_dijkstra(self.gnodes, target, 'UBER', max_cost=30)
+        self.assertTrue(all(c <= 30 for c, _ in settled.values()))
+        far_node = self.nodes[-1]
+        self.assertEqual(([], float('inf')), reverse_dijkstra_path(settled, far_node))
+
+        # The search stops once all the sources are reached
+        settled = reverse_dijkstra(self.gnodes, target, 'UBER', sources=[self.nodes[1]])
+        self.assertIn(self.nodes[1], settled)
+        self.assertLess(len(settled), len(self.nodes))
+
+    def test_fifo_candidates(self):
+        user = User('U0', self.nodes[14], self.nodes[0], Time('07:00:00'))
+        user.current_node = self.nodes[14]
+        user.set_pickup_dt('UBER', Dt(seconds=40))
+        origins = [self.nodes[0], self.nodes[13], self.nodes[14], self.nodes[35]]
+        paths = self.service.compute_paths_to_user(origins, user)
+        self.service.reverse_search = False
+        expected_paths = self.service.compute_paths_to_user(origins, user)
+        for (path, tt), (expected_path, expected_tt) in zip(paths, expected_paths):
+            if expected_tt > 40:
+                # Beyond the pickup tolerance
+                self.assertEqual(float('inf'), tt)
+            else:
+                self.assertAlmostEqual(expected_tt, tt)
+                self.assertEqual(len(expected_path), len(path))
@@ -0,0 +1,90 @@
+import unittest
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from mnms.demand.user import User
+from mnms.generation.roads import generate_manhattan_road
+from mnms.generation.layers import generate_layer_from_roads
+from mnms.graph.zone import LayerZone
+from mnms.mobility_service.on_demand import OnDemandMobilityService, sparse_assignment
+from mnms.time import Time, Dt
+from mnms.vehicles.manager import VehicleManager
+
+
+class TestSparseAssignment(unittest.TestCase):
+    def test_same_optimum_as_dense_assignment(self):
+        rng = np.random.default_rng(0)
+        inf = 10e8
+        for nb_rows, nb_cols in [(5, 8), (8, 5), (30, 30), (50, 20)]:
+            for density in [0.05, 0.2, 0.6]:
+                dense = np.full((nb_rows, nb_cols), inf)
+                feasible = rng.random((nb_rows, nb_cols)) < density
+                dense[feasible] = rng.integers(0, 300, feasible.sum())
+                rows, cols = np.nonzero(feasible)
+                costs = dense[rows, cols]
+
+                matched_pairs = sparse_assignment(rows, cols, costs, inf)
+
+                row_ind, col_ind = linear_sum_assignment(dense)
+                matched = dense[row_ind, col_ind] < inf
+                self.assertEqual(matched.sum(), len(matched_pairs))
+                self.assertAlmostEqual(dense[row_ind, col_ind][matched].sum(), costs[matched_pairs].sum())
+                # Each row and column is matched at most once, pairs are sorted by row
+                self.assertEqual(len(matched_pairs), len(set(rows[matched_pairs])))
+                self.assertEqual(len(matched_pairs), len(set(cols[matched_pairs])))
+                self.assertEqual(sorted(rows[matched_pairs]), list(rows[matched_pairs]))
+
+    def test_zero_costs_and_no_pairs(self):
+        self.assertEqual(0, len(sparse_assignment(np.array([], dtype=int), np.array([], dtype=int), np.array([]), 10e8)))
+        matched_pairs = sparse_assignment(np.array([0, 1, 1]), np.array([7, 7, 3]), np.array([0., 0., 5.]), 10e8)
+        self.assertEqual([0, 2], list(matched_pairs))
+
+
+class TestZonalBatchMatching(unittest.TestCase):
+    def setUp(self):
+        """Initiates the test.
+        """
+        roads = generate_manhattan_road(6, 100, extended=False)
+        self.service = OnDemandMobilityService('UBER', 0, matching_strategy='nearest_idle_vehicle_in_radius_batched',
+                                               radius=1000, zonal_batch_matching=True)
+        self.layer = generate_layer_from_roads(roads, 'RIDEHAILING', mobility_services=[self.service])
+        for un, node in self.layer.graph.nodes.items():
+            for dn, link in node.adj.items():
+                link.update_costs({'UBER': {'travel_time': 10., 'length': 100, 'speed': 10}})
+        self.service.gnodes = self.layer.graph.nodes
+        self.nodes = {tuple(node.position): nid for nid, node in self.service.gnodes.items()}
+        # Zones of the columns x <= 200 and 300 <= x <= 400, the column x = 500 is outside all zones
+        self.service.add_zone(LayerZone('Z0', set(), np.array([[-50, -50], [250, -50], [250, 550], [-50, 550]])))
+        self.service.add_zone(LayerZone('Z1', set(), np.array([[250, -50], [450, -50], [450, 550], [250, 550]])))
+
+        self.vehs = [self.service.create_waiting_vehicle(self.nodes[p]) for p in [(300, 0), (0, 500), (500, 100)]]
+        self.users = []
+        for i, p in enumerate([(200, 0), (300, 500), (500, 0)]):
+            user = User(f'U{i}', self.nodes[p], self.nodes[(0, 0)], Time('07:00:00'))
+            user.current_node = self.nodes[p]
+            user.position = np.array(p, dtype=np.float64)
+            user.set_pickup_dt('UBER', Dt(minutes=30))
+            self.users.append(user)
+            self.service.add_request(user, self.nodes[(0, 0)], Time('07:00:00'))
+
+        self.matches = []
+        def matching(req, dt):
+            self.matches.append((req.user.id, self.service._cache_request_vehicles[req.user.id][0].id))
+        self.service.matching = matching
+
+    def tearDown(self):
+        """Concludes and closes the test.
+        """
+        VehicleManager.empty()
+
+    def test_zonal_batch_matching(self):
+        self.service.launch_matching_batch(Dt(seconds=1))
+        # No pair crosses zones, the request and vehicle outside all zones are matched together
+        self.assertEqual([('U0', self.vehs[1].id), ('U1', self.vehs[0].id), ('U2', self.vehs[2].id)], self.matches)
+        self.assertEqual([], list(self.service.user_buffer.keys()))
+
+    def test_batch_matching(self):
+        self.service.zonal_batch_matching = False
+        self.service.launch_matching_batch(Dt(seconds=1))
+        self.assertEqual([('U0', self.vehs[0].id), ('U1', self.vehs[1].id), ('U2', self.vehs[2].id)], self.matches)
@@ -0,0 +1,101 @@
+import unittest
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pandas as pd
+
+from mnms.congestion_model import CongestionModel
+from mnms.time import Time
+
+
+class FakeVehicle:
+    def __init__(self, id, nb_passengers, capacity, node):
+        self.id = id
+        self.passengers = {str(i): None for i in range(nb_passengers)}
+        self.capacity = capacity
+        self.current_node = node
+
+
+class TestCongestionModel(unittest.TestCase):
+    def setUp(self):
+        self.tempfile = TemporaryDirectory()
+        self.pathdir = self.tempfile.name + '/'
+        self.cm = CongestionModel.get_instance()
+        self.cm.clear_data()
+
+    def tearDown(self):
+        self.cm.close_output()
+        self.cm.clear_data()
+        self.tempfile.cleanup()
+
+    def test_ingest_step(self):
+        self.cm.ingest_step(Time('07:00:00'), [FakeVehicle('0', 5, 10, 'A'), FakeVehicle('1', 1, 4, 'B')])
+        self.cm.ingest_step(Time('07:00:01'), [FakeVehicle('0', 10, 10, 'A')])
+        self.cm.update_congestion_model({'TIMESTAMP': ['07:00:02.00'], 'VEHICLE ID': ['2'], 'PASSENGERS': [0],
+                                         'CAPACITY': [2], 'CONGESTION INDEX': [0.], 'NODE': ['B']})
+
+        self.assertEqual(4, len(self.cm))
+        np.testing.assert_array_equal([0.5, 1.], self.cm.node_congestion_indexes('A'))
+        np.testing.assert_array_equal([0.25, 0.], self.cm.node_congestion_indexes('B'))
+        self.assertEqual(0, len(self.cm.node_congestion_indexes('C')))
+
+        df = self.cm.data
+        self.assertEqual(['07:00:00.00', '07:00:00.00', '07:00:01.00', '07:00:02.00'], df['TIMESTAMP'].tolist())
+        self.assertEqual(['0', '1', '0', '2'], df['VEHICLE ID'].tolist())
+        self.assertEqual([5, 1, 10, 0], df['PASSENGERS'].tolist())
+        self.assertEqual(['A', 'B', 'A', 'B'], df['NODE'].tolist())
+
+    def test_predict_congestion(self):
+        self.cm.set_prediction_technique(('temporal_moving_avg', {'window': 2}))
+        self.assertEqual(0, self.cm.predict_congestion('A'))
+        self.cm.ingest_step(Time('07:00:00'), [FakeVehicle('0', 5, 10, 'A')])
+        self.assertTrue(np.isnan(self.cm.predict_congestion('A')))
+        self.cm.ingest_step(Time('07:00:01'), [FakeVehicle('0', 10, 10, 'A')])
+        self.cm.ingest_step(Time('07:00:02'), [FakeVehicle('0', 0, 10, 'A')])
+        self.assertAlmostEqual(0.5, self.cm.predict_congestion('A'))
+        self.cm.set_prediction_technique(('temporal_moving_avg', {'window': 60}))
+
+    def test_predictors_match_history(self):
+        rng = np.random.default_rng(0)
+        for t in range(200):
+            self.cm.ingest_step(Time.from_seconds(7*3600+t),
+                                [FakeVehicle('0', int(rng.integers(0, 11)), 10, 'A'),
+                                 FakeVehicle('1', int(rng.integers(0, 5)), 4, 'B')])
+        history = self.cm.node_congestion_indexes('A')
+
+        self.cm.set_prediction_technique(('temporal_moving_avg', {'window': 60}))
+        self.assertAlmostEqual(pd.Series(history).rolling(window=60).mean().iloc[-1], self.cm.predict_congestion('A'))
+
+        self.cm.set_prediction_technique(('exponential_moving_avg', {'alpha': 0.2}))
+        self.assertAlmostEqual(pd.Series(history).ewm(alpha=0.2, adjust=False).mean().iloc[-1],
+                               self.cm.predict_congestion('A'))
+
+        self.cm.set_prediction_technique(('time_binned_mean', {'bin_size': 100}))
+        self.assertAlmostEqual(history[100:].mean(), self.cm.predict_congestion('A'))
+        self.assertAlmostEqual(history[:100].mean(), self.cm.predict_congestion('A', Time('07:00:50')))
+        self.cm.ingest_step(Time('07:03:20'), [FakeVehicle('0', 0, 10, 'A')])
+        self.assertAlmostEqual(0, self.cm.predict_congestion('A'))
+
+        self.cm.set_prediction_technique(('temporal_moving_avg', {'window': 60}))
+
+    def test_predict_many(self):
+        self.cm.set_prediction_technique(('temporal_moving_avg', {'window': 1}))
+        self.cm.ingest_step(Time('07:00:00'), [FakeVehicle('0', 5, 10, 'A'), FakeVehicle('1', 1, 4, 'B')])
+        np.testing.assert_array_almost_equal([0.25, 0., 0.5, 0.25], self.cm.predict_many(['B', 'C', 'A', 'B']))
+        self.cm.set_prediction_technique(('temporal_moving_avg', {'window': 60}))
+
+    def test_chunked_output(self):
+        self.cm.open_output(self.pathdir + 'congestion_file.csv', chunk_size=2)
+        self.cm.ingest_step(Time('07:00:00'), [FakeVehicle('0', 5, 10, 'A')])
+        self.cm.ingest_step(Time('07:00:01'), [FakeVehicle('0', 10, 10, 'A'), FakeVehicle('1', 1, 4, 'B')])
+        self.cm.ingest_step(Time('07:00:02'), [FakeVehicle('1', 2, 4, 'B')])
+        self.cm.close_output()
+
+        df = pd.read_csv(self.pathdir + 'congestion_file.csv')
+        self.assertEqual(['TIMESTAMP', 'VEHICLE ID', 'PASSENGERS', 'CAPACITY', 'CONGESTION INDEX', 'NODE'], df.columns.tolist())
+        self.assertEqual([0.5, 1., 0.25, 0.5], df['CONGESTION INDEX'].tolist())
+        self.assertEqual('07:00:02.00', df['TIMESTAMP'].iloc[-1])
+
+        self.cm.write_congestion(self.tempfile.name)
+        df = pd.read_csv(self.pathdir + 'congestion_history.csv', index_col=0)
+        self.assertEqual(4, len(df))
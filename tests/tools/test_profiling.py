@@ -0,0 +1,54 @@
+import json
+import unittest
+from tempfile import TemporaryDirectory
+
+import pandas as pd
+
+from mnms.tools.profiling import TimingRegistry
+
+
+class TestTimingRegistry(unittest.TestCase):
+    def setUp(self):
+        self.tempfile = TemporaryDirectory()
+        self.pathdir = self.tempfile.name + '/'
+
+    def tearDown(self):
+        self.tempfile.cleanup()
+
+    def test_disabled(self):
+        timings = TimingRegistry()
+        timings.record('planning', 1.2, 10)
+        self.assertEqual([], timings.records())
+
+    def test_records_and_summary(self):
+        timings = TimingRegistry(enabled=True)
+        timings.record('planning', 1., 10)
+        timings.record('planning', 2., 5)
+        timings.record('matching', 0.5, 3, component='RH')
+        timings.set_affectation_step(1)
+        timings.record('planning', 4., 1)
+
+        records = timings.records(phase='planning')
+        self.assertEqual(2, len(records))
+        self.assertEqual({'AFFECTATION_STEP': 0, 'PHASE': 'planning', 'COMPONENT': None,
+                          'WALL_TIME': 3., 'CALLS': 2, 'ITEMS': 15}, records[0])
+        self.assertEqual(1, len(timings.records(component='RH')))
+
+        summary = timings.summary()
+        self.assertEqual({'WALL_TIME': 7., 'CALLS': 3, 'ITEMS': 16}, summary[('planning', None)])
+        self.assertEqual({'WALL_TIME': 0.5, 'CALLS': 1, 'ITEMS': 3}, summary[('matching', 'RH')])
+
+    def test_write(self):
+        timings = TimingRegistry(enabled=True)
+        timings.record('planning', 1., 10)
+        timings.record('matching', 0.5, 3, component='RH')
+
+        timings.write(self.pathdir + 'timings.csv')
+        df = pd.read_csv(self.pathdir + 'timings.csv', sep=';')
+        self.assertEqual(['planning', 'matching'], df['PHASE'].tolist())
+        self.assertEqual([10, 3], df['ITEMS'].tolist())
+
+        timings.write(self.pathdir + 'timings.json')
+        with open(self.pathdir + 'timings.json') as f:
+            data = json.load(f)
+        self.assertEqual(timings.records(), data)
@@ -1,7 +1,7 @@
 import unittest
 from decimal import Decimal
 
-from mnms.time import Time, Dt
+from mnms.time import Time, Dt, TimeTable
 
 
 class TestTime(unittest.TestCase):
@@ -68,4 +68,63 @@ class TestDt(unittest.TestCase):
         dt = Dt(12, 35, 13.45)*2
         self.assertEqual(25, dt._hours)
         self.assertEqual(10, dt._minutes)
-        self.assertAlmostEqual(Decimal(13.45*2), dt._seconds)
\ No newline at end of file
+        self.assertAlmostEqual(Decimal(13.45*2), dt._seconds)
+
+    def test_dt_ticks(self):
+        dt = Dt(minutes=1, seconds=0.5)
+        self.assertEqual(60.5, dt.to_seconds())
+        self.assertEqual(Dt(seconds=60.5), dt)
+        self.assertEqual(Dt(seconds=121), dt*2)
+        self.assertEqual(Dt(seconds=0.5), dt-Dt(minutes=1))
+
+
+class TestTimeTicks(unittest.TestCase):
+    def test_add_remove_time(self):
+        t = Time("07:59:59.50")
+        t2 = t.add_time(Dt(seconds=0.75))
+        self.assertEqual("08:00:00.25", t2.time)
+        self.assertEqual(t, t2.remove_time(Dt(seconds=0.75)))
+        self.assertEqual(Dt(seconds=0.75), t2 - t)
+
+    def test_time_string_cache(self):
+        t = Time.from_seconds(12345.678)
+        self.assertEqual("03:25:45.68", t.time)
+        t.minutes = 0
+        self.assertEqual("03:00:45.68", t.time)
+        self.assertEqual("03:00:45.68", t.copy().time)
+
+    def test_hashable(self):
+        self.assertEqual(1, len({Time("07:00:00"), Time.from_seconds(7*3600)}))
+
+
+class TestTimeTable(unittest.TestCase):
+    def test_create_table_freq(self):
+        table = TimeTable.create_table_freq('07:00:00', '08:00:00', Dt(minutes=10))
+        self.assertEqual(7, len(table))
+        self.assertEqual(Time('07:00:00'), table.table[0])
+        self.assertEqual(Time('08:00:00'), table.table[-1])
+
+        table = TimeTable.create_table_freq('07:00:00', '07:55:00', Dt(minutes=10))
+        self.assertEqual(Time('07:50:00'), table.table[-1])
+
+    def test_next_departure(self):
+        table = TimeTable.convert_table_freq(['07:10:00', '07:00:00', '07:30:00'])
+        self.assertEqual(Time('07:00:00'), table.get_next_departure(Time('06:00:00')))
+        self.assertEqual(Time('07:10:00'), table.get_next_departure(Time('07:00:00')))
+        self.assertEqual(Time('07:30:00'), table.get_next_departure(Time('07:20:00')))
+        self.assertIsNone(table.get_next_departure(Time('07:30:00')))
+
+    def test_freq(self):
+        table = TimeTable.convert_table_freq(['07:00:00', '07:10:00', '07:30:00'])
+        self.assertAlmostEqual(900, table.get_freq())
+        self.assertAlmostEqual(600, table.get_freq(Time('06:00:00')))
+        self.assertAlmostEqual(600, table.get_freq(Time('07:05:00')))
+        self.assertAlmostEqual(1200, table.get_freq(Time('07:10:00')))
+        self.assertAlmostEqual(1200, table.get_freq(Time('09:00:00')))
+        self.assertEqual(24*60*60, TimeTable([Time('07:00:00')]).get_freq())
+
+    def test_dump_load(self):
+        table = TimeTable.create_table_freq('07:00:00', '08:00:00', Dt(minutes=10))
+        table = TimeTable.__load__(table.__dump__()) + TimeTable.convert_table_freq(['07:05:00'])
+        self.assertEqual(8, len(table))
+        self.assertEqual(Time('07:05:00'), table.table[1])
@@ -0,0 +1,99 @@
+import unittest
+import tempfile
+import pathlib
+
+import numpy as np
+
+from mnms.travel_decision.behavior_index import DictBehaviorIndexStore, SQLiteBehaviorIndexStore, \
+    RedisBehaviorIndexStore, BehaviorIndexCache
+from mnms.travel_decision.behavior_and_congestion_decision_model import BehaviorCongestionDecisionModel
+
+
+class FakeRedisClient:
+    def __init__(self, data):
+        self.data = data
+        self.nb_round_trips = 0
+
+    def hmget(self, name, keys):
+        self.nb_round_trips += 1
+        return [self.data.get(name, {}).get(k) for k in keys]
+
+    def pipeline(self, transaction=True):
+        return FakeRedisPipeline(self)
+
+
+class FakeRedisPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def hmget(self, name, keys):
+        self.commands.append((name, keys))
+
+    def execute(self):
+        self.client.nb_round_trips += 1
+        return [[self.client.data.get(name, {}).get(k) for k in keys] for name, keys in self.commands]
+
+
+class TestBehaviorIndex(unittest.TestCase):
+    def setUp(self):
+        """Initiates the test.
+        """
+        self.temp_dir_results = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        self.dir_results = pathlib.Path(self.temp_dir_results.name)
+        self.data = {'U0': {'TRAM_T1_0-07:00': '0.5', 'BUS_B2_3-07:10': '2'},
+                     'U1': {'TRAM_T1_0-07:00': '1.5'}}
+
+    def tearDown(self):
+        """Concludes and closes the test.
+        """
+        self.temp_dir_results.cleanup()
+
+    def check_store(self, store):
+        self.assertEqual([0.5, None, 2.], [None if v is None else float(v) for v in
+                                              store.get_many('U0', ['TRAM_T1_0-07:00', 'TRAM_T1_0-07:10', 'BUS_B2_3-07:10'])])
+        results = store.get_many_users({'U0': ['BUS_B2_3-07:10'], 'U1': ['TRAM_T1_0-07:00'], 'U2': ['TRAM_T1_0-07:00']})
+        self.assertEqual(2., float(results['U0'][0]))
+        self.assertEqual(1.5, float(results['U1'][0]))
+        self.assertEqual([None], results['U2'])
+
+    def test_stores(self):
+        self.check_store(DictBehaviorIndexStore(self.data))
+        self.check_store(RedisBehaviorIndexStore(client=FakeRedisClient(self.data)))
+
+        store = SQLiteBehaviorIndexStore(str(self.dir_results.joinpath('bi.db')))
+        store.set_many((user, field, float(value)) for user, fields in self.data.items() for field, value in fields.items())
+        store.close()
+        store = SQLiteBehaviorIndexStore(str(self.dir_results.joinpath('bi.db')))
+        self.check_store(store)
+        store.close()
+
+    def test_cache(self):
+        client = FakeRedisClient(self.data)
+        cache = BehaviorIndexCache(RedisBehaviorIndexStore(client=client), max_size=2)
+        cache.prefetch([('U0', 'TRAM_T1_0', '07:00'), ('U0', 'BUS_B2_3', '07:10'), ('U1', 'TRAM_T1_0', '07:00'),
+                        ('U0', 'TRAM_T1_0', '07:00')])
+        self.assertEqual(1, client.nb_round_trips)
+        # Least recently used entry (U0, 07:00) has been evicted
+        self.assertEqual(2, len(cache))
+
+        self.assertEqual(2., cache.get('U0', 'BUS_B2_3', '07:10'))
+        self.assertEqual(1.5, cache.get('U1', 'TRAM_T1_0', '07:00'))
+        self.assertEqual(1, client.nb_round_trips)
+        self.assertEqual(0.5, cache.get('U0', 'TRAM_T1_0', '07:00'))
+        self.assertEqual(0., cache.get('U0', 'METRO_A_1', '07:00'))
+        self.assertEqual(3, client.nb_round_trips)
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(2, cache.misses)
+
+        cache.prefetch([('U0', 'METRO_A_1', '07:00'), ('U0', 'TRAM_T1_0', '07:00')])
+        self.assertEqual(3, client.nb_round_trips)
+
+    def test_rank_paths(self):
+        criteria = {'CI': ([0.2, 0.1, 0.3], False), 'BI': ([0., 1., 0.5], True), 'C': ([100, 50, 80], False)}
+        scores = BehaviorCongestionDecisionModel.rank_paths(criteria, 3)
+        np.testing.assert_array_equal([2+1+1, 3+3+3, 1+2+2], scores)
+
+        # The best paths have the lowest scores
+        np.testing.assert_array_equal([0, 2], BehaviorCongestionDecisionModel.top_ranked_paths(scores, 2))
+        np.testing.assert_array_equal([1, 2], BehaviorCongestionDecisionModel.top_ranked_paths(np.array([5., 4., 4.]), 2))
@@ -13,6 +13,7 @@ from mnms.mobility_service.public_transport import PublicTransportMobilityServic
 from mnms.time import Time, Dt, TimeTable
 from mnms.tools.observer import CSVUserObserver
 from mnms.travel_decision.dummy import DummyDecisionModel
+from mnms.travel_decision.abstract import Event
 from mnms.flow.MFD import MFDFlowMotor, Reservoir
 from mnms.simulation import Supervisor
 from mnms.vehicles.manager import VehicleManager
@@ -204,3 +205,17 @@ class TestMobilityServicesGraph(unittest.TestCase):
             self.assertEqual(set(dfp_mf_u_1stmf['SERVICES'].tolist()), {'WALK CAR WALK', 'WALK BUS WALK', 'RIDEHAILING1 WALK'})
             self.assertEqual(len(dfp_mf_u_2ndmf), 2)
             self.assertEqual(set(dfp_mf_u_2ndmf['SERVICES'].tolist()), {'WALK CAR WALK', 'WALK BUS WALK'})
+
+    def test_users_for_planning(self):
+        """Check that a user is planned once, for the first event which triggered her (re)planning.
+        """
+        supervisor = self.create_supervisor(self.dir_results, False)
+        decision_model = supervisor._decision_model
+        users = [User(f'U{i}', [0, 0], [0, 5000], Time('07:00:00')) for i in range(3)]
+
+        decision_model.add_users_for_planning(users[:2], [Event.DEPARTURE]*2)
+        decision_model.add_users_for_planning([users[2], users[0]], [Event.MATCH_FAILURE, Event.INTERRUPTION])
+
+        self.assertEqual(['U0', 'U1', 'U2'], list(decision_model._users_for_planning))
+        self.assertEqual([(users[0], Event.DEPARTURE), (users[1], Event.DEPARTURE), (users[2], Event.MATCH_FAILURE)],
+                         list(decision_model._users_for_planning.values()))
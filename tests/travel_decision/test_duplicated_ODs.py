@@ -155,3 +155,68 @@ class TestDuplicatedODs(unittest.TestCase):
                                 [{'RH'}]*len(origins))
         awaited_paths = [(['RH_0', 'RH_1', 'RH_2', 'RH_4'], 947.2136)]*5 + [(['RH_1', 'RH_2', 'RH_4'], 547.2136)]*5
         self.assertEqual(awaited_paths, paths)
+
+    def test_deduplicated_shortest_path_queries(self):
+        """Check that the identical shortest path queries of the decision model are computed
+        once and that each query gets its own result.
+        """
+        origins = ['ORIGIN_0', 'ORIGIN_0', 'ORIGIN_1', 'ORIGIN_0', 'ORIGIN_1', 'ORIGIN_0']
+        destinations = ['DESTINATION_4']*6
+        chosen_mservices = [{'CAR': 'PV', 'TRANSIT': 'WALK'}, {'TRANSIT': 'WALK', 'CAR': 'PV'}, {'RH': 'UBER', 'TRANSIT': 'WALK'},
+            {'RH': 'UBER', 'TRANSIT': 'WALK'}, {'RH': 'UBER', 'TRANSIT': 'WALK'}, {'CAR': 'PV', 'TRANSIT': 'WALK'}]
+        available_layers = [{'CAR', 'TRANSIT'}, {'TRANSIT', 'CAR'}, {'RH', 'TRANSIT'}, {'RH', 'TRANSIT'}, {'RH', 'TRANSIT'}, {'CAR', 'TRANSIT'}]
+        nb_paths = [2, 2, 1, 2, 1, 1]
+        decision_model = DummyDecisionModel(self.mlgraph)
+
+        u_origins, u_destinations, u_available_layers, u_chosen_mservices, u_nb_paths, query_indices = \
+            decision_model.deduplicate_shortest_path_inputs(origins, destinations, available_layers, chosen_mservices, nb_paths)
+        self.assertEqual(['ORIGIN_0', 'ORIGIN_1', 'ORIGIN_0', 'ORIGIN_0'], u_origins)
+        self.assertEqual([2, 1, 2, 1], u_nb_paths)
+        self.assertEqual([0, 0, 1, 2, 1, 3], query_indices)
+
+        paths = decision_model.compute_shortest_paths(origins, destinations, available_layers, chosen_mservices, nb_paths)
+        awaited_paths = parallel_k_shortest_path(self.mlgraph.graph,
+                                                 origins,
+                                                 destinations,
+                                                 decision_model._cost,
+                                                 chosen_mservices,
+                                                 available_layers,
+                                                 decision_model._max_diff_cost,
+                                                 decision_model._max_dist_in_common,
+                                                 decision_model._cost_multiplier_to_find_k_paths,
+                                                 decision_model._max_retry_to_find_k_paths,
+                                                 nb_paths,
+                                                 decision_model._thread_number)
+        self.assertEqual(awaited_paths, paths)
+        self.assertIsNot(paths[0][0][0], paths[1][0][0])
+        self.assertEqual(6, decision_model._nb_shortest_path_queries)
+        self.assertEqual(2, decision_model._nb_deduplicated_shortest_path_queries)
+
+    def test_planning_estimates_memoized(self):
+        """Check that the pickup times estimated by a mobility service are computed once per
+        (service, pickup node) during a (re)planning round.
+        """
+        decision_model = DummyDecisionModel(self.mlgraph)
+        uber = self.mlgraph.layers['RH'].mobility_services['UBER']
+        estimates = []
+        estimate_pickup_time_for_planning = uber.estimate_pickup_time_for_planning
+        def counting_estimate(pu_node):
+            estimates.append(pu_node)
+            return estimate_pickup_time_for_planning(pu_node)
+        uber.estimate_pickup_time_for_planning = counting_estimate
+        gnodes = self.mlgraph.graph.nodes
+        mss = {'RH': 'UBER', 'TRANSIT': 'WALK'}
+        nodes = [['ORIGIN_1', 'RH_1', 'RH_2', 'RH_4', 'DESTINATION_4'], ['ORIGIN_1', 'RH_1', 'RH_3', 'RH_4', 'DESTINATION_4']]
+
+        decision_model._planning_estimates = dict()
+        paths = [Path(0, n) for n in nodes*2]
+        for p in paths:
+            decision_model.treat_path(p, mss, None, gnodes)
+        self.assertEqual(['RH_1'], estimates)
+        self.assertEqual([uber.estimate_pickup_time_for_planning('RH_1')]*4, [p.path_cost for p in paths])
+
+        # Out of a round, the estimates are always computed
+        decision_model._planning_estimates = None
+        decision_model.treat_path(Path(0, nodes[0]), mss, None, gnodes)
+        decision_model.treat_path(Path(0, nodes[0]), mss, None, gnodes)
+        self.assertEqual(['RH_1']*4, estimates)
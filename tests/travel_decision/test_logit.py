@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+
+from mnms.demand.user import Path
+from mnms.generation.roads import generate_line_road
+from mnms.generation.layers import generate_layer_from_roads, generate_matching_origin_destination_layer
+from mnms.graph.layers import MultiLayerGraph
+from mnms.mobility_service.personal_vehicle import PersonalMobilityService
+from mnms.travel_decision.logit import LogitDecisionModel, batch_logit_choice
+from mnms.vehicles.manager import VehicleManager
+
+
+class TestLogit(unittest.TestCase):
+    def setUp(self):
+        """Initiates the test.
+        """
+        roads = generate_line_road([0, 0], [0, 1000], 2)
+        car_layer = generate_layer_from_roads(roads, 'CAR', mobility_services=[PersonalMobilityService('PV')])
+        self.mlgraph = MultiLayerGraph([car_layer], generate_matching_origin_destination_layer(roads), 1)
+
+    def tearDown(self):
+        """Concludes and closes the test.
+        """
+        VehicleManager.empty()
+
+    def test_batch_logit_choice_probabilities(self):
+        theta = 0.01
+        costs = [[100, 200, 150], [50], [0, 100]]
+        nb_draws = 20000
+        rng = np.random.default_rng(0)
+        choices = np.array([batch_logit_choice(costs, theta, rng) for _ in range(nb_draws)])
+
+        for i, chooser_costs in enumerate(costs):
+            utilities = np.exp(-theta * np.array(chooser_costs))
+            probas = utilities / utilities.sum()
+            frequencies = np.bincount(choices[:, i], minlength=len(chooser_costs)) / nb_draws
+            np.testing.assert_allclose(probas, frequencies, atol=0.02)
+
+    def test_batch_logit_choice_large_costs(self):
+        # Costs which make all the exponentials underflow still lead to a proper choice
+        choices = batch_logit_choice([[1e6, 1e6 + 1e4], [2e6]], 0.01, np.random.default_rng(0))
+        self.assertEqual([0, 0], choices.tolist())
+
+    def test_batch_path_choice(self):
+        decision_model = LogitDecisionModel(self.mlgraph, batch_choice=True)
+        users_paths = {f'U{i}': {'user': None, 'event': None,
+                                 'paths': [Path(100 * j, ['CAR_0', 'CAR_1']) for j in range(i + 1)]} for i in range(4)}
+        users_paths['U4'] = {'user': None, 'event': None, 'paths': []}
+
+        decision_model.set_random_seed(42)
+        chosen_paths = decision_model.batch_path_choice(users_paths)
+        self.assertEqual({'U0', 'U1', 'U2', 'U3'}, set(chosen_paths))
+        for uid, p in chosen_paths.items():
+            self.assertIn(p, users_paths[uid]['paths'])
+
+        # The choices are reproducible with the same seed
+        decision_model.set_random_seed(42)
+        self.assertEqual(chosen_paths, decision_model.batch_path_choice(users_paths))
+
+        decision_model.batch_choice = False
+        self.assertIsNone(decision_model.batch_path_choice(users_paths))
@@ -0,0 +1,124 @@
+import unittest
+import tempfile
+import pathlib
+
+import numpy as np
+
+from mnms.generation.roads import RoadDescriptor
+from mnms.generation.layers import generate_layer_from_roads, generate_matching_origin_destination_layer
+from mnms.graph.layers import MultiLayerGraph
+from mnms.mobility_service.personal_vehicle import PersonalMobilityService
+from mnms.demand.user import User
+from mnms.time import Time
+from mnms.travel_decision.dummy import DummyDecisionModel
+from mnms.travel_decision.route_cache import RouteCache
+from mnms.vehicles.manager import VehicleManager
+
+
+class TestRouteCache(unittest.TestCase):
+    def setUp(self):
+        """Initiates the test.
+        """
+        self.temp_dir_results = tempfile.TemporaryDirectory()
+        self.dir_results = pathlib.Path(self.temp_dir_results.name)
+
+        self.routes = [['O', 'A', 'B', 'D'], ['O', 'C', 'D'], ['O', 'A', 'C', 'D']]
+        self.link_costs = {('O', 'A'): 1, ('A', 'B'): 2, ('B', 'D'): 3, ('O', 'C'): 4, ('C', 'D'): 1.5, ('A', 'C'): 0.5}
+
+    def tearDown(self):
+        """Concludes and closes the test.
+        """
+        self.temp_dir_results.cleanup()
+        VehicleManager.empty()
+
+    def test_add_get(self):
+        cache = RouteCache()
+        for r in self.routes:
+            cache.add(r, 'CAR:PV')
+        cache.add(self.routes[0], 'CAR:PV')
+        cache.add(['O', 'C', 'D'], 'RH:UBER')
+
+        self.assertEqual(2, len(cache))
+        routes = cache.get('O', 'D', 'CAR:PV', 3)
+        self.assertEqual(self.routes, [cache.nodes(r) for r in routes])
+        self.assertIsNone(cache.get('O', 'D', 'CAR:PV', 4))
+        self.assertIsNone(cache.get('O', 'B', 'CAR:PV'))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(2, cache.misses)
+
+    def test_rescore(self):
+        cache = RouteCache()
+        for r in self.routes:
+            cache.add(r, 'CAR:PV')
+        nb_calls = []
+        def link_cost(un, dn):
+            nb_calls.append((un, dn))
+            return self.link_costs[(un, dn)]
+
+        costs = cache.rescore(cache.get('O', 'D', 'CAR:PV'), link_cost)
+        np.testing.assert_allclose([6, 5.5, 3], costs)
+        # Shared links are costed once
+        self.assertEqual(len(self.link_costs), len(nb_calls))
+
+    def test_lru_eviction(self):
+        cache = RouteCache(max_size=2)
+        cache.add(['O', 'D'], 'CAR:PV')
+        cache.add(['O', 'E'], 'CAR:PV')
+        cache.get('O', 'D', 'CAR:PV')
+        cache.add(['O', 'F'], 'CAR:PV')
+
+        self.assertEqual(2, len(cache))
+        self.assertIn(('O', 'D', 'CAR:PV'), cache)
+        self.assertNotIn(('O', 'E', 'CAR:PV'), cache)
+        self.assertIn(('O', 'F', 'CAR:PV'), cache)
+
+    def test_save_load(self):
+        cache = RouteCache()
+        for r in self.routes:
+            cache.add(r, 'CAR:PV')
+        cache.add(['O', 'C', 'D'], 'RH:UBER')
+        cache.save(self.dir_results / 'routes.json')
+
+        loaded = RouteCache.load(self.dir_results / 'routes.json')
+        self.assertEqual(2, len(loaded))
+        self.assertEqual(self.routes, [loaded.nodes(r) for r in loaded.get('O', 'D', 'CAR:PV', 3)])
+        self.assertEqual([['O', 'C', 'D']], [loaded.nodes(r) for r in loaded.get('O', 'D', 'RH:UBER')])
+
+        # The least recently used entries are dropped when loading into a smaller cache
+        loaded = RouteCache.load(self.dir_results / 'routes.json', max_size=1)
+        self.assertEqual(1, len(loaded))
+        self.assertIn(('O', 'D', 'RH:UBER'), loaded)
+
+    def test_reapply_saved_routes(self):
+        roads = RoadDescriptor()
+        roads.register_node('0', [0, 0])
+        roads.register_node('1', [400, 0])
+        roads.register_node('2', [400, -200])
+        roads.register_section('0_1', '0', '1', 400)
+        roads.register_section('1_2', '1', '2', 200)
+        roads.register_section('0_2', '0', '2', 700)
+        car_layer = generate_layer_from_roads(roads, 'CAR', mobility_services=[PersonalMobilityService('PV')])
+        mlgraph = MultiLayerGraph([car_layer], generate_matching_origin_destination_layer(roads), 1)
+        decision_model = DummyDecisionModel(mlgraph, cost='length', save_routes_dynamically_and_reapply=True,
+                                            route_cache_file=self.dir_results / 'routes.json')
+        mss = {'CAR': 'PV', 'TRANSIT': 'WALK'}
+        mss_str = decision_model.cast_chosen_mservice_intermodality_to_str(mss, None)
+        decision_model.route_cache.add(['ORIGIN_0', 'CAR_0', 'CAR_2', 'DESTINATION_2'], mss_str)
+        decision_model.route_cache.add(['ORIGIN_0', 'CAR_0', 'CAR_1', 'CAR_2', 'DESTINATION_2'], mss_str)
+        decision_model.save_route_cache()
+
+        # A new decision model starts with the saved routes
+        decision_model = DummyDecisionModel(mlgraph, cost='length', save_routes_dynamically_and_reapply=True,
+                                            route_cache_file=self.dir_results / 'routes.json')
+        decision_model.add_waiting_cost_function('length', lambda wt: 0)
+        user = User('U0', 'ORIGIN_0', 'DESTINATION_2', Time('07:00:00'))
+        users_paths = {'U0': {'user': user, 'event': None, 'paths': []}}
+        uids, origins, destinations, available_layers, chosen_mservices, nb_paths, users_paths = \
+            decision_model.reapply_saved_routes(['U0', 'U0'], ['ORIGIN_0', 'ORIGIN_1'], ['DESTINATION_2', 'DESTINATION_2'],
+                [{'CAR', 'TRANSIT'}]*2, [mss]*2, [1, 1], users_paths)
+
+        self.assertEqual(['ORIGIN_1'], origins)
+        self.assertEqual(1, len(users_paths['U0']['paths']))
+        path = users_paths['U0']['paths'][0]
+        self.assertEqual(['ORIGIN_0', 'CAR_0', 'CAR_1', 'CAR_2', 'DESTINATION_2'], path.nodes)
+        self.assertAlmostEqual(600, path.path_cost)